@@ -31,20 +31,44 @@ import os
 import sys
 import traceback
 
+from multiprocessing.pool import ThreadPool
+
 def rd_debug(s):
     if "ROSDEP_DEBUG" in os.environ:
         print(s)
 
-def print_bold(msg):
+def print_bold(msg, file=None):
     """
     print message printed to screen with bold decoration for greater clarity
     :param msg: message to print, ``str``
+    :param file: file to print to instead of ``sys.stdout``
     """
     if sys.platform in ['win32']:
-        print('%s'%msg)  #windows console is terrifically boring 
+        print('%s'%msg, file=file)  #windows console is terrifically boring 
     else:
-        print('\033[1m%s\033[0m'%msg)
+        print('\033[1m%s\033[0m'%msg, file=file)
     
+def parallel_map(fn, items, jobs=1):
+    """
+    Apply *fn* to each of *items* using a pool of at most *jobs*
+    worker threads.  This is meant for I/O-bound work like downloads
+    and subprocess calls.
+
+    :param jobs: maximum number of concurrent calls to *fn*.  If
+      ``1``, *fn* is called serially in the current thread.
+    :returns: list of results, in the same order as *items*
+    """
+    items = list(items)
+    jobs = min(jobs, len(items))
+    if jobs <= 1:
+        return [fn(x) for x in items]
+    pool = ThreadPool(jobs)
+    try:
+        return pool.map(fn, items)
+    finally:
+        pool.close()
+        pool.join()
+
 class InvalidData(Exception):
     """
     Data is not in valid rosdep format.
@@ -29,6 +29,10 @@
 
 from collections import defaultdict
 
+# traversal state of a rosdep key, see DependencyGraph._visit()
+_VISITING = 1
+_DONE = 2
+
 class Resolution(dict):
     """A default dictionary for use in the :class:`DependencyGraph`."""
     def __init__(self):
@@ -64,17 +68,54 @@ class DependencyGraph(defaultdict):
     
     def detect_cycles(self, rosdep_key, traveled_keys):
         """
-        Recursive function to detect cycles in the dependency graph.
+        Detect cycles in the dependency graph reachable from *rosdep_key*.
 
         :param rosdep_key: This is the rosdep key to use as the root in the cycle exploration.
         :param traveled_keys: A list of rosdep_keys that have been traversed thus far.
 
         :raises: :exc:`AssertionError` if the rosdep_key is in the traveled keys, indicating a cycle has occurred.
         """
-        assert rosdep_key not in traveled_keys, "A cycle in the dependency graph occurred with key `%s`."%rosdep_key
-        traveled_keys.append(rosdep_key)
-        for dependency in self[rosdep_key]['dependencies']:
-            self.detect_cycles(dependency, traveled_keys)
+        state = dict([(key, _VISITING) for key in traveled_keys])
+        self._visit(rosdep_key, state, traveled_keys)
+
+    def _visit(self, rosdep_key, state, path=None, finished=None):
+        """
+        Iterative depth-first traversal of the dependencies of
+        *rosdep_key*.  Each key is traversed at most once per *state*.
+
+        :param state: ``{rosdep_key: _VISITING or _DONE}`` of keys
+          traversed so far, updated in place
+        :param path: keys leading to *rosdep_key*, for error messages
+        :param finished: list to append keys to in post-order, i.e.
+          each key after all of its dependencies
+
+        :raises: :exc:`AssertionError` if a cycle is detected.
+        """
+        if rosdep_key in state:
+            if state[rosdep_key] == _VISITING:
+                self._raise_cycle(list(path or []), rosdep_key)
+            return
+        state[rosdep_key] = _VISITING
+        stack = [(rosdep_key, iter(self[rosdep_key]['dependencies']))]
+        while stack:
+            key, dependencies = stack[-1]
+            for dependency in dependencies:
+                dependency_state = state.get(dependency)
+                if dependency_state is None:
+                    state[dependency] = _VISITING
+                    stack.append((dependency, iter(self[dependency]['dependencies'])))
+                    break
+                elif dependency_state == _VISITING:
+                    self._raise_cycle(list(path or []) + [k for k, _ in stack], dependency)
+            else:
+                stack.pop()
+                state[key] = _DONE
+                if finished is not None:
+                    finished.append(key)
+
+    def _raise_cycle(self, path, rosdep_key):
+        cycle = path[path.index(rosdep_key):] + [rosdep_key]
+        raise AssertionError("A cycle in the dependency graph occurred with key `%s`: %s"%(rosdep_key, ' -> '.join(cycle)))
 
     def validate(self):
         """
@@ -91,8 +132,9 @@ class DependencyGraph(defaultdict):
                     raise KeyError("Invalid Graph Structure: rosdep key `%s` does not exist in the dictionary of resolutions."%dependency)
                 self[dependency]['is_root'] = False
         # Check each entry for cyclical dependencies
-        for rosdep_key in self:
-            self.detect_cycles(rosdep_key, [])
+        state = {}
+        for rosdep_key in list(self.keys()):
+            self._visit(rosdep_key, state)
 
     def get_ordered_dependency_list(self):
         """
@@ -102,34 +144,88 @@ class DependencyGraph(defaultdict):
          that denotes which installed the accompanying *install_keys* are for.  *installer_key* are something 
          like ``apt`` or ``homebrew``.  *install_keys* are something like ``boost`` or ``ros-fuerte-ros_comm``.
 
+        :raises: :exc:`AssertionError` if a cycle is detected.
+        :raises: :exc:`KeyError` if an invalid rosdep_key is found in the dependency graph.
+        """
+        return [(installer_key, install_keys) for installer_key, install_keys, _ in self.get_ordered_dependency_groups()]
+
+    def get_ordered_dependency_groups(self):
+        """
+        Like :meth:`get_ordered_dependency_list`, but also reports which
+        of the earlier entries of the list each entry depends on, so
+        that independent entries can be installed at the same time.
+
+        :returns: *[(installer_key, [install_keys], [dependencies])]*, ``[(str, [str], [int])]``.
+         *dependencies* are the indices of the entries that have to be
+         installed before this one, all lower than its own index.
+
         :raises: :exc:`AssertionError` if a cycle is detected.
         :raises: :exc:`KeyError` if an invalid rosdep_key is found in the dependency graph.
         """
         # Validate the graph
         self.validate()
-        # Generate the dependency list
-        dep_list = []
-        for rosdep_key in self:
+        # Generate the dependency list: dependencies before dependents,
+        # starting from each root
+        ordered_keys = []
+        state = {}
+        for rosdep_key in list(self.keys()):
             if self[rosdep_key]['is_root']:
-                dep_list.extend(self.__get_ordered_uninstalled(rosdep_key))
-        # Make the list unique and remove empty entries
-        result = []
-        for item in dep_list:
-            if item not in result and item[1] != []:
-                result.append(item)
-        # Squash the results by installer_key
+                self._visit(rosdep_key, state, finished=ordered_keys)
+        # Make the list unique and remove empty entries, squashing the
+        # results by installer_key.  Track the entry of each key.
         squashed_result = []
-        previous_installer_key = None
-        for installer_key, resolved in result:
-            if previous_installer_key != installer_key:
-                squashed_result.append((installer_key, []))
-                previous_installer_key = installer_key
-            squashed_result[-1][1].extend(resolved)
-        return squashed_result
-
-    def __get_ordered_uninstalled(self, key):
-        uninstalled = []
-        for dependency in self[key]['dependencies']:
-            uninstalled.extend(self.__get_ordered_uninstalled(dependency))
-        uninstalled.append((self[key]['installer_key'], self[key]['install_keys']))
-        return uninstalled
+        entries = {} # {rosdep_key: index or None}
+        seen = ({}, [])
+        for rosdep_key in ordered_keys:
+            installer_key, install_keys = self[rosdep_key]['installer_key'], self[rosdep_key]['install_keys']
+            entries[rosdep_key] = None
+            if install_keys == []:
+                continue
+            marker = (installer_key, tuple(install_keys))
+            index = self._find_entry(seen, marker)
+            if index is not None:
+                entries[rosdep_key] = index
+                continue
+            if not squashed_result or squashed_result[-1][0] != installer_key:
+                squashed_result.append((installer_key, [], set()))
+            squashed_result[-1][1].extend(install_keys)
+            entries[rosdep_key] = len(squashed_result) - 1
+            self._add_entry(seen, marker, entries[rosdep_key])
+        # Entries each key has to wait for, passing through keys
+        # without an entry of their own
+        waits = {}
+        for rosdep_key in ordered_keys:
+            key_waits = set()
+            for dependency in self[rosdep_key]['dependencies']:
+                if entries[dependency] is not None:
+                    key_waits.add(entries[dependency])
+                key_waits.update(waits[dependency])
+            waits[rosdep_key] = key_waits
+            index = entries[rosdep_key]
+            if index is not None:
+                # duplicates were installed earlier, keep the order of
+                # the list
+                squashed_result[index][2].update([i for i in key_waits if i < index])
+        return [(installer_key, install_keys, sorted(dependencies))
+                for installer_key, install_keys, dependencies in squashed_result]
+
+    def _find_entry(self, seen, marker):
+        """
+        :param seen: ``({marker: index}, [(marker, index)])`` of
+          hashable and unhashable markers, see :meth:`_add_entry`
+        :returns: index of the entry including *marker*, or ``None``
+        """
+        try:
+            return seen[0].get(marker)
+        except TypeError:
+            # unhashable resolutions
+            for other, index in seen[1]:
+                if other == marker:
+                    return index
+            return None
+
+    def _add_entry(self, seen, marker, index):
+        try:
+            seen[0][marker] = index
+        except TypeError:
+            seen[1].append((marker, index))
@@ -1,11 +1,11 @@
 import urllib2
-import yaml
 import urlparse
 
 from rospkg.os_detect import OS_UBUNTU
 from rospkg.os_detect import OS_OSX
 
 from .core import InvalidData, DownloadFailure
+from . import yaml_utils
 from .platforms.debian import APT_INSTALLER
 from .platforms.osx import BREW_INSTALLER
 from .rep3 import download_targets_data
@@ -135,7 +135,7 @@ def download_gbpdistro_as_rosdep_data(gbpdistro_url, targets_url=None):
         f = urllib2.urlopen(gbpdistro_url, timeout=DOWNLOAD_TIMEOUT)
         text = f.read()
         f.close()
-        gbpdistro_data = yaml.safe_load(text)
+        gbpdistro_data = yaml_utils.load(text)
         return gbprepo_to_rosdep_data(gbpdistro_data,
                                       targets_data,
                                       gbpdistro_url)
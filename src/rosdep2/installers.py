@@ -30,11 +30,29 @@
 from __future__ import print_function
 
 import subprocess
+import sys
+import threading
 import traceback
 
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
 from rospkg.os_detect import OsDetect
 
-from .core import rd_debug, RosdepInternalError, InstallFailed, print_bold, InvalidData
+from .core import rd_debug, RosdepInternalError, InstallFailed, print_bold, InvalidData, parallel_map
+
+# maximum number of installers checking install state at the same time
+DEFAULT_DETECTION_JOBS = 8
+
+# maximum number of installers installing at the same time
+DEFAULT_INSTALL_JOBS = 1
+
+# installers that do not use the system package manager.  They may
+# install at the same time as each other, every other installer (e.g.
+# 'source', whose scripts often call apt-get) only installs alone.
+CONCURRENT_INSTALLER_KEYS = ['pip', 'gem']
 
 # use OsDetect.get_version() for OS version key
 TYPE_VERSION = 'version'
@@ -243,6 +261,19 @@ class InstallerContext(object):
         except KeyError:
             return None
 
+def _unique(items):
+    """
+    :returns: *items* without duplicates, in the order of their first
+      occurrence
+    """
+    seen = set()
+    unique = []
+    for item in items:
+        if item not in seen:
+            seen.add(item)
+            unique.append(item)
+    return unique
+
 class Installer(object):
     """
     The :class:`Installer` API is designed around opaque *resolved*
@@ -259,6 +290,21 @@ class Installer(object):
           the local system
         """
         raise NotImplementedError("is_installed", resolved_item) 
+
+    def get_packages_to_install(self, resolved, reinstall=False):
+        """
+        Subclasses should override this to check all of *resolved* at
+        once.  The default implementation checks each item with
+        :meth:`is_installed`.
+
+        :param resolved: list of resolved installation items, ``[opaque]``
+        :param reinstall: If `True`, return all of *resolved*
+        :returns: unique items of *resolved* that are not installed,
+          in the order of *resolved*, ``[opaque]``
+        """
+        if reinstall:
+            return resolved
+        return [r for r in _unique(resolved) if not self.is_installed(r)]
         
     def get_install_command(self, resolved, interactive=True, reinstall=False):
         """
@@ -284,6 +330,20 @@ class Installer(object):
         """
         raise NotImplementedError("Base class resolve", rosdep_args_dict)
 
+    def prefetch_resolve(self, rosdep_args_list):
+        """
+        Called before a batch of :meth:`resolve` calls with the
+        argument dictionaries of the batch, so that installers whose
+        resolution is expensive (e.g. requires downloads) can do the
+        work for all of them at once.  Errors should be left for
+        :meth:`resolve` to raise.  The default implementation does
+        nothing.
+
+        :param rosdep_args_list: argument dictionaries to the rosdep
+          rules for this package manager, ``[dict]``
+        """
+        pass
+
     def unique(self, *resolved_rules):
         """
         Combine the resolved rules into a unique list.  This
@@ -353,7 +413,9 @@ class PackageManagerInstaller(Installer):
         if not resolved:
             return []
         else:
-            return list(set(resolved) - set(self.detect_fn(resolved)))
+            # keep order of resolved for reproducible install commands
+            installed = set(self.detect_fn(resolved))
+            return [r for r in _unique(resolved) if r not in installed]
 
     def is_installed(self, resolved_item):
         return not self.get_packages_to_install([resolved_item])
@@ -377,7 +439,7 @@ class RosdepInstaller(object):
         self.installer_context = installer_context
         self.lookup = lookup
         
-    def get_uninstalled(self, resources, implicit=False, verbose=False):
+    def get_uninstalled(self, resources, implicit=False, verbose=False, jobs=None):
         """
         Get list of system dependencies that have not been installed
         as well as a list of errors from performing the resolution.
@@ -387,51 +449,119 @@ class RosdepInstaller(object):
         :param resources: List of resource names (e.g. ROS package names), ``[str]]``
         :param implicit: Install implicit (recursive) dependencies of
             resources.  Default ``False``.
+        :param jobs: maximum number of installers to check install
+            state with at the same time.  Defaults to
+            ``DEFAULT_DETECTION_JOBS``.
 
         :returns: (uninstalled, errors), ``({str: [opaque]}, {str: ResolutionError})``.
           Uninstalled is a dictionary with the installer_key as the key.
         :raises: :exc:`RosdepInternalError`
         """
-        
-        installer_context = self.installer_context
-
         # resolutions have been unique()d
         if verbose:
             print("resolving for resources [%s]"%(', '.join(resources)))
-        resolutions, errors = self.lookup.resolve_all(resources, installer_context, implicit=implicit)
+        resolutions, errors = self.lookup.resolve_all(resources, self.installer_context, implicit=implicit)
+
+        detected = self._get_packages_to_install(resolutions, verbose, jobs)
+        # only create key if there is something to do
+        uninstalled = [(installer_key, packages_to_install)
+                       for (installer_key, _), packages_to_install in zip(resolutions, detected) if packages_to_install]
+        return uninstalled, errors
+
+    def get_uninstalled_with_dependencies(self, resources, implicit=False, verbose=False, jobs=None):
+        """
+        Like :meth:`RosdepInstaller.get_uninstalled`, but also report
+        the dependencies between the entries of *uninstalled*, for
+        :meth:`RosdepInstaller.install`.
+
+        :returns: (uninstalled, dependencies, errors), ``([(str, [opaque])], [[int]], {str: ResolutionError})``.
+          *dependencies* lists for each entry of *uninstalled* the
+          indices of the entries that have to be installed first.
+        :raises: :exc:`RosdepInternalError`
+        """
+        if verbose:
+            print("resolving for resources [%s]"%(', '.join(resources)))
+        resolutions, dependencies, errors = \
+            self.lookup.resolve_all_with_dependencies(resources, self.installer_context, implicit=implicit)
 
-        # for each installer, figure out what is left to install
+        detected = self._get_packages_to_install(resolutions, verbose, jobs)
         uninstalled = []
+        uninstalled_dependencies = []
+        entries = {} # {resolution index: uninstalled index}
+        waits = [] # [set(uninstalled index)] per resolution
+        for index, ((installer_key, _), packages_to_install) in enumerate(zip(resolutions, detected)):
+            # installed resolutions pass on their dependencies
+            resolution_waits = set()
+            for dependency in dependencies[index]:
+                if dependency in entries:
+                    resolution_waits.add(entries[dependency])
+                else:
+                    resolution_waits.update(waits[dependency])
+            waits.append(resolution_waits)
+            if packages_to_install:
+                entries[index] = len(uninstalled)
+                uninstalled.append((installer_key, packages_to_install))
+                uninstalled_dependencies.append(sorted(resolution_waits))
+        return uninstalled, uninstalled_dependencies, errors
+
+    def _get_packages_to_install(self, resolutions, verbose, jobs):
+        """
+        :param resolutions: resolutions from :meth:`RosdepLookup.resolve_all`
+        :param jobs: see :meth:`RosdepInstaller.get_uninstalled`
+        :returns: packages to install for each of *resolutions*, ``[[opaque]]``
+        :raises: :exc:`RosdepInternalError`
+        """
+        installer_context = self.installer_context
         if resolutions == []:
-            return uninstalled, errors
+            return []
+        checks = []
         for installer_key, resolved in resolutions: #py3k
-            if verbose:
-                print("resolution: %s [%s]"%(installer_key, ', '.join(resolved)))
             try:
-                installer = installer_context.get_installer(installer_key)
+                checks.append((installer_context.get_installer(installer_key), resolved))
             except KeyError as e: # lookup has to be buggy to cause this
                 raise RosdepInternalError(e)
+
+        def detect(args):
+            installer, resolved = args
             try:
-                packages_to_install = installer.get_packages_to_install(resolved)
+                return installer.get_packages_to_install(resolved), None
             except Exception as e:
-                rd_debug(traceback.format_exc())
+                return None, (e, traceback.format_exc())
+
+        # detectors are independent (mostly subprocesses), run them
+        # concurrently and report in resolution order
+        if jobs is None:
+            jobs = DEFAULT_DETECTION_JOBS
+        detected = parallel_map(detect, checks, jobs=jobs)
+        retval = []
+        for (installer_key, resolved), (packages_to_install, failure) in zip(resolutions, detected):
+            if verbose:
+                print("resolution: %s [%s]"%(installer_key, ', '.join(resolved)))
+            if failure is not None:
+                e, tb = failure
+                rd_debug(tb)
                 raise RosdepInternalError(e, message="Bad installer [%s]: %s"%(installer_key, e))
-
-            # only create key if there is something to do
-            if packages_to_install:
-                uninstalled.append((installer_key, packages_to_install))
+            retval.append(packages_to_install)
             if verbose:
                 print("uninstalled: [%s]"%(', '.join(packages_to_install)))
-        
-        return uninstalled, errors
+        return retval
     
     def install(self, uninstalled, interactive=True, simulate=False,
-                continue_on_error=False, reinstall=False, verbose=False):
+                continue_on_error=False, reinstall=False, verbose=False,
+                dependencies=None, jobs=None):
         """
         Install the uninstalled rosdeps.  This API is for the bulk
         workflow of rosdep (see example below).  For a more targeted
         install API, see :meth:`RosdepInstaller.install_resolved`.
 
+        If *jobs* is greater than 1, entries of *uninstalled* that do
+        not depend on each other are installed at the same time if
+        *dependencies* are given.  Only installers in
+        ``CONCURRENT_INSTALLER_KEYS`` run at the same time, each at
+        most once, and their output is printed once they finish.
+        Interactive and simulated installs are always run one entry at
+        a time.
+
         :param uninstalled: uninstalled value from
           :meth:`RosdepInstaller.get_uninstalled`.  Value is a
           dictionary mapping installer key to a dictionary with resolution
@@ -445,6 +575,12 @@ class RosdepInstaller(object):
           installation failure.
         :param reinstall: If ``True``, install dependencies if even
           already installed (default ``False``).
+        :param dependencies: for each entry of *uninstalled*, the
+          indices of the entries that have to be installed first, as
+          reported by :meth:`RosdepInstaller.get_uninstalled_with_dependencies`.
+          Defaults to installing the entries in order.
+        :param jobs: maximum number of installers to run at the same
+          time.  Defaults to ``DEFAULT_INSTALL_JOBS``.
 
         :raises: :exc:`InstallFailed` if any rosdeps fail to install
           and *continue_on_error* is ``False``.
@@ -460,32 +596,132 @@ class RosdepInstaller(object):
             print("install options: reinstall[%s] simulate[%s] interactive[%s]"%(reinstall, simulate, interactive))
             print("install: uninstalled keys are %s"%(', '.join([', '.join(pkg) for pkg in [v for k,v in uninstalled]])))
 
+        if dependencies is None:
+            dependencies = [[index - 1] if index else [] for index in range(len(uninstalled))]
         # Squash uninstalled again, in case some dependencies were already installed
         squashed_uninstalled = []
+        squashed_dependencies = []
+        entries = []
         previous_installer_key = None
-        for installer_key, resolved in uninstalled:
+        for (installer_key, resolved), entry_dependencies in zip(uninstalled, dependencies):
             if previous_installer_key != installer_key:
                 squashed_uninstalled.append((installer_key, []))
+                squashed_dependencies.append(set())
                 previous_installer_key = installer_key
+            index = len(squashed_uninstalled) - 1
             squashed_uninstalled[-1][1].extend(resolved)
+            squashed_dependencies[-1].update([entries[d] for d in entry_dependencies if entries[d] != index])
+            entries.append(index)
+
+        install_options = dict(simulate=simulate, interactive=interactive, reinstall=reinstall,
+                               continue_on_error=continue_on_error, verbose=verbose)
+        if jobs is None:
+            jobs = DEFAULT_INSTALL_JOBS
+        if simulate or interactive or jobs == 1:
+            # prompts and simulated commands are not interleaved
+            failures = []
+            for installer_key, resolved in squashed_uninstalled:
+                try:
+                    self.install_resolved(installer_key, resolved, **install_options)
+                except InstallFailed as e:
+                    if not continue_on_error:
+                        raise
+                    else:
+                        #accumulate errors
+                        failures.extend(e.failures)
+        else:
+            failures = self._install_concurrently(squashed_uninstalled, squashed_dependencies, jobs, install_options)
+        if failures:
+            raise InstallFailed(failures=failures)
 
-        failures = []
-        for installer_key, resolved in squashed_uninstalled:
+    def _install_concurrently(self, uninstalled, dependencies, jobs, install_options):
+        """
+        Sub-routine of :meth:`RosdepInstaller.install`.  Install each
+        entry of *uninstalled* once the entries it depends on are
+        done, with up to *jobs* entries at the same time, but only
+        one entry per installer.  Installers not in
+        ``CONCURRENT_INSTALLER_KEYS`` only run alone.  The output of
+        each entry is buffered and printed when it is done.
+
+        :param dependencies: ``[set(int)]``, see :meth:`RosdepInstaller.install`
+        :returns: failures if *continue_on_error* is set, ``[(installer_key, message)]``
+        :raises: :exc:`InstallFailed` if *continue_on_error* is not
+          set and any entry fails to install.  Entries that are
+          already running are completed first, but no new ones are
+          started.
+        """
+        condition = threading.Condition()
+        started = set()
+        finished = {} # {index: exception or None}
+        running_installers = set()
+
+        def install_entry(index):
+            installer_key, resolved = uninstalled[index]
+            output = StringIO()
             try:
-                self.install_resolved(installer_key, resolved, simulate=simulate,
-                                      interactive=interactive, reinstall=reinstall, continue_on_error=continue_on_error,
-                                      verbose=verbose)
-            except InstallFailed as e:
-                if not continue_on_error:
-                    raise
-                else:
-                    #accumulate errors
-                    failures.extend(e.failures)
-        if failures:
+                self.install_resolved(installer_key, resolved, output=output, **install_options)
+                result = None
+            except Exception as e:
+                rd_debug(traceback.format_exc())
+                result = e
+            with condition:
+                finished[index] = result, output.getvalue()
+                running_installers.discard(installer_key)
+                condition.notify()
+
+        def can_start(installer_key):
+            if installer_key in running_installers:
+                return False
+            if not running_installers:
+                return True
+            return installer_key in CONCURRENT_INSTALLER_KEYS and \
+                not [k for k in running_installers if k not in CONCURRENT_INSTALLER_KEYS]
+
+        failures = []
+        error = None
+        handled = set()
+        stop = False
+        with condition:
+            while True:
+                for index in sorted(set(finished) - handled):
+                    handled.add(index)
+                    result, output = finished[index]
+                    sys.stdout.write(output)
+                    sys.stdout.flush()
+                    if isinstance(result, InstallFailed):
+                        failures.extend(result.failures)
+                        if not install_options['continue_on_error']:
+                            stop = True
+                    elif result is not None:
+                        if error is None:
+                            error = result
+                        stop = True
+                running = len(started) - len(finished)
+                if not stop:
+                    for index, (installer_key, _) in enumerate(uninstalled):
+                        if running >= jobs:
+                            break
+                        if index in started or not can_start(installer_key) or \
+                               [d for d in dependencies[index] if d not in finished]:
+                            continue
+                        started.add(index)
+                        running_installers.add(installer_key)
+                        running += 1
+                        thread = threading.Thread(target=install_entry, args=(index,))
+                        thread.daemon = True
+                        thread.start()
+                if not running:
+                    break
+                # wait with a timeout to stay responsive to Ctrl-C
+                condition.wait(1.0)
+        if error is not None:
+            raise error
+        if failures and not install_options['continue_on_error']:
             raise InstallFailed(failures=failures)
+        return failures
 
     def install_resolved(self, installer_key, resolved, simulate=False, interactive=True,
-                         reinstall=False, continue_on_error=False, verbose=False):
+                         reinstall=False, continue_on_error=False, verbose=False, output=None):
         """
         Lower-level API for installing a rosdep dependency.  The
         rosdep keys have already been resolved to *installer_key* and
@@ -498,6 +734,8 @@ class RosdepInstaller(object):
         :param reinstall: If ``True``, install dependencies if even
           already installed (default ``False``).
         :param verbose: If ``True``, print verbose output to screen (default ``False``)
+        :param output: file to write messages and the output of the
+          installation commands to, or ``None`` to print them to screen
         
         :raises: :exc:`InstallFailed` if any of *resolved* fail to install.
         """
@@ -506,13 +744,13 @@ class RosdepInstaller(object):
         command = installer.get_install_command(resolved, interactive=interactive, reinstall=reinstall)
         if not command:
             if verbose:
-                print("#No packages to install")
+                print("#No packages to install", file=output)
             return
 
         if simulate:
-            print("#[%s] Installation commands:"%(installer_key))
+            print("#[%s] Installation commands:"%(installer_key), file=output)
             for sub_command in command:
-                print('  '+' '.join(sub_command))
+                print('  '+' '.join(sub_command), file=output)
 
         # nothing left to do for simulation
         if simulate:
@@ -520,23 +758,79 @@ class RosdepInstaller(object):
         
         # run each install command set and collect errors
         failures = []
-        for sub_command in command:
-            # always echo commands to screen
-            print_bold("executing command [%s]"%' '.join(sub_command))
-            result = subprocess.call(sub_command)
-            if verbose:
-                print("command return code [%s]: %s"%(' '.join(sub_command), result))
-            if result != 0:
-                failures.append((installer_key, 'command [%s] failed'%(' '.join(sub_command))) )
-                if not continue_on_error:
-                    raise InstallFailed(failures=failures)
-
-        # test installation of each
-        for r in resolved:
-            if not installer.is_installed(r):
-                failures.append((installer_key, "Failed to detect successful installation of [%s]"%(r)))
+        if continue_on_error and len(command) == 1 and len(resolved) > 1:
+            # single command installing all of resolved
+            failures.extend(self._install_batch(installer, installer_key, resolved, command[0],
+                                                interactive, reinstall, verbose, output))
+        else:
+            for sub_command in command:
+                failure = self._run_install_command(installer_key, sub_command, verbose, output)
+                if failure is not None:
+                    failures.append(failure)
+                    if not continue_on_error:
+                        raise InstallFailed(failures=failures)
+
+        # test installation of all items with a single detection
+        for r in installer.get_packages_to_install(resolved):
+            failures.append((installer_key, "Failed to detect successful installation of [%s]"%(r)))
         # finalize result
         if failures:
             raise InstallFailed(failures=failures)
         elif verbose:
-            print("#successfully installed")
+            print("#successfully installed", file=output)
+
+    def _run_install_command(self, installer_key, command, verbose, output=None):
+        """
+        :param output: file to write the output of *command* to, see
+          :meth:`RosdepInstaller.install_resolved`
+        :returns: failure, ``(installer_key, message)``, or ``None``
+          if *command* succeeded
+        """
+        # always echo commands to screen
+        print_bold("executing command [%s]"%' '.join(command), file=output)
+        if output is None:
+            result = subprocess.call(command)
+        else:
+            try:
+                p = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+                command_output = p.communicate()[0]
+                output.write(command_output.decode('utf-8', 'replace') if str is not bytes else command_output)
+                result = p.returncode
+            except OSError as e:
+                print("command [%s] failed: %s"%(' '.join(command), e), file=output)
+                result = 1
+        if verbose:
+            print("command return code [%s]: %s"%(' '.join(command), result), file=output)
+        if result != 0:
+            return installer_key, 'command [%s] failed'%(' '.join(command))
+        return None
+
+    def _install_batch(self, installer, installer_key, resolved, command, interactive, reinstall, verbose, output=None):
+        """
+        Run *command*, which installs all of *resolved* at once.  If
+        it fails, install each half of *resolved* separately, and so
+        on, to find the items that cannot be installed.
+
+        :returns: failures, ``[(installer_key, message)]``
+        """
+        failure = self._run_install_command(installer_key, command, verbose, output)
+        if failure is None:
+            return []
+        elif len(resolved) == 1:
+            return [failure]
+        if verbose:
+            print("#batch install failed, retrying in smaller batches", file=output)
+        failures = []
+        middle = len(resolved) // 2
+        for half in [resolved[:middle], resolved[middle:]]:
+            # items of half may have been installed by now
+            sub_command = installer.get_install_command(half, interactive=interactive, reinstall=reinstall)
+            if len(sub_command) == 1:
+                failures.extend(self._install_batch(installer, installer_key, half, sub_command[0],
+                                                    interactive, reinstall, verbose, output))
+            else:
+                for c in sub_command:
+                    failure = self._run_install_command(installer_key, c, verbose, output)
+                    if failure is not None:
+                        failures.append(failure)
+        return failures
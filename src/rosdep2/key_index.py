@@ -0,0 +1,185 @@
+# Copyright (c) 2012, Willow Garage, Inc.
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the Willow Garage, Inc. nor the names of its
+#       contributors may be used to endorse or promote products derived from
+#       this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+On-disk hash index of merged rosdep definitions.  The index is opened
+with mmap so that looking up a single rosdep key only touches the few
+pages holding its bucket and record, instead of loading every
+definition.
+
+File layout (all integers little-endian)::
+
+  header:  magic, format version, bucket count, key count, signature
+  buckets: (record offset, record length) per bucket, open addressing
+  records: key length, key, pickled (rule data, origin, defined in)
+
+where *defined in* lists the (view name, origin) of every source
+that defines the key, not only the one that wins the merge.
+"""
+
+import mmap
+import struct
+import zlib
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from .lookup import RosdepDefinition
+
+KEY_INDEX_MAGIC = b'RDKI'
+# bump on incompatible format changes
+KEY_INDEX_FORMAT_VERSION = 3
+
+_HEADER = struct.Struct('<4sIII40s')
+_BUCKET = struct.Struct('<II')
+_KEY_LENGTH = struct.Struct('<H')
+
+def _encode_key(rosdep_key):
+    if not isinstance(rosdep_key, bytes):
+        rosdep_key = rosdep_key.encode('utf-8')
+    return rosdep_key
+
+def _hash_key(key):
+    return zlib.crc32(key) & 0xffffffff
+
+def serialize_key_index(rosdep_defs, signature, defined_in=None):
+    """
+    Create hash index of *rosdep_defs*, to be written to disk and
+    opened with :class:`KeyIndex`.
+
+    :param rosdep_defs: rosdep definitions to index, ``{str: RosdepDefinition}``
+    :param signature: signature of data *rosdep_defs* was created
+      from, ``str`` of at most 40 characters
+    :param defined_in: views that define each key, ``{str: [(view_name, origin)]}``.
+      Defaults to the origin of each definition.
+    :returns: index data, ``bytes``
+    """
+    bucket_count = max(1, 2 * len(rosdep_defs))
+    buckets = [(0, 0)] * bucket_count
+    records = []
+    offset = _HEADER.size + bucket_count * _BUCKET.size
+    # sort for reproducible output
+    for rosdep_key in sorted(rosdep_defs.keys()):
+        definition = rosdep_defs[rosdep_key]
+        key = _encode_key(rosdep_key)
+        if defined_in is not None:
+            views = defined_in.get(rosdep_key, [])
+        else:
+            views = [(definition.origin, definition.origin)]
+        record = _KEY_LENGTH.pack(len(key)) + key + \
+            pickle.dumps((definition.data, definition.origin, views), 2)
+        i = _hash_key(key) % bucket_count
+        while buckets[i][1]:
+            i = (i + 1) % bucket_count
+        buckets[i] = (offset, len(record))
+        records.append(record)
+        offset += len(record)
+    return _HEADER.pack(KEY_INDEX_MAGIC, KEY_INDEX_FORMAT_VERSION, bucket_count, len(records),
+                        signature.encode('ascii')) + \
+        b''.join([_BUCKET.pack(*b) for b in buckets]) + b''.join(records)
+
+class KeyIndex(object):
+    """
+    Read-only view of a key index created by :func:`serialize_key_index`.
+    Implements the lookup API of :class:`RosdepView`.
+    """
+
+    def __init__(self, filepath, name=None):
+        """
+        :param name: name of view, defaults to *filepath*
+        :raises: :exc:`IOError` if index cannot be opened
+        :raises: :exc:`ValueError` if *filepath* is not a key index of
+          the current format
+        """
+        self.name = name or filepath
+        with open(filepath, 'rb') as f:
+            header = f.read(_HEADER.size)
+            if len(header) != _HEADER.size:
+                raise ValueError("truncated key index: %s"%(filepath))
+            magic, version, self._bucket_count, self._key_count, signature = _HEADER.unpack(header)
+            if magic != KEY_INDEX_MAGIC or version != KEY_INDEX_FORMAT_VERSION:
+                raise ValueError("not a key index in current format: %s"%(filepath))
+            self.signature = signature.rstrip(b'\0').decode('ascii')
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self):
+        self._map.close()
+
+    def _find(self, rosdep_key):
+        """
+        :returns: offset of pickled data of *rosdep_key* and end of its
+          record, or ``None`` if not indexed.
+        """
+        key = _encode_key(rosdep_key)
+        i = _hash_key(key) % self._bucket_count
+        for _ in range(self._bucket_count):
+            offset, length = _BUCKET.unpack_from(self._map, _HEADER.size + i * _BUCKET.size)
+            if not length:
+                return None
+            key_length, = _KEY_LENGTH.unpack_from(self._map, offset)
+            start = offset + _KEY_LENGTH.size
+            if self._map[start:start + key_length] == key:
+                return start + key_length, offset + length
+            i = (i + 1) % self._bucket_count
+        return None
+
+    def __contains__(self, rosdep_key):
+        return self._find(rosdep_key) is not None
+
+    def __len__(self):
+        return self._key_count
+
+    def _load_record(self, rosdep_name):
+        """
+        :returns: (data, origin, defined_in) of *rosdep_name*
+        :raises: :exc:`KeyError` If *rosdep_name* is not declared
+        """
+        found = self._find(rosdep_name)
+        if found is None:
+            raise KeyError(rosdep_name)
+        return pickle.loads(self._map[found[0]:found[1]])
+
+    def lookup(self, rosdep_name):
+        """
+        :returns: :class:`RosdepDefinition`
+        :raises: :exc:`KeyError` If *rosdep_name* is not declared
+        """
+        data, origin, _ = self._load_record(rosdep_name)
+        return RosdepDefinition(rosdep_name, data, origin)
+
+    def get_views_that_define(self, rosdep_name):
+        """
+        :returns: list of (view_name, origin) of the indexed views that
+          define *rosdep_name*, in merge order.  Empty if not declared.
+        """
+        try:
+            return list(self._load_record(rosdep_name)[2])
+        except KeyError:
+            return []
@@ -38,13 +38,10 @@ version of rosdep that works against tarballs of released stacks.
 import yaml
 
 from .core import InvalidData
+from . import yaml_utils
 
 ROSDEP_YAML = 'rosdep.yaml'
 
-yaml.add_constructor(
-    u'tag:yaml.org,2002:float',
-    yaml.constructor.Constructor.construct_yaml_str)
-
 class RosdepLoader:
     """
     Base API for loading rosdep information by package or stack name.  
@@ -58,7 +55,7 @@ class RosdepLoader:
         :raises: :exc:`yaml.YAMLError`
         """
         try:
-            return yaml.load(yaml_contents)
+            return yaml_utils.load(yaml_contents)
         except yaml.YAMLError as e:
             raise InvalidData("Invalid YAML in [%s]: %s"%(origin, e), origin=origin)
 
@@ -86,6 +83,14 @@ class RosdepLoader:
         :raises: :exc:`rospkg.ResourceNotFound` if *resource_name* cannot be found.
         """
         raise NotImplementedError(resource_name, implicit) #pychecker
+
+    def prefetch_rosdeps(self, resource_names, implicit=True):
+        """
+        Hint that :meth:`get_rosdeps` will be called for all of
+        *resource_names*, so that loaders can read them in bulk.  The
+        default implementation does nothing.
+        """
+        pass
     
     def get_view_key(self, resource_name):
         """
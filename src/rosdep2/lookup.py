@@ -29,19 +29,35 @@
 
 from __future__ import print_function
 
+import os
 import sys
 import yaml
 
 from collections import defaultdict
 
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
 from rospkg import RosPack, RosStack, ResourceNotFound
 
 from .core import RosdepInternalError, InvalidData, rd_debug
+from .installers import Installer
 from .model import RosdepDatabase
 from .rospkg_loader import RosPkgLoader
 from .dependency_graph import DependencyGraph
 
-from .sources_list import SourcesListLoader
+from .platforms.source import SOURCE_INSTALLER
+from .sources_list import SourcesListLoader, compute_sources_signature, write_atomic
+
+# installers whose resolution depends on more than the rule data
+# (e.g. downloaded manifests).  Their resolutions are not persisted.
+DYNAMIC_INSTALLER_KEYS = [SOURCE_INSTALLER]
+
+# bump on incompatible changes to files written by
+# RosdepLookup.save_resolve_cache()
+RESOLVE_CACHE_FORMAT_VERSION = 1
 
 from . import catkin_packages
 
@@ -159,6 +175,9 @@ class RosdepView(object):
 
     def __str__(self):
         return '\n'.join(["%s: %s"%val for val in self.rosdep_defs.items()])
+
+    def __len__(self):
+        return len(self.rosdep_defs)
             
     def lookup(self, rosdep_name):
         """
@@ -214,6 +233,14 @@ def prune_catkin_packages(rosdep_keys, verbose=False):
     return rosdep_keys
 
 
+def _implements_prefetch_resolve(installer):
+    """
+    :returns: ``True`` if *installer* overrides the no-op
+      :meth:`Installer.prefetch_resolve`
+    """
+    method = getattr(type(installer).prefetch_resolve, '__func__', type(installer).prefetch_resolve)
+    return method is not getattr(Installer.prefetch_resolve, '__func__', Installer.prefetch_resolve)
+
 class RosdepLookup(object):
     """
     Lookup rosdep definitions.  Provides API for most
@@ -232,9 +259,20 @@ class RosdepLookup(object):
         """
         self.rosdep_db = rosdep_db
         self.loader = loader
+
+        # SourcesListLoader providing the underlay, if any.  Used to
+        # access data precompiled at update time.
+        self.sources_loader = None
+        self._compiled_view = None
+        self._key_index = None
+
+        # pre-resolved keys written by 'rosdep compile', see
+        # rosdep2.resolution_table.  Consulted before resolving live.
+        self.resolution_table = None
         
         self._view_cache = {} # {str: {RosdepView}}
-        self._resolve_cache = {} # {str : (os_name, os_version, installer_key, resolution, dependencies)}
+        self._resolve_cache = {} # {str : (os_name, os_version, view_name, installer_key, resolution, dependencies)}
+        self._reverse_index = None # {str: [str]}
         
         # some APIs that deal with the entire environment save errors
         # in to self.errors instead of raising them in order to be
@@ -275,7 +313,25 @@ class RosdepLookup(object):
         
         :returns: list of package names that require rosdep, ``[str]``
         """
-        return [k for k in self.loader.get_loadable_resources() if rosdep_name in self.get_rosdeps(k, implicit=False)]
+        return self._get_reverse_index().get(rosdep_name, [])[:]
+
+    def _get_reverse_index(self):
+        """
+        Crawl all loadable resources once and index their direct
+        (non-implicit) rosdep keys.
+
+        :returns: map of rosdep key to the names of the resources that
+          require it, in loadable order, ``{str: [str]}``
+        """
+        if self._reverse_index is None:
+            resources = self.loader.get_loadable_resources()
+            self.loader.prefetch_rosdeps(resources, implicit=False)
+            reverse_index = {}
+            for resource_name in resources:
+                for rosdep_name in set(self.get_rosdeps(resource_name, implicit=False)):
+                    reverse_index.setdefault(rosdep_name, []).append(resource_name)
+            self._reverse_index = reverse_index
+        return self._reverse_index
 
     @staticmethod
     def create_from_rospkg(rospack=None, rosstack=None, 
@@ -314,6 +370,7 @@ class RosdepLookup(object):
 
         # create our actual instance
         lookup = RosdepLookup(rosdep_db, loader)
+        lookup.sources_loader = sources_loader
 
         # load in the underlay
         lookup._load_all_views(loader=sources_loader)
@@ -323,6 +380,37 @@ class RosdepLookup(object):
 
         return lookup
 
+    def copy_underlay(self, rospack=None, rosstack=None):
+        """
+        Create a :class:`RosdepLookup` for the current ROS package
+        environment that shares the sources list data (underlay)
+        loaded by this lookup.  ROS packages and stacks are crawled
+        anew by the new lookup, so this lookup can be kept to answer
+        later commands without reloading the sources.
+
+        :param rospack: (optional) Override :class:`rospkg.RosPack`
+          instance used to crawl ROS packages.
+        :param rosstack: (optional) Override :class:`rospkg.RosStack`
+          instance used to crawl ROS stacks.
+        """
+        if rospack is None:
+            rospack = RosPack()
+        if rosstack is None:
+            rosstack = RosStack()
+        underlay_key = SourcesListLoader.ALL_VIEW_KEY
+        view_names = self.sources_loader.get_loadable_views() + [underlay_key]
+        loader = RosPkgLoader(rospack=rospack, rosstack=rosstack,
+                              underlay_key=underlay_key)
+        lookup = RosdepLookup(self.rosdep_db.copy(view_names), loader)
+        lookup.sources_loader = self.sources_loader
+        # load precompiled data once, for all copies
+        lookup._compiled_view = self._get_compiled_view()
+        self._get_key_index()
+        lookup._key_index = self._key_index
+        lookup.errors = list(self.errors)
+        lookup.verbose = self.verbose
+        return lookup
+
     def resolve_all(self, resources, installer_context, implicit=False):
         """
         Resolve all the rosdep dependencies for *resources* using *installer_context*.
@@ -337,11 +425,29 @@ class RosdepLookup(object):
           key (e.g.: apt or homebrew) and the second element is a list of opaque resolution values for that 
           installer. errors maps package names to an :exc:`ResolutionError` or :exc:`KeyError` exception.
 
+        :raises: :exc:`RosdepInternalError` if unexpected error in constructing dependency graph
+        :raises: :exc:`InvalidData` if a cycle occurs in constructing dependency graph
+        """
+        resolutions, _, errors = self.resolve_all_with_dependencies(resources, installer_context, implicit=implicit)
+        return resolutions, errors
+
+    def resolve_all_with_dependencies(self, resources, installer_context, implicit=False):
+        """
+        Like :meth:`resolve_all`, but also report the dependencies
+        between the resolution tuples, see
+        :meth:`DependencyGraph.get_ordered_dependency_groups`.
+
+        :returns: (resolutions, dependencies, errors), ``([(str, [str])], [[int]], {str: ResolutionError})``.
+          *dependencies* lists for each resolution tuple the indices
+          of the resolution tuples that have to be installed first.
+
         :raises: :exc:`RosdepInternalError` if unexpected error in constructing dependency graph
         :raises: :exc:`InvalidData` if a cycle occurs in constructing dependency graph
         """
         depend_graph = DependencyGraph()
         errors = {}
+        self.loader.prefetch_rosdeps(resources, implicit=implicit)
+        rules = self._prefetch_resolutions(resources, installer_context, implicit)
         # TODO: resolutions dictionary should be replaced with resolution model instead of mapping (undefined) keys.
         for resource_name in resources:
             try:
@@ -352,17 +458,19 @@ class RosdepLookup(object):
                 for rosdep_key in rosdep_keys:
                     try:
                         installer_key, resolution, dependencies = \
-                                       self.resolve(rosdep_key, resource_name, installer_context)
+                                       self._resolve(rosdep_key, resource_name, installer_context, rules)
                         depend_graph[rosdep_key]['installer_key'] = installer_key
                         depend_graph[rosdep_key]['install_keys'] = list(resolution)
                         depend_graph[rosdep_key]['dependencies'] = list(dependencies)
+                        # copy: resolve() returns cached lists
+                        dependencies = list(dependencies)
                         while dependencies:
                             depend_rosdep_key = dependencies.pop()
                             # prevent infinite loop
                             if depend_rosdep_key in depend_graph:
                                 continue
                             installer_key, resolution, more_dependencies = \
-                                           self.resolve(depend_rosdep_key, resource_name, installer_context)
+                                           self._resolve(depend_rosdep_key, resource_name, installer_context, rules)
                             dependencies.extend(more_dependencies)
                             depend_graph[depend_rosdep_key]['installer_key'] = installer_key
                             depend_graph[depend_rosdep_key]['install_keys'] = list(resolution)
@@ -376,13 +484,14 @@ class RosdepLookup(object):
         try:
             # TODO: I really don't like AssertionErrors here; this should be modeled as 'CyclicGraphError' 
             # or something more explicit. No need to continue if this API errors.
-            resolutions_flat = depend_graph.get_ordered_dependency_list()
+            groups = depend_graph.get_ordered_dependency_groups()
         except AssertionError as e:
             raise InvalidData("cycle in dependency graph detected: %s"%(e))
         except KeyError as e:
             raise RosdepInternalError(e)
 
-        return resolutions_flat, errors
+        resolutions_flat = [(installer_key, resolved) for installer_key, resolved, _ in groups]
+        return resolutions_flat, [dependencies for _, _, dependencies in groups], errors
 
     def resolve(self, rosdep_key, resource_name, installer_context):
         """
@@ -404,20 +513,48 @@ class RosdepLookup(object):
         :raises: :exc:`ResolutionError` If *rosdep_key* cannot be resolved for *resource_name* in *installer_context*
         :raises: :exc:`rospkg.ResourceNotFound` if *resource_name* cannot be located
         """
+        return self._resolve(rosdep_key, resource_name, installer_context, None)
+
+    def _resolve(self, rosdep_key, resource_name, installer_context, rules):
+        """
+        Implementation of :meth:`RosdepLookup.resolve`.
+
+        :param rules: rules already looked up by
+          :meth:`RosdepLookup._prefetch_resolutions`, or ``None``
+        """
         os_name, os_version = installer_context.get_os_name_and_version()
+        view_key = self.loader.get_view_key(resource_name)
 
-        view = self.get_rosdep_view_for_resource(resource_name)
-        if view is None:
-            raise ResolutionError(rosdep_key, None, os_name, os_version, "[%s] does not have a rosdep view"%(resource_name))   
-        try:
-            #print("KEYS", view.rosdep_defs.keys())
-            definition = view.lookup(rosdep_key)
-        except KeyError:
-            rd_debug(view)
-            raise ResolutionError(rosdep_key, None, os_name, os_version, "Cannot locate rosdep definition for [%s]"%(rosdep_key))
+        resolved = self._get_cached_resolution(rosdep_key, view_key, os_name, os_version)
+        if resolved is not None:
+            return resolved
+
+        rule = rules.get((view_key, rosdep_key)) if rules else None
+        if rule is None:
+            rule = self._get_rule(rosdep_key, resource_name, installer_context)
+        view, installer_key, installer, rosdep_args_dict = rule
+        resolution = installer.resolve(rosdep_args_dict)
+        dependencies = installer.get_depends(rosdep_args_dict)        
 
-        # check cache: the main motivation for the cache is that
-        # source rosdeps are expensive to resolve
+        # cache value
+        self._resolve_cache[rosdep_key] = os_name, os_version, view.name, installer_key, resolution, dependencies
+
+        return installer_key, resolution, dependencies
+
+    def _get_cached_resolution(self, rosdep_key, view_key, os_name, os_version):
+        """
+        :returns: *(installer_key, resolution, dependencies)* of
+          *rosdep_key* from the resolution table or the resolution
+          cache, or ``None`` if not cached, see :meth:`RosdepLookup.resolve`
+        """
+        if self.resolution_table is not None:
+            resolved = self.resolution_table.get(rosdep_key, view_key, os_name, os_version)
+            if resolved is not None:
+                return resolved
+
+        # check cache before creating the view: the main motivation
+        # for the cache is that source rosdeps are expensive to
+        # resolve.  Views are named by their view key.
         if rosdep_key in self._resolve_cache:
             cache_value = self._resolve_cache[rosdep_key]
             cache_os_name = cache_value[0]
@@ -425,8 +562,28 @@ class RosdepLookup(object):
             cache_view_name = cache_value[2]
             if cache_os_name == os_name and \
                    cache_os_version == os_version and \
-                   cache_view_name == view.name:
+                   cache_view_name == view_key:
                 return cache_value[3:]
+        return None
+
+    def _get_rule(self, rosdep_key, resource_name, installer_context):
+        """
+        Sub-routine of :meth:`RosdepLookup.resolve`.  Look up the rule
+        of *rosdep_key* for the platform, without resolving it.
+
+        :returns: *(view, installer_key, installer, rosdep_args_dict)*
+        :raises: :exc:`ResolutionError` If there is no rule for *rosdep_key*
+        """
+        os_name, os_version = installer_context.get_os_name_and_version()
+        view = self.get_rosdep_view_for_resource(resource_name)
+        if view is None:
+            raise ResolutionError(rosdep_key, None, os_name, os_version, "[%s] does not have a rosdep view"%(resource_name))   
+        try:
+            #print("KEYS", view.rosdep_defs.keys())
+            definition = view.lookup(rosdep_key)
+        except KeyError:
+            rd_debug(view)
+            raise ResolutionError(rosdep_key, None, os_name, os_version, "Cannot locate rosdep definition for [%s]"%(rosdep_key))
 
         # get the rosdep data for the platform
         try:
@@ -441,14 +598,122 @@ class RosdepLookup(object):
             installer = installer_context.get_installer(installer_key)
         except KeyError:
             raise ResolutionError(rosdep_key, definition.data, os_name, os_version, "Unsupported installer [%s]"%(installer_key))
-        resolution = installer.resolve(rosdep_args_dict)
-        dependencies = installer.get_depends(rosdep_args_dict)        
+        return view, installer_key, installer, rosdep_args_dict
 
-        # cache value
-        self._resolve_cache[rosdep_key] = os_name, os_version, view.name, installer_key, resolution, dependencies
+    def _prefetch_resolutions(self, resources, installer_context, implicit):
+        """
+        Sub-routine of :meth:`RosdepLookup.resolve_all_with_dependencies`.
+        Look up the rules of all uncached rosdep keys that resolving
+        *resources* will need and pass them to
+        :meth:`Installer.prefetch_resolve` of their installers, so
+        that e.g. downloads happen all at once instead of one key at a
+        time.  Nothing is done if no installer of *installer_context*
+        implements :meth:`Installer.prefetch_resolve`.  Errors are left
+        for the actual resolution to report.
 
-        return installer_key, resolution, dependencies
+        :returns: rules looked up, for reuse by the actual resolution,
+          ``{(view_key, rosdep_key): (view, installer_key, installer, rosdep_args_dict)}``
+        """
+        prefetch_installers = []
+        for installer_key in installer_context.get_installer_keys():
+            installer = installer_context.get_installer(installer_key)
+            if _implements_prefetch_resolve(installer):
+                prefetch_installers.append(installer)
+        if not prefetch_installers:
+            return {}
+
+        os_name, os_version = installer_context.get_os_name_and_version()
+        rules = {}
+        for resource_name in resources:
+            try:
+                view_key = self.loader.get_view_key(resource_name)
+                # copy: the loader may return its cached lists
+                pending = list(prune_catkin_packages(self.get_rosdeps(resource_name, implicit=implicit)))
+            except Exception as e:
+                rd_debug("prefetch: skipping [%s]: %s"%(resource_name, e))
+                continue
+            visited = set()
+            while pending:
+                rosdep_key = pending.pop()
+                if rosdep_key in visited:
+                    continue
+                visited.add(rosdep_key)
+                resolved = self._get_cached_resolution(rosdep_key, view_key, os_name, os_version)
+                if resolved is not None:
+                    pending.extend(resolved[2])
+                    continue
+                if (view_key, rosdep_key) in rules:
+                    rule = rules[(view_key, rosdep_key)]
+                else:
+                    try:
+                        rule = self._get_rule(rosdep_key, resource_name, installer_context)
+                    except Exception as e:
+                        rd_debug("prefetch: skipping [%s]: %s"%(rosdep_key, e))
+                        continue
+                    rules[(view_key, rosdep_key)] = rule
+                _, _, installer, rosdep_args_dict = rule
+                try:
+                    pending.extend(installer.get_depends(rosdep_args_dict))
+                except Exception as e:
+                    rd_debug("prefetch: skipping dependencies of [%s]: %s"%(rosdep_key, e))
+
+        for installer in prefetch_installers:
+            rosdep_args_list = [rule[3] for rule in rules.values() if rule[2] is installer]
+            if rosdep_args_list:
+                installer.prefetch_resolve(rosdep_args_list)
+        return rules
         
+    def load_resolve_cache(self, filepath):
+        """
+        Seed the resolution cache and the rosdep keys cache of the
+        loader with data saved by :meth:`save_resolve_cache`.  Saved
+        data is ignored if the sources have changed since.  Missing
+        or unreadable files are ignored.
+        """
+        signature = self._get_sources_signature()
+        if signature is None or not os.path.isfile(filepath):
+            return
+        try:
+            with open(filepath, 'rb') as f:
+                data = pickle.load(f)
+        except Exception:
+            return
+        if not isinstance(data, tuple) or len(data) != 4 or \
+               data[0] != RESOLVE_CACHE_FORMAT_VERSION or data[1] != signature:
+            return
+        resolve_cache, rosdeps_cache = data[2:]
+        for rosdep_key, value in resolve_cache.items():
+            self._resolve_cache.setdefault(rosdep_key, value)
+        if getattr(self.loader, 'rosdeps_cache', None) is not None:
+            for key, value in rosdeps_cache.items():
+                self.loader.rosdeps_cache.setdefault(key, value)
+
+    def save_resolve_cache(self, filepath):
+        """
+        Save resolution cache and the rosdep keys cache of the loader
+        for :meth:`load_resolve_cache`.  Resolutions of
+        ``DYNAMIC_INSTALLER_KEYS`` are not saved.
+
+        :raises: :exc:`OSError` if cannot write to *filepath*
+        """
+        signature = self._get_sources_signature()
+        if signature is None:
+            return
+        resolve_cache = dict([(k, v) for k, v in self._resolve_cache.items() if v[3] not in DYNAMIC_INSTALLER_KEYS])
+        rosdeps_cache = getattr(self.loader, 'rosdeps_cache', None) or {}
+        data = (RESOLVE_CACHE_FORMAT_VERSION, signature, resolve_cache, rosdeps_cache)
+        write_atomic(filepath, pickle.dumps(data, 2), binary=True)
+
+    def _get_sources_signature(self):
+        """
+        :returns: signature of the cached sources of the sources
+          loader, or ``None`` if not available
+        """
+        sources_loader = self.sources_loader
+        if sources_loader is None or getattr(sources_loader, 'sources_cache_dir', None) is None:
+            return None
+        return compute_sources_signature(sources_loader.sources_cache_dir, sources_loader.sources)
+
     def _load_all_views(self, loader):
         """
         Load all available view keys.  In general, this is equivalent
@@ -508,6 +773,14 @@ class RosdepLookup(object):
         # dependencies.
         view = RosdepView(view_name)
 
+        compiled_view_keys, compiled_defs = self._get_compiled_view()
+        if compiled_view_keys and view_keys[:len(compiled_view_keys)] == compiled_view_keys:
+            # these views were already merged at update time
+            if verbose:
+                print("view[%s]: using precompiled view of [%s]"%(view_name, ', '.join(compiled_view_keys)), file=sys.stderr)
+            view.rosdep_defs.update(compiled_defs)
+            view_keys = view_keys[len(compiled_view_keys):]
+
         db = self.rosdep_db
         for view_key in view_keys:
             db_entry = db.get_view_data(view_key)
@@ -516,6 +789,36 @@ class RosdepLookup(object):
             print("View [%s], merged views:\n"%(view_name)+"\n".join([" * %s"%view_key for view_key in view_keys]), file=sys.stderr)
         return view
     
+    def _get_compiled_view(self):
+        """
+        :returns: (view_keys, rosdep_defs) of the precompiled view of
+          the sources loader, see
+          :meth:`SourcesListLoader.get_compiled_view`.  ``([], {})`` if
+          not available.
+        """
+        if self._compiled_view is None:
+            compiled_view = None
+            if self.sources_loader is not None:
+                compiled_view = self.sources_loader.get_compiled_view()
+            self._compiled_view = compiled_view or ([], {})
+        return self._compiled_view
+
+    def _get_key_index(self):
+        """
+        :returns: :class:`rosdep2.key_index.KeyIndex` of the sources
+          loader, see :meth:`SourcesListLoader.get_key_index`.
+          ``None`` if not available.
+        """
+        # False marks an unavailable index; KeyIndex defines __len__
+        if self._key_index is None:
+            key_index = None
+            if self.sources_loader is not None:
+                key_index = self.sources_loader.get_key_index()
+            self._key_index = False if key_index is None else key_index
+        if self._key_index is False:
+            return None
+        return self._key_index
+
     def get_rosdep_view_for_resource(self, resource_name, verbose=False):
         """
         Get a :class:`RosdepView` for a specific ROS resource *resource_name*.
@@ -574,7 +877,9 @@ class RosdepLookup(object):
         """
         Locate all views that directly define *rosdep_name*.  A
         side-effect of this method is that all available rosdep files
-        in the configuration will be loaded into memory.
+        in the configuration will be loaded into memory, except for
+        sources covered by an up-to-date key index, which answers for
+        them without reading their data.
 
         Error state from single-stack failures
         (e.g. :exc:`InvalidData`, :exc:`ResourceNotFound`) are
@@ -589,9 +894,19 @@ class RosdepLookup(object):
         """
         #TODOXXX: change this to return errors object so that caller cannot ignore
         self._load_all_views(self.loader)
+        key_index = self._get_key_index()
+        if key_index is not None:
+            indexed_views = set(self.sources_loader.get_loadable_views())
+            indexed = dict(key_index.get_views_that_define(rosdep_name))
+        else:
+            indexed_views = indexed = {}
         db = self.rosdep_db
         retval = []
         for view_name in db.get_view_names():
+            if view_name in indexed_views:
+                if view_name in indexed:
+                    retval.append((view_name, indexed[view_name]))
+                continue
             entry = db.get_view_data(view_name)
             # not much abstraction in the entry object
             if rosdep_name in entry.rosdep_data:
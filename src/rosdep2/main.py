@@ -35,6 +35,7 @@ Command-line interface to rosdep library
 from __future__ import print_function
 
 import os
+import socket
 import sys
 import traceback
 import urllib2
@@ -48,11 +49,13 @@ from . import __version__
 from .core import RosdepInternalError, InstallFailed, UnsupportedOs, InvalidData
 from .installers import RosdepInstaller
 from .lookup import RosdepLookup, ResolutionError
+from .platforms.source import SOURCE_INSTALLER, RDMANIFEST_CACHE_DIR
+from .resolution_table import create_resolution_table, write_resolution_table, load_resolution_table
 from .rospkg_loader import DEFAULT_VIEW_KEY
 from .sources_list import update_sources_list, get_sources_cache_dir,\
      download_default_sources_list, SourcesListLoader,CACHE_INDEX,\
      get_sources_list_dir, get_default_sources_list_file,\
-     DEFAULT_SOURCES_LIST_URL
+     DEFAULT_SOURCES_LIST_URL, DataSourceMatcher, compute_filename_hash
 
 from catkin_packages import find_catkin_packages_in
 from catkin_packages import set_workspace_packages
@@ -72,6 +75,10 @@ rosdep check <stacks-and-packages>...
 rosdep install <stacks-and-packages>...
   generate a bash script and then execute it.
 
+rosdep compile
+  resolve all rosdep keys for the current OS ahead of time to speed
+  up check, install and resolve.
+
 rosdep db
   generate the dependency database and print it to the console.
 
@@ -84,6 +91,10 @@ rosdep keys <stacks-and-packages>...
 rosdep resolve <rosdeps>
   resolve <rosdeps> to system dependencies
   
+rosdep serve
+  answer rosdep commands from a long-running process listening on
+  $ROSDEP_SERVER_SOCKET.
+
 rosdep update
   update the local rosdep database based on the rosdep sources.
   
@@ -96,19 +107,115 @@ rosdep where-defined <rosdeps>...
   one of) <rosdeps>
 """
 
+# environment variables that change the result of
+# _get_default_RosdepLookup()
+_LOOKUP_ENVIRONMENT = ['ROS_PACKAGE_PATH', 'ROS_ROOT', 'ROS_DISTRO', 'ROS_HOME']
+
+# Lookups holding loaded sources list data and installer contexts
+# kept warm between commands by 'rosdep serve', see set_caching().  ``None`` while caching is disabled.
+_lookup_cache = None
+_installer_context_cache = None
+
+def set_caching(enabled):
+    """
+    Enable or disable reuse of loaded sources list data and installer
+    contexts between commands run in the same process.  Disabling
+    drops cached instances.  Cached sources are reused only as long
+    as the options, ROS environment and sources cache index are
+    unchanged.  ROS packages are crawled for every command.
+    """
+    global _lookup_cache, _installer_context_cache
+    if enabled:
+        _lookup_cache, _installer_context_cache = {}, {}
+    else:
+        _lookup_cache = _installer_context_cache = None
+
+def _get_cache_index_mtime(sources_cache_dir):
+    try:
+        return os.stat(os.path.join(sources_cache_dir, CACHE_INDEX)).st_mtime
+    except OSError:
+        return None
+
 def _get_default_RosdepLookup(options):
     """
     Helper routine for converting command-line options into
     appropriate RosdepLookup instance.
     """
+    if _lookup_cache is not None:
+        key = (options.sources_cache_dir, options.os_override, options.verbose) + \
+            tuple([os.environ.get(name) for name in _LOOKUP_ENVIRONMENT])
+        index_mtime = _get_cache_index_mtime(options.sources_cache_dir)
+        if key in _lookup_cache:
+            underlay_lookup, cached_mtime = _lookup_cache[key]
+            if cached_mtime == index_mtime:
+                # workspace packages may have changed since
+                return underlay_lookup.copy_underlay()
     os_override = convert_os_override_option(options.os_override)
     sources_loader = SourcesListLoader.create_default(sources_cache_dir=options.sources_cache_dir,
                                                       os_override=os_override,
                                                       verbose=options.verbose)
     lookup = RosdepLookup.create_from_rospkg(sources_loader=sources_loader)
     lookup.verbose = options.verbose
+    if _lookup_cache is not None:
+        # keep an unused lookup holding only the sources list data
+        _lookup_cache[key] = lookup, index_mtime
+        lookup = lookup.copy_underlay()
     return lookup
 
+# prefix of files in the sources cache storing resolutions of a
+# workspace between runs
+RESOLVE_CACHE_PREFIX = 'resolve-cache-'
+
+def _get_resolve_cache_path(options):
+    """
+    :returns: path of resolution cache for the workspace
+      (ROS_PACKAGE_PATH) of the current command
+    """
+    workspace = os.environ.get('ROS_PACKAGE_PATH', '')
+    return os.path.join(options.sources_cache_dir, RESOLVE_CACHE_PREFIX + compute_filename_hash(workspace))
+
+def _save_resolve_cache(lookup, options):
+    try:
+        lookup.save_resolve_cache(_get_resolve_cache_path(options))
+    except (IOError, OSError) as e:
+        # cache is optional
+        if options.verbose:
+            print("unable to save resolution cache: %s"%(e), file=sys.stderr)
+
+def _get_default_installer_context(options):
+    """
+    Create installer context for the current OS, overridden by
+    *options* if necessary.
+
+    :raises: :exc:`UsageError` If user input options incorrectly
+    """
+    key = (options.verbose, options.os_override, options.sources_cache_dir)
+    if _installer_context_cache is not None and key in _installer_context_cache:
+        return _installer_context_cache[key]
+    installer_context = create_default_installer_context(verbose=options.verbose)
+    configure_installer_context_os(installer_context, options)
+    if SOURCE_INSTALLER in installer_context.get_installer_keys():
+        # keep downloaded rdmanifests and tarballs across invocations
+        source_installer = installer_context.get_installer(SOURCE_INSTALLER)
+        source_installer.rdmanifest_cache_dir = os.path.join(options.sources_cache_dir, RDMANIFEST_CACHE_DIR)
+        source_installer.sources_cache_dir = options.sources_cache_dir
+        source_installer.verbose = options.verbose
+    if _installer_context_cache is not None:
+        _installer_context_cache[key] = installer_context
+    return installer_context
+
+def _load_resolution_table(lookup, installer_context, options):
+    """
+    Let *lookup* use the resolution table written by 'rosdep compile'
+    for the OS of *installer_context*, if it is up-to-date.
+    """
+    lookup.resolution_table = load_resolution_table(lookup.sources_loader, installer_context)
+    if options.verbose:
+        if lookup.resolution_table is None:
+            print("no up-to-date resolution table, resolving all keys", file=sys.stderr)
+        else:
+            print("using resolution table of %d keys"%(len(lookup.resolution_table.resolutions)), file=sys.stderr)
+
 def rosdep_main(args=None):
     if args is None:
         args = sys.argv[1:]
@@ -189,7 +296,7 @@ ERROR: your rosdep installation has not been initialized yet.  Please run:
     else:
         return True
     
-def _rosdep_main(args):
+def _create_option_parser():
     # sources cache dir is our local database.  
     default_sources_cache = get_sources_cache_dir()
 
@@ -227,8 +334,19 @@ def _rosdep_main(args):
                            "If specified the arugments to those verbs will be "
                            "considered paths to be searched, acting on all "
                            "catkin packages found there in.")
+    parser.add_option("--jobs", "-j", dest="jobs", default=None, type="int",
+                      metavar="JOBS",
+                      help="Affects the 'update' and 'install' verbs. "
+                           "Maximum number of sources to download or of "
+                           "installers to run at the same time (installs "
+                           "run one at a time by default).")
+    return parser
 
+def _rosdep_main(args):
+    parser = _create_option_parser()
     options, args = parser.parse_args(args)
+    if options.jobs is not None and options.jobs < 1:
+        parser.error("--jobs must be a positive integer")
     if options.print_version:
         print(__version__)
         sys.exit(0)
@@ -388,21 +506,54 @@ def command_update(options):
         print("Hit %s"%(data_source.url))
     def update_error_handler(data_source, exc):
         print("ERROR: unable to process source [%s]:\n\t%s"%(data_source.url, exc), file=sys.stderr)
+    def update_progress_handler(data_source, bytes_read, rate):
+        # called from the download threads, write each line at once
+        sys.stderr.write("Get %s: %d kB (%.1f kB/s)\n"%(data_source.url, bytes_read // 1024, rate / 1024))
     sources_list_dir = get_sources_list_dir()
     filelist = [f for f in os.listdir(sources_list_dir) if f.endswith('.list')]    
     if not filelist:
         print("ERROR: no data sources in %s\n\nPlease initialize your rosdep with\n\n\tsudo rosdep init\n"%sources_list_dir, file=sys.stderr)
         return 1
+    matcher = None
+    if options.os_override:
+        # precompile the sources for the requested OS instead
+        matcher = DataSourceMatcher.create_default(os_override=convert_os_override_option(options.os_override))
     try:
         print("reading in sources list data from %s"%(sources_list_dir))
         update_sources_list(success_handler=update_success_handler,
-                            error_handler=update_error_handler)
+                            error_handler=update_error_handler,
+                            progress_handler=update_progress_handler if options.verbose else None,
+                            jobs=options.jobs, matcher=matcher)
         print("updated cache in %s"%(get_sources_cache_dir()))
     except InvalidData as e:
         print("ERROR: invalid sources list file:\n\t%s"%(e), file=sys.stderr)
     except IOError as e:
         print("ERROR: error loading sources list:\n\t%s"%(e), file=sys.stderr)
     
+def command_compile(options):
+    lookup = _get_default_RosdepLookup(options)
+    installer_context = _get_default_installer_context(options)
+    table = create_resolution_table(lookup, installer_context)
+    _print_lookup_errors(lookup)
+    try:
+        path = write_resolution_table(lookup.sources_loader, table)
+    except (IOError, OSError) as e:
+        print("ERROR: cannot write resolution table:\n\t%s"%(e), file=sys.stderr)
+        return 1
+    print("resolved %d keys for %s %s in %s"%(len(table.resolutions), table.os_name, table.os_version, path))
+
+def command_serve(options):
+    # server depends on this module
+    from .server import serve, get_default_server_socket, SERVER_SOCKET_ENV
+    socket_path = get_default_server_socket()
+    print("serving rosdep commands on %s\nset %s=%s to use it"%(socket_path, SERVER_SOCKET_ENV, socket_path))
+    sys.stdout.flush()
+    try:
+        serve(socket_path, verbose=options.verbose)
+    except (socket.error, OSError) as e:
+        print("ERROR: cannot serve on %s:\n\t%s"%(socket_path, e), file=sys.stderr)
+        return 1
+
 def command_keys(lookup, packages, options):
     lookup = _get_default_RosdepLookup(options)
     rosdep_keys = get_keys(lookup, packages, options.recursive)
@@ -410,6 +561,7 @@ def command_keys(lookup, packages, options):
     print('\n'.join(rosdep_keys))
 
 def get_keys(lookup, packages, recursive):
+    lookup.get_loader().prefetch_rosdeps(packages, implicit=recursive)
     rosdep_keys = []
     for package_name in packages:
         deps = lookup.get_rosdeps(package_name, implicit=recursive)
@@ -419,11 +571,13 @@ def get_keys(lookup, packages, recursive):
 def command_check(lookup, packages, options):
     verbose = options.verbose
     
-    installer_context = create_default_installer_context(verbose=verbose)
-    configure_installer_context_os(installer_context, options)
+    installer_context = _get_default_installer_context(options)
+    _load_resolution_table(lookup, installer_context, options)
+    lookup.load_resolve_cache(_get_resolve_cache_path(options))
     installer = RosdepInstaller(installer_context, lookup)
 
     uninstalled, errors = installer.get_uninstalled(packages, implicit=options.recursive, verbose=verbose)
+    _save_resolve_cache(lookup, options)
 
     # pretty print the result
     if [v for k, v in uninstalled if v]:
@@ -460,20 +614,24 @@ def command_install(lookup, packages, options):
                            continue_on_error=options.robust, simulate=options.simulate)
 
     # setup installer
-    installer_context = create_default_installer_context(verbose=options.verbose)
-    configure_installer_context_os(installer_context, options)
+    installer_context = _get_default_installer_context(options)
+    _load_resolution_table(lookup, installer_context, options)
+    lookup.load_resolve_cache(_get_resolve_cache_path(options))
     installer = RosdepInstaller(installer_context, lookup)
 
     if options.reinstall:
         if options.verbose:
             print("reinstall is true, resolving all dependencies")
         try:
-            uninstalled, errors = lookup.resolve_all(packages, installer_context, implicit=options.recursive)
+            uninstalled, dependencies, errors = \
+                lookup.resolve_all_with_dependencies(packages, installer_context, implicit=options.recursive)
         except InvalidData as e:
             print("ERROR: unable to process all dependencies:\n\t%s"%(e), file=sys.stderr)
             return 1
     else:
-        uninstalled, errors = installer.get_uninstalled(packages, implicit=options.recursive, verbose=options.verbose)
+        uninstalled, dependencies, errors = \
+            installer.get_uninstalled_with_dependencies(packages, implicit=options.recursive, verbose=options.verbose)
+    _save_resolve_cache(lookup, options)
         
     if options.verbose:
         print("uninstalled dependencies are: [%s]"%(', '.join([', '.join(pkg) for pkg in [v for k,v in uninstalled]])))
@@ -484,7 +642,7 @@ def command_install(lookup, packages, options):
             print("%s: %s"%(rosdep_key, error_to_human_readable(error)), file=sys.stderr)
         return 1
     try:
-        installer.install(uninstalled, **install_options)
+        installer.install(uninstalled, dependencies=dependencies, jobs=options.jobs, **install_options)
         if not options.simulate:
             print("#All required rosdeps installed successfully")
         return 0
@@ -512,8 +670,7 @@ def _compute_depdb_output(lookup, packages, options):
 def command_db(options):
     # exact same setup logic as command_resolve, should possibly combine
     lookup = _get_default_RosdepLookup(options)
-    installer_context = create_default_installer_context(verbose=options.verbose)
-    configure_installer_context_os(installer_context, options)
+    installer_context = _get_default_installer_context(options)
     os_name, os_version = installer_context.get_os_name_and_version()
     try:
         installer_keys = installer_context.get_os_installer_keys(os_name)
@@ -554,6 +711,9 @@ def _print_lookup_errors(lookup):
             
 def command_what_needs(args, options):
     lookup = _get_default_RosdepLookup(options)
+    # reuse manifests parsed by check/install.  This query does not
+    # write the workspace resolution cache.
+    lookup.load_resolve_cache(_get_resolve_cache_path(options))
     packages = []
     for rosdep_name in args:
         packages.extend(lookup.get_resources_that_need(rosdep_name))
@@ -578,17 +738,24 @@ def command_where_defined(args, options):
 
 def command_resolve(args, options):
     lookup = _get_default_RosdepLookup(options)
-    installer_context = create_default_installer_context(verbose=options.verbose)
-    configure_installer_context_os(installer_context, options)
+    installer_context = _get_default_installer_context(options)
 
     installer, installer_keys, default_key, \
             os_name, os_version = get_default_installer(installer_context=installer_context,
                                                         verbose=options.verbose)
+    _load_resolution_table(lookup, installer_context, options)
     invalid_key_errors = []
     for rosdep_name in args:
         if len(args) > 1:
             print("#ROSDEP[%s]"%rosdep_name)
 
+        if lookup.resolution_table is not None:
+            resolved = lookup.resolution_table.get(rosdep_name, DEFAULT_VIEW_KEY, os_name, os_version)
+            if resolved is not None:
+                print("#%s"%(resolved[0]))
+                print (" ".join([str(r) for r in resolved[1]]))
+                continue
+
         view = lookup.get_rosdep_view(DEFAULT_VIEW_KEY, verbose=options.verbose)
         try:
             d = view.lookup(rosdep_name)
@@ -614,11 +781,13 @@ def command_resolve(args, options):
 command_handlers = {
     'db': command_db,
     'check': command_check,
+    'compile': command_compile,
     'keys': command_keys,
     'install': command_install,
     'what-needs': command_what_needs,
     'where-defined': command_where_defined,
     'resolve': command_resolve,
+    'serve': command_serve,
     'init': command_init,
     'update': command_update,
 
@@ -631,7 +800,7 @@ command_handlers = {
 # commands that accept rosdep names as args
 _command_rosdep_args = ['what-needs', 'what_needs', 'where-defined', 'where_defined', 'resolve']
 # commands that take no args
-_command_no_args = ['update', 'init', 'db']
+_command_no_args = ['update', 'init', 'db', 'compile', 'serve']
 
 _commands = command_handlers.keys()
 
@@ -43,15 +43,31 @@ class RosdepDatabaseEntry(object):
     Stores rosdep data and metadata for a single view.
     """
     
-    def __init__(self, rosdep_data, view_dependencies, origin):
+    def __init__(self, rosdep_data, view_dependencies, origin, rosdep_data_loader=None):
         """
         :param rosdep_data: raw rosdep dictionary map for view
         :param view_dependencies: list of view dependency names
         :param origin: name of where data originated, e.g. filename
+        :param rosdep_data_loader: (optional) fn() that returns the
+          raw rosdep dictionary map.  If set, it is called on first
+          access of *rosdep_data* instead of using *rosdep_data*.
         """
-        self.rosdep_data = rosdep_data
+        self._rosdep_data = rosdep_data
+        self._rosdep_data_loader = rosdep_data_loader
         self.view_dependencies = view_dependencies
         self.origin = origin
+
+    @property
+    def rosdep_data(self):
+        """
+        :returns: raw rosdep dictionary map for view
+        """
+        if self._rosdep_data_loader is not None:
+            # copy to match set_view_data(). A view without data
+            # (e.g. never downloaded) is empty.
+            self._rosdep_data = (self._rosdep_data_loader() or {}).copy()
+            self._rosdep_data_loader = None
+        return self._rosdep_data
                 
 class RosdepDatabase(object):
     """
@@ -88,6 +104,33 @@ class RosdepDatabase(object):
         """
         self._rosdep_db[view_name] = RosdepDatabaseEntry(rosdep_data.copy(), view_dependencies, origin)
 
+    def set_view_data_loader(self, view_name, rosdep_data_loader, view_dependencies, origin):
+        """
+        Set data associated with view, like
+        :meth:`RosdepDatabase.set_view_data`, but defer loading the
+        rosdep data map until it is first accessed.
+
+        :param rosdep_data_loader: fn() that returns rosdep data map
+          to associate with view.  The result will be copied.
+        :param origin: origin of view data, e.g. filepath of ``rosdep.yaml``
+        """
+        self._rosdep_db[view_name] = RosdepDatabaseEntry(None, view_dependencies, origin,
+                                                         rosdep_data_loader=rosdep_data_loader)
+
+    def copy(self, view_names=None):
+        """
+        :param view_names: names of the views to copy, or ``None`` to
+          copy all loaded views
+        :returns: new :class:`RosdepDatabase` sharing the entries of
+          *view_names* with this database.  Views loaded into it
+          later are not added to this database.
+        """
+        db = RosdepDatabase()
+        for view_name, entry in self._rosdep_db.items():
+            if view_names is None or view_name in view_names:
+                db._rosdep_db[view_name] = entry
+        return db
+
     def get_view_names(self):
         """
         :returns: list of view names that are loaded into this database.
@@ -28,6 +28,9 @@
 
 # Author Tully Foote, Ken Conley
 
+import os
+import threading
+
 from rospkg.os_detect import OS_DEBIAN, OS_UBUNTU
 
 from .pip import PIP_INSTALLER
@@ -39,6 +42,14 @@ from ..shell_utils import read_stdout
 # apt package manager key
 APT_INSTALLER='apt'
 
+# dpkg status database, read by dpkg_detect() instead of running
+# dpkg-query for each query
+DPKG_STATUS_FILE = '/var/lib/dpkg/status'
+
+# (status file, mtime, size, {package: (status, version)}) of last read
+_dpkg_status_cache = None
+_dpkg_status_lock = threading.Lock()
+
 def register_installers(context):
     context.set_installer(APT_INSTALLER, AptInstaller())
 
@@ -62,9 +73,75 @@ def register_ubuntu(context):
     context.set_default_os_installer_key(OS_UBUNTU, APT_INSTALLER)
     context.set_os_version_type(OS_UBUNTU, TYPE_CODENAME)
 
+def _is_installed_status(status):
+    # Status field is "<want> <error> <state>"
+    return status.split()[-1:] == ['installed']
+
+def parse_dpkg_status(text):
+    """
+    Parse contents of the dpkg status database.  Packages installed
+    for several architectures are listed under their name and under
+    ``name:arch``; the plain name maps to an installed entry if there
+    is one.
+
+    :returns: ``{str: (status, version)}``, e.g. ``{'apt':
+      ('install ok installed', '0.8.16')}``
+    """
+    packages = {}
+    def add(fields):
+        name = fields.get('Package')
+        if not name:
+            return
+        entry = (fields.get('Status', ''), fields.get('Version', ''))
+        if 'Architecture' in fields:
+            packages['%s:%s'%(name, fields['Architecture'])] = entry
+        if name not in packages or _is_installed_status(entry[0]):
+            packages[name] = entry
+    fields = {}
+    for line in text.split('\n'):
+        if not line.strip():
+            add(fields)
+            fields = {}
+        elif line[0] not in ' \t' and ':' in line:
+            key, value = line.split(':', 1)
+            if key in ('Package', 'Status', 'Version', 'Architecture'):
+                fields[key] = value.strip()
+    add(fields)
+    return packages
+
+def get_dpkg_status(status_file=None):
+    """
+    Get snapshot of the dpkg status database.  The database is read
+    once and read again only after its modification time or size
+    changes.
+
+    :param status_file: defaults to ``DPKG_STATUS_FILE``
+    :returns: ``{str: (status, version)}``, see
+      :func:`parse_dpkg_status`
+    :raises: :exc:`IOError` if the database cannot be read
+    """
+    global _dpkg_status_cache
+    if status_file is None:
+        status_file = DPKG_STATUS_FILE
+    with _dpkg_status_lock:
+        try:
+            s = os.stat(status_file)
+        except OSError as e:
+            raise IOError(str(e))
+        cache = _dpkg_status_cache
+        if cache is not None and cache[:3] == (status_file, s.st_mtime, s.st_size):
+            return cache[3]
+        with open(status_file) as f:
+            packages = parse_dpkg_status(f.read())
+        _dpkg_status_cache = (status_file, s.st_mtime, s.st_size, packages)
+        return packages
+
 def dpkg_detect(pkgs, exec_fn=None):
     """ 
     Given a list of package, return the list of installed packages.
+    Unless *exec_fn* is set, install state is looked up in a snapshot
+    of the dpkg status database (see :func:`get_dpkg_status`), falling
+    back to ``dpkg-query`` if the database cannot be read.
 
     :param exec_fn: function to execute Popen and read stdout (for testing)
     """
@@ -78,6 +155,16 @@ def dpkg_detect(pkgs, exec_fn=None):
             version_lock_map[p.split('=')[0]] = p
         else:
             version_lock_map[p] = p
+
+    if exec_fn is None:
+        try:
+            status = get_dpkg_status()
+        except IOError:
+            # no status database, ask dpkg-query
+            pass
+        else:
+            return [p for p in pkgs if _is_installed_status(status.get(p.split('=')[0], ('', ''))[0])]
+
     cmd = ['dpkg-query', '-W', '-f=\'${Package} ${Status}\n\'']
     cmd.extend(version_lock_map.keys())
 
@@ -104,7 +191,8 @@ class AptInstaller(PackageManagerInstaller):
         packages = self.get_packages_to_install(resolved, reinstall=reinstall)
         if not packages:
             return []
+        # install all packages in one run of apt-get
         if not interactive:
-            return [['sudo', 'apt-get', 'install', '-y', p] for p in packages]
+            return [['sudo', 'apt-get', 'install', '-y'] + packages]
         else:
-            return [['sudo', 'apt-get', 'install', p] for p in packages]
+            return [['sudo', 'apt-get', 'install'] + packages]
@@ -30,18 +30,35 @@
 from __future__ import print_function
 
 import os
-import urllib
+import shutil
+import tempfile
+import time
 import urllib2
 import hashlib
 
 import yaml
 
-from ..core import rd_debug, InvalidData
+from ..core import rd_debug, InvalidData, parallel_map
+from .. import yaml_utils
 from ..installers import PackageManagerInstaller, InstallFailed
-from ..shell_utils import create_tempfile_from_string_and_execute
+from ..shell_utils import create_tempfile_from_string_and_execute, execute_string_script
 
 SOURCE_INSTALLER='source'
 
+# maximum number of rdmanifests to download at the same time
+DEFAULT_PREFETCH_JOBS = 8
+# maximum number of check-presence-scripts to run at the same time
+DEFAULT_CHECK_PRESENCE_JOBS = 8
+
+# name of the rdmanifest cache directory inside the sources cache
+RDMANIFEST_CACHE_DIR = 'rdmanifests'
+# seconds a cached rdmanifest without md5sum is used without
+# downloading it again
+DEFAULT_RDMANIFEST_CACHE_TTL = 24 * 60 * 60
+# name of the directory inside the sources cache that tarballs with
+# md5sum are cached in, named by their md5sum
+TARBALL_CACHE_DIR = 'tarballs'
+
 def register_installers(context):
     context.set_installer(SOURCE_INSTALLER, SourceInstaller())
 
@@ -103,7 +120,7 @@ def load_rdmanifest(contents):
     :raises: :exc:`InvalidRdmanifest`
     """
     try:
-        return yaml.load(contents)
+        return yaml_utils.load(contents)
     except yaml.scanner.ScannerError as ex:
         raise InvalidRdmanifest("Failed to parse yaml in %s:  Error: %s"%(contents, ex))
     
@@ -118,6 +135,17 @@ def download_rdmanifest(url, md5sum, alt_url=None):
     :raises: :exc:`DownloadFailed`
     :raises: :exc:`InvalidRdmanifest`
     """
+    contents, download_url = _fetch_rdmanifest(url, md5sum, alt_url)
+    manifest = load_rdmanifest(contents)
+    return manifest, download_url
+
+def _fetch_rdmanifest(url, md5sum, alt_url=None):
+    """
+    Sub-routine of :func:`download_rdmanifest`
+
+    :returns: (text of rdmanifest, download_url)
+    :raises: :exc:`DownloadFailed`
+    """
     # fetch the manifest
     download_url = url
     error_prefix = "Failed to load a rdmanifest from %s: "%(url)
@@ -129,8 +157,59 @@ def download_rdmanifest(url, md5sum, alt_url=None):
         contents, error = fetch_file(download_url, md5sum)
     if not contents:
         raise DownloadFailed(error_prefix + error)
-    manifest = load_rdmanifest(contents)
-    return manifest, download_url
+    return contents, download_url
+
+def _makedirs(path):
+    if not os.path.exists(path):
+        try:
+            os.makedirs(path)
+        except OSError:
+            # created concurrently
+            if not os.path.isdir(path):
+                raise
+
+def get_cached_rdmanifest_path(cache_dir, url):
+    # imported here as sources_list indirectly imports this module
+    from ..sources_list import compute_filename_hash
+    return os.path.join(cache_dir, compute_filename_hash(url))
+
+def load_cached_rdmanifest(cache_dir, url, md5sum=None, ttl=DEFAULT_RDMANIFEST_CACHE_TTL):
+    """
+    Load the text of the rdmanifest downloaded from *url* from the
+    on-disk cache.  If *md5sum* is given, the cached text is used if
+    it matches, regardless of its age.  Otherwise it is used if it is
+    younger than *ttl* seconds.
+
+    :param ttl: maximum age of a cached rdmanifest without
+      *md5sum* in seconds, or ``None`` to accept any age.
+    :returns: text of the rdmanifest, or ``None`` if there is no
+      usable cache entry
+    """
+    filepath = get_cached_rdmanifest_path(cache_dir, url)
+    try:
+        mtime = os.stat(filepath).st_mtime
+        with open(filepath, 'rb') as f:
+            contents = f.read()
+    except (IOError, OSError):
+        return None
+    if md5sum:
+        if hashlib.md5(contents).hexdigest() != md5sum:
+            return None
+    elif ttl is not None and time.time() - mtime > ttl:
+        return None
+    return contents
+
+def write_cached_rdmanifest(cache_dir, url, contents):
+    """
+    Store the text of the rdmanifest downloaded from *url* in the
+    on-disk cache.
+
+    :raises: :exc:`OSError` if cannot write to cache directory
+    :raises: :exc:`IOError` if cannot write to cache directory
+    """
+    from ..sources_list import write_atomic
+    _makedirs(cache_dir)
+    write_atomic(get_cached_rdmanifest_path(cache_dir, url), contents, binary=True)
 
 #TODO: create SourceInstall instance objects
 class SourceInstall(object):
@@ -164,17 +243,87 @@ class SourceInstall(object):
     def __str__(self):
         return "source: %s"%(self.manifest_url)
     
-def is_source_installed(source_item, exec_fn=None):
-    return create_tempfile_from_string_and_execute(source_item.check_presence_command, exec_fn=exec_fn)
+def is_source_installed(source_item, exec_fn=None, verbose=False):
+    """
+    Run the check-presence-script of *source_item*.
+
+    :param exec_fn: override subprocess.call with alternate executor
+      (for testing).  The script is executed from a temporary file then.
+    :param verbose: print the script and its output
+    """
+    if exec_fn is not None:
+        return create_tempfile_from_string_and_execute(source_item.check_presence_command, exec_fn=exec_fn)
+    return execute_string_script(source_item.check_presence_command, verbose=verbose)
             
-def source_detect(pkgs, exec_fn=None):
-    return [x for x in pkgs if is_source_installed(x, exec_fn=exec_fn)]
+def source_detect(pkgs, exec_fn=None, jobs=None, verbose=False):
+    """
+    :param jobs: maximum number of check-presence-scripts to run at
+      the same time.  Defaults to ``DEFAULT_CHECK_PRESENCE_JOBS``.
+    :returns: items of *pkgs* whose check-presence-script succeeds
+    """
+    if jobs is None:
+        jobs = DEFAULT_CHECK_PRESENCE_JOBS
+    installed = parallel_map(lambda x: is_source_installed(x, exec_fn=exec_fn, verbose=verbose), pkgs, jobs=jobs)
+    return [x for x, is_installed in zip(pkgs, installed) if is_installed]
 
 class SourceInstaller(PackageManagerInstaller):
 
-    def __init__(self):
-        super(SourceInstaller, self).__init__(source_detect, supports_depends=True)
+    def __init__(self, rdmanifest_cache_dir=None, rdmanifest_cache_ttl=DEFAULT_RDMANIFEST_CACHE_TTL):
+        """
+        :param rdmanifest_cache_dir: directory to cache downloaded
+          rdmanifests in across processes, or ``None`` to only cache
+          them in memory, see :func:`load_cached_rdmanifest`
+        :param rdmanifest_cache_ttl: maximum age of cached
+          rdmanifests without md5sum in seconds
+        """
+        super(SourceInstaller, self).__init__(self._detect, supports_depends=True)
         self._rdmanifest_cache = {}
+        self.rdmanifest_cache_dir = rdmanifest_cache_dir
+        self.rdmanifest_cache_ttl = rdmanifest_cache_ttl
+        # sources cache passed to rosdep-source for caching tarballs,
+        # or None to use its default
+        self.sources_cache_dir = None
+        # print check-presence-scripts and their output
+        self.verbose = False
+
+    def _detect(self, pkgs):
+        return source_detect(pkgs, verbose=self.verbose)
+
+    def _download_rdmanifest(self, url, md5sum, alt_url):
+        """
+        Like :func:`download_rdmanifest`, but use the rdmanifests
+        cached in ``rdmanifest_cache_dir``, if set, and store
+        downloaded ones there.  Outdated cache entries are used if the
+        download fails.
+        """
+        cache_dir = self.rdmanifest_cache_dir
+        if cache_dir is None:
+            return download_rdmanifest(url, md5sum, alt_url)
+
+        def load_cached(ttl):
+            for cache_url in [url, alt_url]:
+                if cache_url:
+                    contents = load_cached_rdmanifest(cache_dir, cache_url, md5sum, ttl)
+                    if contents is not None:
+                        rd_debug("Using cached manifest [%s]"%(cache_url))
+                        return load_rdmanifest(contents), cache_url
+            return None
+        cached = load_cached(self.rdmanifest_cache_ttl)
+        if cached is not None:
+            return cached
+        try:
+            contents, download_url = _fetch_rdmanifest(url, md5sum, alt_url)
+        except DownloadFailed:
+            cached = load_cached(None)
+            if cached is None:
+                raise
+            return cached
+        manifest = load_rdmanifest(contents)
+        try:
+            write_cached_rdmanifest(cache_dir, download_url, contents)
+        except (IOError, OSError) as ex:
+            rd_debug("Failed to cache manifest [%s]: %s"%(download_url, ex))
+        return manifest, download_url
     
     def resolve(self, rosdep_args):
         """
@@ -192,12 +341,12 @@ class SourceInstaller(PackageManagerInstaller):
         # load manifest from cache or from web
         manifest = None
         if url in self._rdmanifest_cache:
-            return self._rdmanifest_cache[url]
+            return [self._rdmanifest_cache[url]]
         elif alt_url in self._rdmanifest_cache:
-            return self._rdmanifest_cache[alt_url]
+            return [self._rdmanifest_cache[alt_url]]
         try:
             rd_debug("Downloading manifest [%s], mirror [%s]"%(url, alt_url))
-            manifest, download_url = download_rdmanifest(url, md5sum, alt_url)
+            manifest, download_url = self._download_rdmanifest(url, md5sum, alt_url)
             resolved = SourceInstall.from_manifest(manifest, download_url)
             self._rdmanifest_cache[download_url] = resolved
             return [resolved]
@@ -207,6 +356,43 @@ class SourceInstaller(PackageManagerInstaller):
         except InvalidRdmanifest as ex:
             raise InvalidData(str(ex))
 
+    def prefetch_resolve(self, rosdep_args_list, jobs=None):
+        """
+        Download the rdmanifests of *rosdep_args_list* that are not
+        cached yet concurrently, falling back to their alternate URLs.
+        Failed downloads are not cached, so :meth:`resolve` reports
+        them.
+
+        :param jobs: maximum number of rdmanifests to download at the
+          same time.  Defaults to ``DEFAULT_PREFETCH_JOBS``.
+        """
+        downloads = []
+        urls = set()
+        for rosdep_args in rosdep_args_list:
+            url = rosdep_args.get("uri")
+            alt_url = rosdep_args.get("alternate-uri", None)
+            if not url or url in urls or url in self._rdmanifest_cache or alt_url in self._rdmanifest_cache:
+                continue
+            urls.add(url)
+            downloads.append((url, rosdep_args.get("md5sum", None), alt_url))
+        if not downloads:
+            return
+
+        def download(args):
+            url, md5sum, alt_url = args
+            try:
+                rd_debug("Prefetching manifest [%s], mirror [%s]"%(url, alt_url))
+                manifest, download_url = self._download_rdmanifest(url, md5sum, alt_url)
+                return SourceInstall.from_manifest(manifest, download_url), download_url
+            except (DownloadFailed, InvalidRdmanifest) as ex:
+                rd_debug("Prefetch of manifest [%s] failed: %s"%(url, ex))
+                return None, None
+        if jobs is None:
+            jobs = DEFAULT_PREFETCH_JOBS
+        for resolved, download_url in parallel_map(download, downloads, jobs=jobs):
+            if resolved is not None:
+                self._rdmanifest_cache[download_url] = resolved
+
     def get_install_command(self, resolved, interactive=True, reinstall=False):
         # Instead of attempting to describe the source-install steps
         # inside of the rosdep command chain, we shell out to an
@@ -216,55 +402,156 @@ class SourceInstaller(PackageManagerInstaller):
         packages = self.get_packages_to_install(resolved, reinstall=reinstall)
         commands = []
         for p in packages:
-            commands.append(['rosdep-source', 'install', p.manifest_url])
+            if self.sources_cache_dir is None:
+                commands.append(['rosdep-source', 'install', p.manifest_url])
+            else:
+                commands.append(['rosdep-source', 'install', '-c', self.sources_cache_dir, p.manifest_url])
         return commands
 
     def get_depends(self, rosdep_args): 
         return rosdep_args.get('depends', [])
 
-def install_from_file(rdmanifest_file):
+def install_from_file(rdmanifest_file, tarball_cache_dir=None):
     with open(rdmanifest_file, 'r') as f:
         contents = f.read()
     manifest = load_rdmanifest(contents)
-    install_source(SourceInstall.from_manifest(manifest, rdmanifest_file))
+    install_source(SourceInstall.from_manifest(manifest, rdmanifest_file), tarball_cache_dir)
     
-def install_from_url(rdmanifest_url):
+def install_from_url(rdmanifest_url, tarball_cache_dir=None):
     manifest, download_url = download_rdmanifest(rdmanifest_url, None, None)
-    install_source(SourceInstall.from_manifest(manifest, download_url))
+    install_source(SourceInstall.from_manifest(manifest, download_url), tarball_cache_dir)
 
-def install_source(resolved):
-    import shutil
+def _download_tarball(url, filename):
+    """
+    Download *url* to *filename*, computing the MD5 sum of the data
+    while it is written.
+
+    :returns: MD5 sum of the downloaded file
+    :raises: :exc:`DownloadFailed`
+    """
+    from ..sources_list import DOWNLOAD_CHUNK_SIZE
+    md5 = hashlib.md5()
+    try:
+        fh = urllib2.urlopen(url)
+        try:
+            with open(filename, 'wb') as f:
+                for chunk in iter(lambda: fh.read(DOWNLOAD_CHUNK_SIZE), b''):
+                    md5.update(chunk)
+                    f.write(chunk)
+        finally:
+            fh.close()
+    except (urllib2.URLError, IOError) as ex:
+        raise DownloadFailed(str(ex))
+    return md5.hexdigest()
+
+def _copy_file_hash(src, dst):
+    """
+    Copy *src* to *dst*, computing the MD5 sum of the data while it
+    is written.
+
+    :returns: MD5 sum of *src*
+    :raises: :exc:`IOError` if *src* cannot be read or *dst* written
+    """
+    from ..sources_list import DOWNLOAD_CHUNK_SIZE
+    md5 = hashlib.md5()
+    with open(src, 'rb') as f_src:
+        with open(dst, 'wb') as f_dst:
+            for chunk in iter(lambda: f_src.read(DOWNLOAD_CHUNK_SIZE), b''):
+                md5.update(chunk)
+                f_dst.write(chunk)
+    return md5.hexdigest()
+
+def _add_to_tarball_cache(filename, cache_path):
+    """
+    Copy the verified tarball *filename* to *cache_path* atomically.
+
+    :raises: :exc:`OSError` if cannot write to cache directory
+    :raises: :exc:`IOError` if cannot write to cache directory
+    """
+    from ..sources_list import _replace_file
+    cache_dir = os.path.dirname(cache_path)
+    _makedirs(cache_dir)
+    fd, filepath_tmp = tempfile.mkstemp(prefix=os.path.basename(cache_path) + '.tmp.', dir=cache_dir)
+    os.close(fd)
+    try:
+        shutil.copyfile(filename, filepath_tmp)
+    except:
+        os.unlink(filepath_tmp)
+        raise
+    _replace_file(filepath_tmp, cache_path)
+
+def fetch_tarball(resolved, filename, tarball_cache_dir=None):
+    """
+    Store the tarball of *resolved* in *filename*.  The alternate
+    tarball is downloaded if the download of the tarball fails or
+    its md5sum does not match.  Tarballs with md5sum are taken from
+    *tarball_cache_dir* if it contains them and added to it after
+    downloading.
+
+    :param tarball_cache_dir: directory of tarballs named by their
+      md5sum, or ``None`` to always download.  Cached tarballs that do
+      not match their md5sum are removed.
+    :raises: :exc:`InstallFailed`
+    """
+    md5sum = resolved.tarball_md5sum
+    cache_path = None
+    if tarball_cache_dir and md5sum:
+        cache_path = os.path.join(tarball_cache_dir, md5sum)
+        if os.path.isfile(cache_path):
+            try:
+                filehash = _copy_file_hash(cache_path, filename)
+            except IOError as ex:
+                raise InstallFailed((SOURCE_INSTALLER, "failed to copy cached tarball %s: %s"%(cache_path, ex)))
+            if filehash == md5sum:
+                rd_debug("Using cached tarball [%s]"%(cache_path))
+                return
+            rd_debug("Removing corrupt cached tarball [%s]"%(cache_path))
+            try:
+                os.unlink(cache_path)
+            except OSError:
+                pass
+
+    errors = []
+    for url in [resolved.tarball, resolved.alternate_tarball]:
+        if not url:
+            continue
+        rd_debug("Fetching tarball %s"%(url))
+        try:
+            filehash = _download_tarball(url, filename)
+        except DownloadFailed as ex:
+            errors.append("download of %s failed: %s"%(url, ex))
+            continue
+        if not md5sum:
+            rd_debug("No md5sum defined for tarball, not checking.")
+            return
+        if filehash == md5sum:
+            break
+        errors.append("md5sum check on %s failed.  Expected %s got %s"%(url, md5sum, filehash))
+    else:
+        raise InstallFailed((SOURCE_INSTALLER, '\n'.join(errors)))
+
+    if cache_path is not None:
+        try:
+            _add_to_tarball_cache(filename, cache_path)
+        except (IOError, OSError) as ex:
+            rd_debug("Failed to cache tarball [%s]: %s"%(cache_path, ex))
+
+def install_source(resolved, tarball_cache_dir=None):
+    """
+    :param tarball_cache_dir: directory to cache tarballs with
+      md5sum in, see :func:`fetch_tarball`
+    :raises: :exc:`InstallFailed`
+    """
     import tarfile
-    import tempfile
 
     tempdir = tempfile.mkdtemp()
     rd_debug("created tmpdir [%s]"%(tempdir))
 
-    rd_debug("Fetching tarball %s"%resolved.tarball)
-
-    # compute desired download path
-    filename = os.path.join(tempdir, os.path.basename(resolved.tarball))
-    f = urllib.urlretrieve(resolved.tarball, filename)
-    assert f[0] == filename
-
-    if resolved.tarball_md5sum:
-        rd_debug("checking md5sum on tarball")
-        hash1 = get_file_hash(filename)
-        if resolved.tarball_md5sum != hash1:
-            #try backup tarball if it is defined
-            if resolved.alternate_tarball:
-                f = urllib.urlretrieve(resolved.alternate_tarball)
-                filename = f[0]
-                hash2 = get_file_hash(filename)
-                if resolved.tarball_md5sum != hash2:
-                    failure = (SOURCE_INSTALLER, "md5sum check on %s and %s failed.  Expected %s got %s and %s"%(resolved.tarball, resolved.alternate_tarball, resolved.tarball_md5sum, hash1, hash2))
-                    raise InstallFailed(failure=failure)
-            else:
-                raise InstallFailed((SOURCE_INSTALLER, "md5sum check on %s failed.  Expected %s got %s "%(resolved.tarball, resolved.tarball_md5sum, hash1)))
-    else:
-        rd_debug("No md5sum defined for tarball, not checking.")
-
     try:
+        # compute desired download path
+        filename = os.path.join(tempdir, os.path.basename(resolved.tarball))
+        fetch_tarball(resolved, filename, tarball_cache_dir)
+
         # This is a bit hacky.  Basically, don't unpack dmg files as
         # we are currently using source rosdeps for Nvidia Cg.
         if not filename.endswith('.dmg'):
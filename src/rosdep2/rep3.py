@@ -26,9 +26,9 @@
 # POSSIBILITY OF SUCH DAMAGE.
 
 import urllib2
-import yaml
 
 from .core import DownloadFailure
+from . import yaml_utils
 
 # location of targets file for processing gbpdistro files
 REP3_TARGETS_URL = 'https://raw.github.com/ros/rosdistro/master/releases/targets.yaml'
@@ -51,7 +51,7 @@ def download_targets_data(targets_url=None):
         f = urllib2.urlopen(targets_url, timeout=DOWNLOAD_TIMEOUT)
         text = f.read()
         f.close()
-        targets_data = yaml.safe_load(text)
+        targets_data = yaml_utils.load(text)
     except Exception as e:
         raise DownloadFailure("Failed to download target platform data for gbpdistro:\n\t%s"%(str(e)))
     if type(targets_data) == list:
@@ -0,0 +1,184 @@
+# Copyright (c) 2012, Willow Garage, Inc.
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the Willow Garage, Inc. nor the names of its
+#       contributors may be used to endorse or promote products derived from
+#       this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+Table of rosdep keys resolved ahead of time for a single OS, OS
+version and installer order.  'rosdep compile' writes the table to
+the sources cache so that :meth:`RosdepLookup.resolve` can answer
+most keys without evaluating their rules.
+"""
+
+import os
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from .core import InvalidData, UnsupportedOs
+from .lookup import ResolutionError, DYNAMIC_INSTALLER_KEYS
+from .rospkg_loader import DEFAULT_VIEW_KEY
+from .sources_list import compute_sources_signature, compute_filename_hash, write_atomic
+
+RESOLUTION_TABLE_PREFIX = 'resolutions-'
+# bump on incompatible format changes
+RESOLUTION_TABLE_FORMAT_VERSION = 1
+
+class ResolutionTable(object):
+    """
+    Resolutions of the rosdep keys of a single view for one OS
+    configuration.
+    """
+
+    def __init__(self, os_name, os_version, installer_keys, default_key,
+                 view_name, signature, resolutions):
+        """
+        :param installer_keys: installer keys of *os_name* in order of
+          precedence, ``[str]``
+        :param default_key: default installer key of *os_name*
+        :param view_name: name of view the keys were resolved in
+        :param signature: signature of the sources the view was
+          created from, see :func:`compute_sources_signature`
+        :param resolutions: ``{str: (installer_key, resolution, dependencies)}``
+        """
+        self.os_name = os_name
+        self.os_version = os_version
+        self.installer_keys = installer_keys
+        self.default_key = default_key
+        self.view_name = view_name
+        self.signature = signature
+        self.resolutions = resolutions
+
+    def get(self, rosdep_key, view_name, os_name, os_version):
+        """
+        :returns: *(installer_key, resolution, dependencies)* of
+          *rosdep_key*, as returned by :meth:`RosdepLookup.resolve`,
+          or ``None`` if the table does not cover it.
+        """
+        if view_name != self.view_name or os_name != self.os_name or os_version != self.os_version:
+            return None
+        return self.resolutions.get(rosdep_key)
+
+def _get_os_installer_keys(installer_context):
+    """
+    :returns: os_name, os_version, installer_keys, default_key
+    :raises: :exc:`UnsupportedOs`
+    """
+    os_name, os_version = installer_context.get_os_name_and_version()
+    try:
+        installer_keys = installer_context.get_os_installer_keys(os_name)
+        default_key = installer_context.get_default_os_installer_key(os_name)
+    except KeyError:
+        raise UnsupportedOs(os_name, installer_context.get_os_keys())
+    return os_name, os_version, installer_keys, default_key
+
+def create_resolution_table(lookup, installer_context, view_name=DEFAULT_VIEW_KEY):
+    """
+    Resolve all keys of a view of *lookup* for the OS of
+    *installer_context*.  Keys that cannot be resolved, or that
+    resolve to one of :data:`DYNAMIC_INSTALLER_KEYS`, are left out
+    and will be resolved live.
+
+    :param lookup: :class:`RosdepLookup` with a sources loader
+    :returns: :class:`ResolutionTable`
+    :raises: :exc:`UnsupportedOs` if the OS has no installers
+    """
+    os_name, os_version, installer_keys, default_key = _get_os_installer_keys(installer_context)
+    sources_loader = lookup.sources_loader
+    signature = compute_sources_signature(sources_loader.sources_cache_dir, sources_loader.sources)
+
+    view = lookup.get_rosdep_view(view_name)
+    resolutions = {}
+    for rosdep_key in view.keys():
+        definition = view.lookup(rosdep_key)
+        try:
+            installer_key, rosdep_args_dict = definition.get_rule_for_platform(os_name, os_version, installer_keys, default_key)
+            if installer_key in DYNAMIC_INSTALLER_KEYS:
+                continue
+            installer = installer_context.get_installer(installer_key)
+            resolutions[rosdep_key] = installer_key, installer.resolve(rosdep_args_dict), installer.get_depends(rosdep_args_dict)
+        except (ResolutionError, InvalidData, KeyError):
+            # live resolution reports the error
+            continue
+    return ResolutionTable(os_name, os_version, installer_keys, default_key, view_name, signature, resolutions)
+
+def get_resolution_table_path(sources_cache_dir, tags, os_name, os_version):
+    """
+    :returns: path of resolution table for sources matching *tags*
+      resolved for *os_name* and *os_version*
+    """
+    key = ' '.join(sorted(tags) + [os_name, os_version])
+    return os.path.join(sources_cache_dir, RESOLUTION_TABLE_PREFIX + compute_filename_hash(key))
+
+def write_resolution_table(sources_loader, table):
+    """
+    :param sources_loader: :class:`SourcesListLoader` the table was
+      created from
+    :returns: path of written table
+    :raises: :exc:`OSError` if cannot write to cache file/directory
+    """
+    filepath = get_resolution_table_path(sources_loader.sources_cache_dir, sources_loader.tags,
+                                         table.os_name, table.os_version)
+    data = (RESOLUTION_TABLE_FORMAT_VERSION, table.os_name, table.os_version, table.installer_keys,
+            table.default_key, table.view_name, table.signature, table.resolutions)
+    write_atomic(filepath, pickle.dumps(data, 2), binary=True)
+    return filepath
+
+def load_resolution_table(sources_loader, installer_context):
+    """
+    Load the resolution table for the OS of *installer_context*.
+
+    :param sources_loader: :class:`SourcesListLoader` providing the
+      sources of the table
+    :returns: :class:`ResolutionTable`, or ``None`` if there is no
+      table, or it is out of date with the sources or the installer
+      configuration.
+    """
+    if sources_loader is None or sources_loader.sources_cache_dir is None or sources_loader.tags is None:
+        return None
+    try:
+        os_name, os_version, installer_keys, default_key = _get_os_installer_keys(installer_context)
+    except UnsupportedOs:
+        return None
+    filepath = get_resolution_table_path(sources_loader.sources_cache_dir, sources_loader.tags, os_name, os_version)
+    if not os.path.isfile(filepath):
+        return None
+    try:
+        with open(filepath, 'rb') as f:
+            data = pickle.load(f)
+    except Exception:
+        # unreadable table: resolve live
+        return None
+    if not isinstance(data, tuple) or data[0] != RESOLUTION_TABLE_FORMAT_VERSION:
+        return None
+    table = ResolutionTable(*data[1:])
+    if table.installer_keys != installer_keys or table.default_key != default_key:
+        return None
+    if table.signature != compute_sources_signature(sources_loader.sources_cache_dir, sources_loader.sources):
+        return None
+    return table
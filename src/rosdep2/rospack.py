@@ -38,7 +38,7 @@ import subprocess
 
 from .main import _get_default_RosdepLookup
 from .rospkg_loader import DEFAULT_VIEW_KEY
-from .sources_list import get_sources_cache_dir
+from .sources_list import get_sources_cache_dir, SourcesListLoader
 
 
 def call_pkg_config(option, pkg_name):
@@ -47,6 +47,12 @@ def call_pkg_config(option, pkg_name):
 
 
 def init_rospack_interface():
+    # the key index written by 'rosdep update' answers single-key
+    # lookups without loading all rosdep definitions
+    key_index = SourcesListLoader.create_default(sources_cache_dir=get_sources_cache_dir()).get_key_index()
+    if key_index is not None:
+        return key_index
+
     class Options(object):
         def __init__(self):
             self.os_override = None
@@ -57,7 +63,7 @@ def init_rospack_interface():
 
 
 def is_view_empty(view):
-    return len(view.rosdep_defs) == 0
+    return len(view) == 0
 
 
 def is_ros_package(view, rosdep_name):
@@ -34,6 +34,10 @@ filesystem.
 
 from __future__ import print_function
 
+import hashlib
+import multiprocessing
+import os
+
 import catkin_pkg.package
 import rospkg
 
@@ -54,6 +58,34 @@ DEFAULT_VIEW_KEY='*default*'
 # resources and SourcesListLoader would build a *single* view that was
 # no longer resource-dependent.
 
+# minimum number of package.xml files to parse before prefetching
+# them in a process pool
+PREFETCH_PROCESS_THRESHOLD = 32
+
+def _parse_catkin_rosdeps(data, filename):
+    """
+    :param data: package.xml contents, ``bytes``
+    :returns: rosdep keys of package, ``[str]``
+    :raises: :exc:`catkin_pkg.package.InvalidPackage`
+    """
+    pkg = catkin_pkg.package.parse_package_string(data.decode('utf-8'), filename)
+    deps = pkg.build_depends + pkg.buildtool_depends + pkg.run_depends
+    return [d.name for d in deps]
+
+def _prefetch_catkin_rosdeps(args):
+    """
+    Process pool variant of :func:`_parse_catkin_rosdeps`.
+
+    :param args: (package.xml contents, filename)
+    :returns: rosdep keys of package, or ``None`` if the package is
+      invalid
+    """
+    try:
+        return _parse_catkin_rosdeps(*args)
+    except Exception:
+        # reported when the package is loaded with get_rosdeps()
+        return None
+
 class RosPkgLoader(RosdepLoader):
     
     def __init__(self, rospack=None, rosstack=None, underlay_key=None):
@@ -73,6 +105,13 @@ class RosPkgLoader(RosdepLoader):
         
         # cache computed list of loadable resources
         self._loadable_resource_cache = None
+
+        # rosdep keys of catkin packages by sha1 of package.xml
+        # content, ``{str: [str]}``.  Can be persisted by the caller.
+        self.rosdeps_cache = {}
+        # sha1 of package.xml files by path, with the (mtime, size)
+        # it was computed for, ``{str: ((float, int), str)}``
+        self._manifest_hashes = {}
         
     def load_view(self, view_name, rosdep_db, verbose=False):
         """
@@ -128,9 +167,14 @@ class RosPkgLoader(RosdepLoader):
             m = self._rospack.get_manifest(resource_name)
             if m.is_catkin:
                 path = self._rospack.get_path(resource_name)
-                pkg = catkin_pkg.package.parse_package(path)
-                deps = pkg.build_depends + pkg.buildtool_depends + pkg.run_depends
-                return [d.name for d in deps]
+                filename = os.path.join(path, catkin_pkg.package.PACKAGE_MANIFEST_FILENAME)
+                key, data = self._read_package_manifest(filename)
+                if key not in self.rosdeps_cache:
+                    if data is None:
+                        with open(filename, 'rb') as f:
+                            data = f.read()
+                    self.rosdeps_cache[key] = _parse_catkin_rosdeps(data, filename)
+                return list(self.rosdeps_cache[key])
             else:
                 return self._rospack.get_rosdeps(resource_name, implicit=implicit)
         elif resource_name in self._rosstack.list():
@@ -139,6 +183,71 @@ class RosPkgLoader(RosdepLoader):
         else:
             raise rospkg.ResourceNotFound(resource_name)
 
+    def _read_package_manifest(self, filename):
+        """
+        Compute the ``rosdeps_cache`` key of package.xml *filename*.
+        The file is only read and hashed again if its modification
+        time or size changed since the last call.
+
+        :returns: (sha1 of *filename*, content of *filename*).  The
+          content is ``None`` if the sha1 was known.
+        :raises: :exc:`IOError` :exc:`OSError` if *filename* cannot be read
+        """
+        st = os.stat(filename)
+        stat_key = (st.st_mtime, st.st_size)
+        known = self._manifest_hashes.get(filename)
+        if known is not None and known[0] == stat_key:
+            return known[1], None
+        with open(filename, 'rb') as f:
+            data = f.read()
+        key = hashlib.sha1(data).hexdigest()
+        self._manifest_hashes[filename] = (stat_key, key)
+        return key, data
+
+    def prefetch_rosdeps(self, resource_names, implicit=True):
+        """
+        Parse the package.xml files of the catkin packages in
+        *resource_names* that are not cached yet, using a process pool
+        if there are at least ``PREFETCH_PROCESS_THRESHOLD`` of them.
+        """
+        loadable = set(self.get_loadable_resources())
+        todo = {}
+        for resource_name in resource_names:
+            if resource_name not in loadable:
+                continue
+            filename = os.path.join(self._rospack.get_path(resource_name), catkin_pkg.package.PACKAGE_MANIFEST_FILENAME)
+            try:
+                key, data = self._read_package_manifest(filename)
+            except (IOError, OSError):
+                # not a catkin package
+                continue
+            if key not in self.rosdeps_cache:
+                if data is None:
+                    with open(filename, 'rb') as f:
+                        data = f.read()
+                todo[key] = (data, filename)
+        if not todo:
+            return
+        keys = list(todo.keys())
+        args = [todo[k] for k in keys]
+        results = None
+        if len(args) >= PREFETCH_PROCESS_THRESHOLD:
+            try:
+                pool = multiprocessing.Pool(min(multiprocessing.cpu_count(), len(args)))
+                try:
+                    results = pool.map(_prefetch_catkin_rosdeps, args)
+                finally:
+                    pool.close()
+                    pool.join()
+            except OSError:
+                # no process support (e.g. missing /dev/shm), parse here
+                results = None
+        if results is None:
+            results = [_prefetch_catkin_rosdeps(a) for a in args]
+        for key, rosdeps in zip(keys, results):
+            if rosdeps is not None:
+                self.rosdeps_cache[key] = rosdeps
+
     def get_view_key(self, resource_name):
         """
         Map *resource_name* to a view key.  In rospkg, this maps the
@@ -0,0 +1,215 @@
+# Copyright (c) 2012, Willow Garage, Inc.
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the Willow Garage, Inc. nor the names of its
+#       contributors may be used to endorse or promote products derived from
+#       this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+Server for answering rosdep commands from a long-running process that
+keeps lookups and installer contexts loaded between commands.  The
+``rosdep`` script forwards its command line to the server listening
+on ``$ROSDEP_SERVER_SOCKET`` if that variable is set.
+
+Protocol: the client connects to the Unix domain socket and sends a
+single line of JSON::
+
+  {"args": [command line], "env": {environment}, "cwd": working directory}
+
+The server runs the command with that environment and working
+directory and replies with a single line of JSON, either::
+
+  {"exit_code": int, "stdout": str, "stderr": str}
+
+or ``{"fallback": true}`` if the client should run the command
+itself.  Requests are served one at a time.
+"""
+
+from __future__ import print_function
+
+import json
+import os
+import socket
+import sys
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+import rospkg
+
+from . import main
+from .catkin_packages import set_workspace_packages
+
+# environment variable holding the path of the server socket
+SERVER_SOCKET_ENV = 'ROSDEP_SERVER_SOCKET'
+
+# commands answered by the server.  Others (e.g. 'install', which may
+# prompt, and 'update') are run by the client.
+SERVED_COMMANDS = ['check', 'keys', 'resolve', 'db',
+                   'what-needs', 'what_needs', 'where-defined', 'where_defined']
+
+def get_default_server_socket():
+    """
+    :returns: socket path from $ROSDEP_SERVER_SOCKET, or the default
+      path in the ROS home directory
+    """
+    if SERVER_SOCKET_ENV in os.environ:
+        return os.environ[SERVER_SOCKET_ENV]
+    return os.path.join(rospkg.get_ros_home(), 'rosdep', 'server.sock')
+
+def _native_str(value):
+    # json decodes to unicode on Python 2, rosdep expects str
+    if not isinstance(value, str):
+        value = value.encode('utf-8')
+    return value
+
+def _get_command(args):
+    """
+    :returns: rosdep command of command line *args*, or ``None`` if
+      *args* are invalid
+    """
+    stderr = sys.stderr
+    sys.stderr = StringIO()
+    try:
+        options, args = main._create_option_parser().parse_args(args)
+    except SystemExit:
+        return None
+    finally:
+        sys.stderr = stderr
+    if options.print_version or not args:
+        return None
+    return args[0]
+
+def handle_request(request):
+    """
+    Run a rosdep command in this process on behalf of a client.
+
+    :param request: ``{'args': [str], 'env': {str: str}, 'cwd': str}``
+    :returns: response, ``{'exit_code': int, 'stdout': str, 'stderr': str}``,
+      or ``{'fallback': True}`` if the command is not served
+    """
+    args = [_native_str(a) for a in request['args']]
+    if _get_command(args) not in SERVED_COMMANDS:
+        return {'fallback': True}
+
+    environ = dict(os.environ)
+    cwd = os.getcwd()
+    stdout, stderr = sys.stdout, sys.stderr
+    sys.stdout, sys.stderr = StringIO(), StringIO()
+    try:
+        os.environ.clear()
+        os.environ.update(dict([(_native_str(k), _native_str(v)) for k, v in request['env'].items()]))
+        try:
+            os.chdir(_native_str(request['cwd']))
+        except EnvironmentError:
+            # e.g. the working directory of the client does not exist
+            return {'fallback': True}
+        set_workspace_packages([])
+        try:
+            main.rosdep_main(args)
+            exit_code = 0
+        except SystemExit as e:
+            exit_code = e.code
+            if exit_code is None:
+                exit_code = 0
+            elif not isinstance(exit_code, int):
+                print(exit_code, file=sys.stderr)
+                exit_code = 1
+        return {'exit_code': exit_code, 'stdout': sys.stdout.getvalue(), 'stderr': sys.stderr.getvalue()}
+    finally:
+        sys.stdout, sys.stderr = stdout, stderr
+        os.environ.clear()
+        os.environ.update(environ)
+        os.chdir(cwd)
+
+def _serve_connection(conn, verbose=False):
+    f = conn.makefile('rb')
+    try:
+        line = f.readline()
+    finally:
+        f.close()
+    try:
+        request = json.loads(line.decode('utf-8'))
+        response = handle_request(request)
+    except (ValueError, KeyError, TypeError):
+        # malformed request, let the client run the command
+        response = {'fallback': True}
+    except Exception as e:
+        # keep serving other clients, the client reports the error
+        # when it runs the command itself
+        if verbose:
+            print("request failed: %s"%(e), file=sys.stderr)
+        response = {'fallback': True}
+    conn.sendall((json.dumps(response) + '\n').encode('utf-8'))
+
+def serve(socket_path, verbose=False):
+    """
+    Serve rosdep commands on Unix domain socket *socket_path* until
+    interrupted.
+
+    :raises: :exc:`socket.error` if *socket_path* cannot be bound
+    """
+    if os.path.exists(socket_path):
+        # remove stale socket, unless a server is listening on it
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(socket_path)
+        except socket.error:
+            os.remove(socket_path)
+        else:
+            raise socket.error("a server is already listening on %s"%(socket_path))
+        finally:
+            probe.close()
+    parent = os.path.dirname(socket_path)
+    if parent and not os.path.isdir(parent):
+        os.makedirs(parent)
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    # commands run with the environment sent by the client, so the
+    # socket must never be accessible to other users
+    umask = os.umask(0o077)
+    try:
+        server.bind(socket_path)
+    finally:
+        os.umask(umask)
+    server.listen(16)
+    main.set_caching(True)
+    try:
+        while True:
+            conn, _ = server.accept()
+            try:
+                _serve_connection(conn, verbose)
+            except socket.error as e:
+                if verbose:
+                    print("connection failed: %s"%(e), file=sys.stderr)
+            finally:
+                conn.close()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        main.set_caching(False)
+        server.close()
+        os.remove(socket_path)
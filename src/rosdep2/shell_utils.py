@@ -49,10 +49,14 @@ def read_stdout(cmd):
     else:
         return std_out    
 
-def create_tempfile_from_string_and_execute(string_script, path=None, exec_fn=None):
+# shells that execute a script passed on their command line with '-c'
+POSIX_SHELLS = ['sh', 'bash', 'dash', 'ksh', 'zsh']
+
+def create_tempfile_from_string_and_execute(string_script, path=None, exec_fn=None, verbose=True):
     """
     :param path: (optional) path to temp directory, or ``None`` to use default temp directory, ``str``
     :param exec_fn: override subprocess.call with alternate executor (for testing)
+    :param verbose: print the script before executing it
     """
     if path is None:
         path = tempfile.gettempdir()
@@ -62,7 +66,8 @@ def create_tempfile_from_string_and_execute(string_script, path=None, exec_fn=No
         fh = tempfile.NamedTemporaryFile('w', delete=False)
         fh.write(string_script)
         fh.close()
-        print("Executing script below with cwd=%s\n{{{\n%s\n}}}\n"%(path, string_script))
+        if verbose:
+            print("Executing script below with cwd=%s\n{{{\n%s\n}}}\n"%(path, string_script))
         try:
             os.chmod(fh.name, 0700)
             if exec_fn is None:
@@ -78,3 +83,75 @@ def create_tempfile_from_string_and_execute(string_script, path=None, exec_fn=No
     rd_debug("Return code was: %s"%(result))
     return result == 0
 
+def get_shell_command(string_script):
+    """
+    :returns: command line that executes *string_script* when it is
+      appended as the argument of ``-c``, if the interpreter of its
+      ``#!`` line is one of ``POSIX_SHELLS``, or ``None``.
+    """
+    lines = string_script.lstrip().splitlines()
+    if not lines or not lines[0].startswith('#!'):
+        return None
+    cmd = lines[0][2:].split()
+    if not cmd:
+        return None
+    shell = os.path.basename(cmd[0])
+    if shell == 'env' and len(cmd) > 1:
+        shell = cmd[1]
+    if shell not in POSIX_SHELLS:
+        return None
+    return cmd + ['-c']
+
+def execute_string_script(string_script, path=None, verbose=False):
+    """
+    Like :func:`create_tempfile_from_string_and_execute`, but pass
+    shell scripts to their shell on the command line instead of
+    writing them to a temporary file first.  Other scripts are still
+    executed from a temporary file.  The script reads its standard
+    input from ``/dev/null`` and its output is collected, so that
+    scripts run concurrently do not interleave their output.
+
+    :param path: (optional) working directory, or ``None`` to use default temp directory, ``str``
+    :param verbose: print the script and its output, which is
+      otherwise only shown in debug mode
+    :returns: ``True`` if the script exited with 0
+    """
+    if path is None:
+        path = tempfile.gettempdir()
+    if verbose:
+        print("Executing script below with cwd=%s\n{{{\n%s\n}}}\n"%(path, string_script))
+    else:
+        rd_debug("Executing script below with cwd=%s\n{{{\n%s\n}}}\n"%(path, string_script))
+
+    result = 1
+    tmp_name = None
+    try:
+        cmd = get_shell_command(string_script)
+        if cmd is not None:
+            cmd = cmd + [string_script]
+        else:
+            fh = tempfile.NamedTemporaryFile('w', delete=False)
+            tmp_name = fh.name
+            fh.write(string_script)
+            fh.close()
+            os.chmod(tmp_name, 0o700)
+            cmd = [tmp_name]
+        with open(os.devnull, 'r') as devnull:
+            p = subprocess.Popen(cmd, cwd=path, stdin=devnull,
+                                 stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            output, _ = p.communicate()
+        result = p.returncode
+        if python3:
+            output = output.decode()
+        if verbose:
+            print(output, end='')
+        elif output:
+            rd_debug(output)
+    except OSError as ex:
+        print("Execution failed with OSError: %s"%(ex))
+    finally:
+        if tmp_name is not None and os.path.exists(tmp_name):
+            os.remove(tmp_name)
+
+    rd_debug("Return code was: %s"%(result))
+    return result == 0
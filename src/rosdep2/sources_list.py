@@ -32,11 +32,18 @@ from __future__ import print_function
 import os
 import sys
 import tempfile
+import time
 import yaml
 import hashlib
 import urllib2
 
-from .core import InvalidData, DownloadFailure
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from .core import InvalidData, DownloadFailure, parallel_map
+from . import yaml_utils
 from .gbpdistro_support import download_gbpdistro_as_rosdep_data
 
 try:
@@ -46,6 +53,7 @@ except ImportError:
     
 import rospkg
 import rospkg.distro
+import rospkg.os_detect
 
 from .loader import RosdepLoader
 
@@ -56,12 +64,41 @@ DEFAULT_SOURCES_LIST_URL = 'https://raw.github.com/ros/rosdistro/master/rosdep/s
 #seconds to wait before aborting download of rosdep data
 DOWNLOAD_TIMEOUT = 15.0 
 
+# bytes to read from the network at once when downloading rosdep data
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# minimum number of seconds between progress reports of a download
+DOWNLOAD_PROGRESS_INTERVAL = 1.0
+
+# downloads of rosdep data larger than this many bytes are aborted
+DEFAULT_MAX_DOWNLOAD_SIZE = 64 * 1024 * 1024
+
+# default number of sources to download concurrently during update
+DEFAULT_UPDATE_JOBS = 8
+
 SOURCES_LIST_DIR = 'sources.list.d'
 SOURCES_CACHE_DIR = 'sources.cache'
 
 # name of index file for sources cache
 CACHE_INDEX = 'index'
 
+# suffix of files storing the HTTP validators of a cache file
+VALIDATORS_SUFFIX = '.validators'
+
+# suffix of files storing the pre-parsed (pickled) data of a cache
+# file.  Bump PICKLE_FORMAT_VERSION on incompatible format changes.
+PICKLE_SUFFIX = '.pickle'
+PICKLE_FORMAT_VERSION = 1
+
+# prefix of files storing the merged view of all sources matching a
+# set of tags (see write_compiled_view()).  Bump
+# COMPILED_FORMAT_VERSION on incompatible format changes.
+COMPILED_VIEW_PREFIX = 'compiled-'
+COMPILED_FORMAT_VERSION = 1
+
+# prefix of files storing the key index of a compiled view
+KEY_INDEX_PREFIX = 'keys-'
+
 def get_sources_list_dir():
     # base of where we read config files from
     # TODO: windows
@@ -135,33 +172,39 @@ class DataSource(object):
 
 # create function we can pass in as model to parse_source_data.  The
 # function emulates the CachedDataSource constructor but does the
-# necessary full filepath calculation and loading of data.
+# necessary full filepath calculation.  Data is loaded on first access.
 def cache_data_source_loader(sources_cache_dir, verbose=False):
     def create_model(type_, uri, tags, origin=None):
         # compute the filename has from the URL
         filename = compute_filename_hash(uri)
         filepath = os.path.join(sources_cache_dir, filename)
         if os.path.exists(filepath):
-            if verbose:
-                print("loading cached data source:\n\t%s\n\t%s"%(uri, filepath), file=sys.stderr)
-            with open(filepath) as f:
-                rosdep_data = yaml.load(f.read())
+            def rosdep_data_loader():
+                if verbose:
+                    print("loading cached data source:\n\t%s\n\t%s"%(uri, filepath), file=sys.stderr)
+                return load_cache_file(filepath)
         else:
-            rosdep_data = None
-        return CachedDataSource(type_, uri, tags, rosdep_data, origin=filepath)
+            rosdep_data_loader = None
+        return CachedDataSource(type_, uri, tags, None, origin=filepath,
+                                rosdep_data_loader=rosdep_data_loader)
     return create_model
     
 class CachedDataSource(object):
 
-    def __init__(self, type_, url, tags, rosdep_data, origin=None):
+    def __init__(self, type_, url, tags, rosdep_data, origin=None, rosdep_data_loader=None):
         """
         Stores data source and loaded rosdep data for that source.
 
         NOTE: this is not a subclass of DataSource, though it's API is
         duck-type compatible with the DataSource API.
+
+        :param rosdep_data_loader: (optional) fn() that returns the
+          rosdep data.  If set, it is called on first access of
+          *rosdep_data* instead of using the *rosdep_data* parameter.
         """
         self.source = DataSource(type_, url, tags, origin=origin)
-        self.rosdep_data = rosdep_data 
+        self._rosdep_data = rosdep_data 
+        self._rosdep_data_loader = rosdep_data_loader
     
     def __eq__(self, other):
         return self.source == other.source and \
@@ -174,6 +217,16 @@ class CachedDataSource(object):
         return repr((self.type, self.url, self.tags, self.rosdep_data, self.origin))
 
 
+    @property
+    def rosdep_data(self):
+        """
+        :returns: rosdep data of source, or ``None`` if not available
+        """
+        if self._rosdep_data_loader is not None:
+            self._rosdep_data = self._rosdep_data_loader()
+            self._rosdep_data_loader = None
+        return self._rosdep_data
+
     @property
     def type(self):
         """
@@ -232,23 +285,168 @@ class DataSourceMatcher(object):
         tags = [t for t in (distro_name, os_name, os_codename) if t]
         return DataSourceMatcher(tags)
 
-def download_rosdep_data(url):
+class _DownloadStream(object):
     """
+    File-like wrapper of an HTTP response that reads it in chunks,
+    hashing the data and enforcing a maximum size on the way.
+    """
+
+    def __init__(self, f, url, max_size=None, progress_handler=None):
+        """
+        :param f: file-like response to read from
+        :param max_size: maximum number of bytes to read, ``None`` for no limit
+        :param progress_handler: fn(bytes_read, rate) called at most
+          every ``DOWNLOAD_PROGRESS_INTERVAL`` seconds and once at the
+          end of the data, with *rate* in bytes per second
+        """
+        self.name = url
+        self._f = f
+        self._max_size = max_size
+        self._progress_handler = progress_handler
+        self._sha1 = hashlib.sha1()
+        self._start = self._last_progress = time.time()
+        self._reported = 0
+        self._buffer = b''
+        self._offset = 0
+        self.bytes_read = 0
+
+    def _read_chunk(self):
+        """
+        :raises: :exc:`DownloadFailure` if more than the maximum size
+          is read
+        """
+        chunk = self._f.read(DOWNLOAD_CHUNK_SIZE)
+        if not chunk:
+            self._report_progress(True)
+            return chunk
+        self.bytes_read += len(chunk)
+        if self._max_size is not None and self.bytes_read > self._max_size:
+            raise DownloadFailure('rosdep data from [%s] exceeds the maximum size of %d bytes'%(self.name, self._max_size))
+        self._sha1.update(chunk)
+        self._report_progress(False)
+        return chunk
+
+    def _report_progress(self, done):
+        if self._progress_handler is None or self._reported == self.bytes_read:
+            return
+        now = time.time()
+        if not done and now - self._last_progress < DOWNLOAD_PROGRESS_INTERVAL:
+            return
+        self._last_progress = now
+        self._reported = self.bytes_read
+        elapsed = now - self._start
+        self._progress_handler(self.bytes_read, self.bytes_read / elapsed if elapsed > 0 else 0.0)
+
+    def read(self, size=-1):
+        """
+        Read up to *size* bytes.  The parser reads in small pieces,
+        which are served from the last chunk read from the network.
+
+        :raises: :exc:`DownloadFailure` if more than the maximum size
+          is read
+        """
+        if size is None or size < 0:
+            data = [self._buffer[self._offset:]]
+            chunk = self._read_chunk()
+            while chunk:
+                data.append(chunk)
+                chunk = self._read_chunk()
+            self._buffer, self._offset = b'', 0
+            return b''.join(data)
+        if self._offset >= len(self._buffer):
+            self._buffer = self._read_chunk()
+            self._offset = 0
+        data = self._buffer[self._offset:self._offset + size]
+        self._offset += len(data)
+        return data
+
+    def hexdigest(self):
+        """
+        :returns: sha1 of the data read so far, ``str``
+        """
+        return self._sha1.hexdigest()
+
+def fetch_rosdep_data(url, validators=None, max_size=DEFAULT_MAX_DOWNLOAD_SIZE, progress_handler=None,
+                      spool=None):
+    """
+    Download rosdep data, optionally revalidating a previous download
+    with a conditional HTTP request.  The data is downloaded in chunks
+    to *spool* and only parsed, from *spool*, if it differs from the
+    previous download.
+
+    :param validators: HTTP validators of a previous download of
+      *url* (see :func:`get_validators`), ``{str: str}``, or ``None``
+      to download unconditionally.
+    :param max_size: abort downloads larger than this many bytes,
+      ``None`` for no limit.
+    :param progress_handler: fn(bytes_read, rate) to call as data is
+      received, with *rate* in bytes per second.  Called at most every
+      ``DOWNLOAD_PROGRESS_INTERVAL`` seconds and once when done.
+    :param spool: writable binary file to download the YAML text
+      to.  Defaults to a temporary file.
+    :returns: (rosdep_data, validators).  *rosdep_data* is ``None``
+      if the server reports that *url* has not been modified since
+      the download described by *validators*, or if the downloaded
+      data has the same sha1 as that download.
     :raises: :exc:`DownloadFailure` If data cannot be
-        retrieved (e.g. 404, bad YAML format, server down).
+        retrieved (e.g. 404, bad YAML format, server down, too large).
     """
+    if spool is None:
+        with tempfile.TemporaryFile() as spool:
+            return fetch_rosdep_data(url, validators, max_size, progress_handler, spool)
+    request = urllib2.Request(url)
+    if validators:
+        if validators.get('etag'):
+            request.add_header('If-None-Match', validators['etag'])
+        if validators.get('last-modified'):
+            request.add_header('If-Modified-Since', validators['last-modified'])
     try:
-        f = urllib2.urlopen(url, timeout=DOWNLOAD_TIMEOUT)
-        text = f.read()
-        f.close()
-        data = yaml.safe_load(text)
-        if type(data) != dict:
-            raise DownloadFailure('rosdep data from [%s] is not a YAML dictionary'%(url))
-        return data
+        f = urllib2.urlopen(request, timeout=DOWNLOAD_TIMEOUT)
+        try:
+            headers = f.info()
+            if max_size is not None and headers.get('content-length', '').isdigit() and \
+                    int(headers.get('content-length')) > max_size:
+                raise DownloadFailure('rosdep data from [%s] exceeds the maximum size of %d bytes'%(url, max_size))
+            stream = _DownloadStream(f, url, max_size=max_size, progress_handler=progress_handler)
+            chunk = stream.read(DOWNLOAD_CHUNK_SIZE)
+            while chunk:
+                spool.write(chunk)
+                chunk = stream.read(DOWNLOAD_CHUNK_SIZE)
+        finally:
+            f.close()
+    except urllib2.HTTPError as e:
+        if validators and e.code == 304:
+            return None, validators
+        raise DownloadFailure(str(e))
     except urllib2.URLError as e:
         raise DownloadFailure(str(e))
+    except IOError as e:
+        # connection lost or timed out while reading
+        raise DownloadFailure(str(e))
+    new_validators = {'sha1': stream.hexdigest()}
+    for key in ['etag', 'last-modified']:
+        if headers.get(key):
+            new_validators[key] = headers.get(key)
+    if validators and validators.get('sha1') == new_validators['sha1']:
+        # server does not support conditional requests, but the
+        # content is the same
+        return None, new_validators
+    spool.flush()
+    spool.seek(0)
+    try:
+        data = yaml_utils.load(spool)
     except yaml.YAMLError as e:
         raise DownloadFailure(str(e))
+    if type(data) != dict:
+        raise DownloadFailure('rosdep data from [%s] is not a YAML dictionary'%(url))
+    return data, new_validators
+
+def download_rosdep_data(url):
+    """
+    :raises: :exc:`DownloadFailure` If data cannot be
+        retrieved (e.g. 404, bad YAML format, server down).
+    """
+    return fetch_rosdep_data(url)[0]
     
 def download_default_sources_list(url=DEFAULT_SOURCES_LIST_URL):
     """
@@ -347,11 +545,63 @@ def parse_sources_list(sources_list_dir=None):
         sources_list.extend(parse_sources_file(os.path.join(sources_list_dir, f)))
     return sources_list
 
+def _download_source(source, sources_cache_dir, max_size=DEFAULT_MAX_DOWNLOAD_SIZE, progress_handler=None):
+    """
+    Sub-routine of :func:`update_sources_list`.  Download the rosdep
+    data for *source*.  Failures are returned instead of raised so
+    that they can be reported in sources list order.
+
+    :param progress_handler: fn(DataSource, bytes_read, rate), see
+      :func:`update_sources_list`
+
+    :returns: (rosdep_data, validators, text_path, error).  *error*
+      is ``None`` on success, :exc:`DownloadFailure` otherwise.
+      *rosdep_data* is ``None`` if the cached data for *source* is
+      still current.  *validators* is ``None`` if there are none or
+      they have not changed.  *text_path* is the file in
+      *sources_cache_dir* holding the downloaded YAML text of
+      *rosdep_data*, or ``None``.
+    """
+    rosdep_data = validators = text_path = None
+    try:
+        if source.type == TYPE_YAML:
+            if progress_handler is not None:
+                source_progress_handler = lambda bytes_read, rate: progress_handler(source, bytes_read, rate)
+            else:
+                source_progress_handler = None
+            previous_validators = get_validators(sources_cache_dir, source.url)
+            # download next to the cache file so that it can be renamed into place
+            fd, text_path = tempfile.mkstemp(prefix=compute_filename_hash(source.url) + '.tmp.', dir=sources_cache_dir)
+            with os.fdopen(fd, 'w+b') as spool:
+                rosdep_data, validators = fetch_rosdep_data(source.url, previous_validators, max_size=max_size,
+                                                            progress_handler=source_progress_handler, spool=spool)
+            if rosdep_data is None:
+                os.unlink(text_path)
+                text_path = None
+            if validators == previous_validators:
+                validators = None
+        elif source.type == TYPE_GBPDISTRO:
+            rosdep_data = download_gbpdistro_as_rosdep_data(source.url)
+        return rosdep_data, validators, text_path, None
+    except (DownloadFailure, IOError, OSError) as e:
+        if text_path is not None and os.path.exists(text_path):
+            os.unlink(text_path)
+        if not isinstance(e, DownloadFailure):
+            e = DownloadFailure(str(e))
+        return None, None, None, e
+
 def update_sources_list(sources_list_dir=None, sources_cache_dir=None,
-                        success_handler=None, error_handler=None):
+                        success_handler=None, error_handler=None,
+                        jobs=None, matcher=None, progress_handler=None,
+                        max_download_size=DEFAULT_MAX_DOWNLOAD_SIZE):
     """
     Re-downloaded data from remote sources and store in cache.  Also
     update the cache index based on current sources.
+
+    Sources are downloaded concurrently, but cache files are written
+    and handlers are called in sources list order.  HTTP validators
+    (ETag, Last-Modified) are stored with each cache file so that
+    unchanged sources are revalidated instead of downloaded again.
     
     :param sources_list_dir: override source list directory
     :param sources_cache_dir: override sources cache directory
@@ -361,6 +611,20 @@ def update_sources_list(sources_list_dir=None, sources_cache_dir=None,
     :param error_handler: fn(DataSource, DownloadFailure) to call
         if a particular source fails.  This hook is mainly for
         printing errors to console.
+    :param jobs: maximum number of sources to download at once.
+        Defaults to ``DEFAULT_UPDATE_JOBS``.
+    :param matcher: :class:`DataSourceMatcher` to precompile the
+        merged view for (see :func:`write_compiled_view`).  Defaults
+        to ``DataSourceMatcher.create_default()``.
+    :param progress_handler: fn(DataSource, bytes_read, rate) to call
+        as data of a YAML source is received, with *rate* in bytes per
+        second.  Called from the download threads, at most every
+        ``DOWNLOAD_PROGRESS_INTERVAL`` seconds per source and once
+        when a source is done.  Unlike *success_handler* and
+        *error_handler*, which are called in sources list order once
+        all downloads are done, it reports downloads while they run.
+    :param max_download_size: abort downloads of YAML sources larger
+        than this many bytes, ``None`` for no limit.
 
     :returns: list of (`DataSource`, cache_file_path) pairs for cache
         files that were updated, ``[str]``
@@ -370,21 +634,34 @@ def update_sources_list(sources_list_dir=None, sources_cache_dir=None,
     """
     if sources_cache_dir is None:
         sources_cache_dir = get_sources_cache_dir()
+    if jobs is None:
+        jobs = DEFAULT_UPDATE_JOBS
 
     sources = parse_sources_list(sources_list_dir=sources_list_dir)
+    if not os.path.exists(sources_cache_dir):
+        os.makedirs(sources_cache_dir)
+    results = parallel_map(lambda source: _download_source(source, sources_cache_dir, max_download_size, progress_handler),
+                           sources, jobs=jobs)
     retval = []
-    for source in sources:
-        try:
-            if source.type == TYPE_YAML:
-                rosdep_data = download_rosdep_data(source.url)
-            elif source.type == TYPE_GBPDISTRO:
-                rosdep_data = download_gbpdistro_as_rosdep_data(source.url)  
-            retval.append((source, write_cache_file(sources_cache_dir, source.url, rosdep_data)))
+    for source, (rosdep_data, validators, text_path, error) in zip(sources, results):
+        if error is None:
+            if rosdep_data is None:
+                # not modified, cache file is still current
+                filepath = os.path.join(sources_cache_dir, compute_filename_hash(source.url))
+                if not os.path.exists(filepath + PICKLE_SUFFIX):
+                    # cache written by an older rosdep
+                    with open(filepath) as f:
+                        text = f.read()
+                    write_pickle_cache_file(filepath, text, yaml_utils.load(text))
+            else:
+                filepath = write_cache_file(sources_cache_dir, source.url, rosdep_data, text_path=text_path)
+            if validators is not None:
+                write_validators(sources_cache_dir, source.url, validators)
+            retval.append((source, filepath))
             if success_handler is not None:
                 success_handler(source)
-        except DownloadFailure as e:
-            if error_handler is not None:
-                error_handler(source, e)
+        elif error_handler is not None:
+            error_handler(source, error)
 
     # Create a combined index of *all* the sources.  We do all the
     # sources regardless of failures because a cache from a previous
@@ -397,6 +674,14 @@ def update_sources_list(sources_list_dir=None, sources_cache_dir=None,
     for source in sources:
         data += "yaml %s %s\n" % (source.url, ' '.join(source.tags))
     write_atomic(cache_index, data)
+
+    if matcher is None:
+        try:
+            matcher = DataSourceMatcher.create_default()
+        except rospkg.os_detect.OsNotDetected:
+            pass
+    if matcher is not None:
+        write_compiled_view(sources_cache_dir, matcher)
     # mainly for debugging and testing
     return retval
 
@@ -422,16 +707,108 @@ def load_cached_sources_list(sources_cache_dir=None, verbose=False):
     model = cache_data_source_loader(sources_cache_dir, verbose=verbose)
     return parse_sources_data(cache_data, origin=cache_index, model=model)
 
+def compute_sources_signature(sources_cache_dir, sources):
+    """
+    Compute a signature of the cache files of *sources*.  The
+    signature changes whenever a cache file is rewritten, which makes
+    it cheap to validate data derived from the sources cache.
+
+    :param sources: list of :class:`DataSource`
+    :returns: signature, ``str``
+    """
+    sha_hash = hashlib.sha1()
+    for source in sources:
+        filepath = os.path.join(sources_cache_dir, compute_filename_hash(source.url))
+        try:
+            stat = os.stat(filepath)
+            sha_hash.update('%s %s %r\n'%(source.url, stat.st_size, stat.st_mtime))
+        except OSError:
+            sha_hash.update('%s\n'%(source.url))
+    return sha_hash.hexdigest()
+
+def get_compiled_view_path(sources_cache_dir, tags):
+    """
+    :returns: path of compiled view for sources matching *tags*
+    """
+    return os.path.join(sources_cache_dir, COMPILED_VIEW_PREFIX + compute_filename_hash(' '.join(sorted(tags))))
+
+def get_key_index_path(sources_cache_dir, tags):
+    """
+    :returns: path of key index for sources matching *tags*
+    """
+    return os.path.join(sources_cache_dir, KEY_INDEX_PREFIX + compute_filename_hash(' '.join(sorted(tags))))
+
+def write_compiled_view(sources_cache_dir, matcher):
+    """
+    Merge the rosdep data of all cached sources matching *matcher*
+    into a single view and store it, so that loading the merged
+    definitions does not require parsing and merging each source.
+    The merge uses the same first-one-wins rules as
+    :meth:`RosdepView.merge`.  The merged view is also stored as a
+    :mod:`rosdep2.key_index` for single-key lookups.
+
+    :param matcher: :class:`DataSourceMatcher`
+    :raises: :exc:`OSError` if cannot write to cache file/directory
+    :raises: :exc:`IOError` if cannot write to cache file/directory
+    """
+    # lookup depends on this module
+    from .lookup import RosdepView
+    from .model import RosdepDatabaseEntry
+    from .key_index import serialize_key_index
+
+    sources = [x for x in load_cached_sources_list(sources_cache_dir=sources_cache_dir) if matcher.matches(x)]
+    view = RosdepView(SourcesListLoader.ALL_VIEW_KEY)
+    defined_in = {}
+    for source in sources:
+        rosdep_data = source.rosdep_data or {}
+        # view name and origin match SourcesListLoader.load_view()
+        view.merge(RosdepDatabaseEntry(rosdep_data, [], source.url))
+        for rosdep_key in rosdep_data:
+            defined_in.setdefault(rosdep_key, []).append((source.url, source.url))
+    signature = compute_sources_signature(sources_cache_dir, sources)
+    data = (COMPILED_FORMAT_VERSION, [x.url for x in sources], signature, view.rosdep_defs)
+    write_atomic(get_compiled_view_path(sources_cache_dir, matcher.tags), pickle.dumps(data, 2), binary=True)
+    write_atomic(get_key_index_path(sources_cache_dir, matcher.tags),
+                 serialize_key_index(view.rosdep_defs, signature, defined_in), binary=True)
+
+def load_compiled_view(sources_cache_dir, tags, sources):
+    """
+    Load view stored by :func:`write_compiled_view`.
+
+    :param tags: tags of matcher used to select *sources*
+    :param sources: list of :class:`DataSource` the view must have been
+      compiled from
+    :returns: merged rosdep definitions, ``{str: RosdepDefinition}``,
+      or ``None`` if there is no compiled view for *sources* or
+      it is out of date.
+    """
+    try:
+        with open(get_compiled_view_path(sources_cache_dir, tags), 'rb') as f:
+            version, urls, signature, rosdep_defs = pickle.load(f)
+    except Exception:
+        # missing, truncated or incompatible
+        return None
+    if version != COMPILED_FORMAT_VERSION or urls != [x.url for x in sources] or \
+            signature != compute_sources_signature(sources_cache_dir, sources):
+        return None
+    return rosdep_defs
+
 def compute_filename_hash(filename_key):
     sha_hash = hashlib.sha1()
     sha_hash.update(filename_key)
     return sha_hash.hexdigest()
     
-def write_cache_file(source_cache_d, filename_key, rosdep_data):
+def write_cache_file(source_cache_d, filename_key, rosdep_data, text_path=None):
     """
+    Store *rosdep_data* as YAML as well as in the pre-parsed binary
+    format read by :func:`load_cache_file`.
+
     :param source_cache_d: directory to write cache file to
     :param filename_key: hash of filename is used to store data in
     :param rosdep_data: dictionary of data to serialize as YAML
+    :param text_path: file in *source_cache_d* holding the YAML
+      text *rosdep_data* was loaded from.  It is moved into place
+      verbatim instead of serializing *rosdep_data* again.
     :returns: name of file where cache is stored
     :raises: :exc:`OSError` if cannot write to cache file/directory
     :raises: :exc:`IOError` if cannot write to cache file/directory
@@ -440,15 +817,96 @@ def write_cache_file(source_cache_d, filename_key, rosdep_data):
         os.makedirs(source_cache_d)
     key_hash = compute_filename_hash(filename_key)
     filepath = os.path.join(source_cache_d, key_hash)
-    write_atomic(filepath, yaml.safe_dump(rosdep_data))
+    if text_path is None:
+        text = yaml_utils.dump(rosdep_data)
+        write_atomic(filepath, text)
+        # store what loading the YAML produces so that both forms are
+        # interchangeable (e.g. floats are loaded as strings).
+        rosdep_data = yaml_utils.load(text)
+    else:
+        with open(text_path) as f:
+            text = f.read()
+        _replace_file(text_path, filepath)
+    write_pickle_cache_file(filepath, text, rosdep_data)
     return filepath
-    
-def write_atomic(filepath, data):
+
+def write_pickle_cache_file(filepath, text, rosdep_data):
+    """
+    Store the pre-parsed form of cache file *filepath*.
+
+    :param text: YAML contents of *filepath*, ``str``
+    :param rosdep_data: result of loading *text*
+    :raises: :exc:`OSError` if cannot write to cache file/directory
+    :raises: :exc:`IOError` if cannot write to cache file/directory
+    """
+    data = (PICKLE_FORMAT_VERSION, hashlib.sha1(text).hexdigest(), rosdep_data)
+    write_atomic(filepath + PICKLE_SUFFIX, pickle.dumps(data, 2), binary=True)
+
+def load_cache_file(filepath):
+    """
+    Load cache file *filepath*.  The pre-parsed form is used if it
+    is present and was generated from the current YAML contents,
+    otherwise the YAML is parsed.
+
+    :returns: rosdep data
+    :raises: :exc:`IOError` if cache file cannot be read
+    """
+    with open(filepath) as f:
+        text = f.read()
+    try:
+        with open(filepath + PICKLE_SUFFIX, 'rb') as f:
+            version, sha1, rosdep_data = pickle.load(f)
+        if version == PICKLE_FORMAT_VERSION and sha1 == hashlib.sha1(text).hexdigest():
+            return rosdep_data
+    except Exception:
+        # missing, truncated or incompatible, fall back to YAML
+        pass
+    return yaml_utils.load(text)
+
+def get_validators(source_cache_d, filename_key):
+    """
+    Load the HTTP validators stored by :func:`write_validators`.
+
+    :returns: validators dictionary, ``{str: str}``, or ``None`` if
+      there are no validators or no cache file to revalidate.
+    """
+    filepath = os.path.join(source_cache_d, compute_filename_hash(filename_key))
+    validators_path = filepath + VALIDATORS_SUFFIX
+    if not os.path.exists(filepath) or not os.path.exists(validators_path):
+        return None
+    try:
+        with open(validators_path) as f:
+            validators = yaml_utils.load(f)
+    except (IOError, yaml.YAMLError):
+        return None
+    if type(validators) != dict:
+        return None
+    return validators
+
+def write_validators(source_cache_d, filename_key, validators):
+    """
+    Store HTTP validators next to the cache file for *filename_key*.
+
+    :param validators: dictionary of validators, e.g. from
+      :func:`fetch_rosdep_data`.
+    :raises: :exc:`OSError` if cannot write to cache file/directory
+    :raises: :exc:`IOError` if cannot write to cache file/directory
+    """
+    filepath = os.path.join(source_cache_d, compute_filename_hash(filename_key))
+    write_atomic(filepath + VALIDATORS_SUFFIX, yaml_utils.dump(validators))
+
+def write_atomic(filepath, data, binary=False):
     # write data to new file
     fd, filepath_tmp = tempfile.mkstemp(prefix=os.path.basename(filepath) + '.tmp.', dir=os.path.dirname(filepath))
-    with os.fdopen(fd, 'w') as f:
+    with os.fdopen(fd, 'wb' if binary else 'w') as f:
         f.write(data)
         f.close()
+    _replace_file(filepath_tmp, filepath)
+
+def _replace_file(filepath_tmp, filepath):
+    """
+    Move *filepath_tmp* to *filepath*, replacing it.
+    """
     try:
         # switch file atomically (if supported)
         os.rename(filepath_tmp, filepath)
@@ -480,11 +938,16 @@ class SourcesListLoader(RosdepLoader):
 
     ALL_VIEW_KEY = 'sources.list'
 
-    def __init__(self, sources):
+    def __init__(self, sources, sources_cache_dir=None, tags=None):
         """
         :param sources: cached sources list entries, [:class:`CachedDataSource`]
+        :param sources_cache_dir: (optional) sources cache *sources*
+          were loaded from, used to locate the compiled view
+        :param tags: (optional) tags of matcher used to select *sources*
         """
         self.sources = sources
+        self.sources_cache_dir = sources_cache_dir
+        self.tags = tags
 
     @staticmethod
     def create_default(matcher=None, sources_cache_dir=None, os_override=None, verbose=False):
@@ -495,6 +958,8 @@ class SourcesListLoader(RosdepLoader):
         """
         if matcher is None:
             matcher = DataSourceMatcher.create_default(os_override=os_override)
+        if sources_cache_dir is None:
+            sources_cache_dir = get_sources_cache_dir()
         if verbose:
             print("using matcher with tags [%s]"%(', '.join(matcher.tags)), file=sys.stderr)
             
@@ -504,12 +969,13 @@ class SourcesListLoader(RosdepLoader):
         sources = [x for x in sources if matcher.matches(x)]
         if verbose:
             print("%s sources match current tags"%(len(sources)), file=sys.stderr)
-        return SourcesListLoader(sources)
+        return SourcesListLoader(sources, sources_cache_dir=sources_cache_dir, tags=matcher.tags)
         
     def load_view(self, view_name, rosdep_db, verbose=False):
         """
         Load view data into rosdep_db. If the view has already been
-        loaded into rosdep_db, this method does nothing.
+        loaded into rosdep_db, this method does nothing.  The cached
+        source data is not read until the view data is accessed.
 
         :param view_name: name of ROS stack to load, ``str``
         :param rosdep_db: database to load stack data into, :class:`RosdepDatabase`
@@ -522,7 +988,38 @@ class SourcesListLoader(RosdepLoader):
         if verbose:
             print("loading view [%s] with sources.list loader"%(view_name), file=sys.stderr)
         view_dependencies = self.get_view_dependencies(view_name)
-        rosdep_db.set_view_data(view_name, source.rosdep_data, view_dependencies, view_name)
+        rosdep_db.set_view_data_loader(view_name, lambda: source.rosdep_data, view_dependencies, view_name)
+
+    def get_compiled_view(self):
+        """
+        :returns: (view_keys, rosdep_defs).  *rosdep_defs* are the
+          definitions of merging the views in *view_keys* in order,
+          ``{str: RosdepDefinition}``.  ``None`` if no up-to-date
+          compiled view is available.
+        """
+        if self.sources_cache_dir is None or self.tags is None:
+            return None
+        rosdep_defs = load_compiled_view(self.sources_cache_dir, self.tags, self.sources)
+        if rosdep_defs is None:
+            return None
+        return self.get_loadable_views(), rosdep_defs
+
+    def get_key_index(self):
+        """
+        :returns: :class:`rosdep2.key_index.KeyIndex` of the compiled
+          view, or ``None`` if no up-to-date key index is available.
+        """
+        if self.sources_cache_dir is None or self.tags is None:
+            return None
+        from .key_index import KeyIndex
+        try:
+            key_index = KeyIndex(get_key_index_path(self.sources_cache_dir, self.tags), name=self.ALL_VIEW_KEY)
+        except (IOError, ValueError):
+            return None
+        if key_index.signature != compute_sources_signature(self.sources_cache_dir, self.sources):
+            key_index.close()
+            return None
+        return key_index
 
     def get_loadable_resources(self):
         return []
@@ -0,0 +1,70 @@
+# Copyright (c) 2012, Willow Garage, Inc.
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the Willow Garage, Inc. nor the names of its
+#       contributors may be used to endorse or promote products derived from
+#       this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+YAML loading and dumping shared by all of rosdep.  The libyaml based
+C implementations are used when PyYAML was built with them, the pure
+Python ones otherwise.
+
+Unlike the plain safe loader, YAML floats are loaded as strings so
+that OS versions like ``12.04`` and ``10.10`` keep their spelling.
+"""
+
+import yaml
+
+try:
+    from yaml import CSafeLoader as _SafeLoader, CSafeDumper as SafeDumper
+except ImportError:
+    from yaml import SafeLoader as _SafeLoader, SafeDumper
+
+class RosdepYamlLoader(_SafeLoader):
+    """
+    Safe YAML loader that constructs floats as strings.
+    """
+
+RosdepYamlLoader.add_constructor(
+    u'tag:yaml.org,2002:float',
+    RosdepYamlLoader.construct_yaml_str)
+
+def load(stream):
+    """
+    Parse YAML document in *stream* with :class:`RosdepYamlLoader`.
+
+    :param stream: YAML text or file-like object to read it from
+    :raises: :exc:`yaml.YAMLError`
+    """
+    return yaml.load(stream, Loader=RosdepYamlLoader)
+
+def dump(data, **kwargs):
+    """
+    Serialize *data* with the safe dumper.  Keyword arguments are
+    passed on to :func:`yaml.dump`.
+
+    :returns: YAML text, ``str``
+    """
+    return yaml.dump(data, Dumper=SafeDumper, **kwargs)
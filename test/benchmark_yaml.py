@@ -0,0 +1,83 @@
+# Copyright (c) 2012, Willow Garage, Inc.
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the Willow Garage, Inc. nor the names of its
+#       contributors may be used to endorse or promote products derived from
+#       this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+Compare the pure-Python YAML loader with the loader used by rosdep
+(:mod:`rosdep2.yaml_utils`) on a rosdep data file::
+
+  python test/benchmark_yaml.py [base.yaml]
+
+Without a file argument the current base.yaml of rosdistro is
+downloaded.
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import timeit
+import urllib2
+
+import yaml
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from rosdep2 import yaml_utils
+
+BASE_URL = 'https://github.com/ros/rosdistro/raw/master/rosdep/base.yaml'
+
+class PurePythonLoader(yaml.SafeLoader):
+    pass
+
+PurePythonLoader.add_constructor(
+    u'tag:yaml.org,2002:float',
+    PurePythonLoader.construct_yaml_str)
+
+def main(argv):
+    if argv:
+        with open(argv[0]) as f:
+            text = f.read()
+    else:
+        f = urllib2.urlopen(BASE_URL, timeout=30)
+        text = f.read()
+        f.close()
+    print("%d bytes, libyaml %s"%(len(text), 'available' if yaml.__with_libyaml__ else 'not available'))
+
+    pure = yaml.load(text, Loader=PurePythonLoader)
+    fast = yaml_utils.load(text)
+    assert pure == fast, "loaders disagree"
+    print("%d rosdep keys"%(len(fast)))
+
+    repeat = 5
+    pure_time = min(timeit.repeat(lambda: yaml.load(text, Loader=PurePythonLoader), number=1, repeat=repeat))
+    fast_time = min(timeit.repeat(lambda: yaml_utils.load(text), number=1, repeat=repeat))
+    print("pure Python loader: %.3fs"%(pure_time))
+    print("rosdep loader:      %.3fs (%.1fx)"%(fast_time, pure_time / fast_time))
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -49,3 +49,9 @@ def test_InvalidData():
     except InvalidData as ex:
         assert 'hi' in str(ex)
 
+
+def test_parallel_map():
+    from rosdep2.core import parallel_map
+    assert [] == parallel_map(str, [], jobs=4)
+    for jobs in [1, 2, 8]:
+        assert [x*2 for x in range(20)] == parallel_map(lambda x: x*2, range(20), jobs=jobs)
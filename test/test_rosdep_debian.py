@@ -56,6 +56,40 @@ def test_dpkg_detect():
     assert val == ['apt=1.8', 'python=2.7'], val
 
 
+def test_get_dpkg_status():
+    from rosdep2.platforms.debian import get_dpkg_status
+    import shutil
+    import tempfile
+    status_file = os.path.join(tempfile.mkdtemp(), 'status')
+    shutil.copy(os.path.join(get_test_dir(), 'dpkg-status'), status_file)
+    os.utime(status_file, (1000, 1000))
+
+    status = get_dpkg_status(status_file)
+    assert status['apt'] == ('install ok installed', '0.8.16~exp12ubuntu10'), status['apt']
+    assert status['tinyxml-dev'][0] == 'deinstall ok config-files'
+    # installed architecture wins
+    assert status['libfoo'][0] == 'install ok installed'
+    assert status['libfoo:amd64'][0] == 'deinstall ok config-files'
+    assert 'fake' not in status
+    # snapshot is reused until the database changes
+    assert get_dpkg_status(status_file) is status
+    with open(status_file, 'a') as f:
+        f.write('\nPackage: new\nStatus: install ok installed\n')
+    assert 'new' in get_dpkg_status(status_file)
+
+    try:
+        get_dpkg_status(status_file + '.fake')
+        assert False, "should have raised"
+    except IOError:
+        pass
+
+def test_dpkg_detect_status_file():
+    import rosdep2.platforms.debian
+    from rosdep2.platforms.debian import dpkg_detect
+    with patch.object(rosdep2.platforms.debian, 'DPKG_STATUS_FILE', os.path.join(get_test_dir(), 'dpkg-status')):
+        val = dpkg_detect(['tinyxml-dev', 'python', 'apt=1.8', 'libfoo:i386', 'libfoo:amd64', 'fake'])
+        assert val == ['python', 'apt=1.8', 'libfoo:i386'], val
+
 def test_AptInstaller():
     from rosdep2.platforms.debian import AptInstaller
 
@@ -66,13 +100,11 @@ def test_AptInstaller():
         assert [] == installer.get_install_command(['fake'])
 
         mock_method.return_value = ['a', 'b']
-        expected = [['sudo', 'apt-get', 'install', '-y', 'a'],
-                    ['sudo', 'apt-get', 'install', '-y', 'b']]
+        expected = [['sudo', 'apt-get', 'install', '-y', 'a', 'b']]
         val = installer.get_install_command(['whatever'], interactive=False)
         print("VAL", val)
         assert val == expected, val
-        expected = [['sudo', 'apt-get', 'install', 'a'],
-                    ['sudo', 'apt-get', 'install', 'b']]
+        expected = [['sudo', 'apt-get', 'install', 'a', 'b']]
         val = installer.get_install_command(['whatever'], interactive=True)
         assert val == expected, val
     try:
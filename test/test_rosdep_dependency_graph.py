@@ -166,3 +166,55 @@ def test_DependencyGraph_Realworld():
 	expected = [('homebrew', ['pkg-config']), ('pip', ['matplotlib'])]
 	assert result == expected, "Results did not match expectations: %s == %s"%(str(result),str(expected))
 
+def test_DependencyGraph_Cycle_Path():
+	from rosdep2.dependency_graph import DependencyGraph
+	# A-B-C-D-B-...
+	dg = DependencyGraph()
+	for key, dependencies in [('A', ['B']), ('B', ['C']), ('C', ['D']), ('D', ['B'])]:
+		dg[key]['installer_key'] = 'installer'
+		dg[key]['install_keys'] = [key.lower()]
+		dg[key]['dependencies'] = dependencies
+	try:
+		dg.get_ordered_dependency_list()
+		assert False, "Doesn't fail, it should fail with an AssertionError because of the cycle."
+	except AssertionError as e:
+		cycle = str(e).split(': ')[-1].split(' -> ')
+		assert cycle[0] == cycle[-1], str(e)
+		assert ' '.join(cycle[:-1]) in ['B C D', 'C D B', 'D B C'], str(e)
+
+def test_DependencyGraph_Deep_Diamonds():
+	from rosdep2.dependency_graph import DependencyGraph
+	# chain of diamonds deeper than the recursion limit:
+	# Ti depends on Li and Ri, which both depend on Ti+1
+	depth = 2000
+	dg = DependencyGraph()
+	for i in range(depth):
+		for key, dependencies in [('T%d', ['L%d', 'R%d']), ('L%d', ['T%d']), ('R%d', ['T%d'])]:
+			key = key%i
+			dg[key]['installer_key'] = 'installer'
+			dg[key]['install_keys'] = [key]
+			dg[key]['dependencies'] = [d%(i + 1 if d.startswith('T') else i) for d in dependencies]
+	dg['T%d'%depth]['installer_key'] = 'installer'
+	dg['T%d'%depth]['install_keys'] = ['T%d'%depth]
+	result = dg.get_ordered_dependency_list()
+	assert len(result) == 1
+	installer_key, install_keys = result[0]
+	assert len(install_keys) == 3 * depth + 1
+	assert install_keys[0] == 'T%d'%depth
+	assert install_keys[-1] == 'T0'
+	position = dict([(key, i) for i, key in enumerate(install_keys)])
+	for key in dg:
+		for dependency in dg[key]['dependencies']:
+			assert position[dependency] < position[key]
+
+def test_DependencyGraph_Groups():
+	from rosdep2.dependency_graph import DependencyGraph
+	# A-B-C-D, A-E; C has nothing to install
+	dg = DependencyGraph()
+	for key, installer_key, dependencies in [('A', 'apt', ['B', 'E']), ('B', 'pip', ['C']), ('C', 'apt', ['D']), ('D', 'gem', []), ('E', 'source', [])]:
+		dg[key]['installer_key'] = installer_key
+		dg[key]['install_keys'] = [key.lower()] if key != 'C' else []
+		dg[key]['dependencies'] = dependencies
+	result = dg.get_ordered_dependency_groups()
+	assert result == [('gem', ['d'], []), ('pip', ['b'], [0]), ('source', ['e'], []), ('apt', ['a'], [0, 1, 2])], result
+	assert dg.get_ordered_dependency_list() == [(k, r) for k, r, _ in result]
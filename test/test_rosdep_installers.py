@@ -280,6 +280,17 @@ def test_Installer_tripwire():
     except NotImplementedError: pass
     assert Installer().get_depends({}) == []
 
+def test_Installer_get_packages_to_install():
+    from rosdep2.installers import Installer
+    class FakeInstaller(Installer):
+        def is_installed(self, resolved_item):
+            return resolved_item.startswith('installed')
+    installer = FakeInstaller()
+    assert installer.get_packages_to_install([]) == []
+    assert installer.get_packages_to_install(['b', 'installed1', 'a']) == ['b', 'a']
+    assert installer.get_packages_to_install(['b', 'a', 'b', 'installed1', 'a']) == ['b', 'a']
+    assert installer.get_packages_to_install(['b', 'installed1', 'a'], reinstall=True) == ['b', 'installed1', 'a']
+
 def detect_fn_empty(packages):
     return []
 def detect_fn_all(packages):
@@ -366,6 +377,8 @@ def test_PackageManagerInstaller_get_packages_to_install():
     assert set(['a', 'b', 'c']) == set(installer.get_packages_to_install(['a', 'b', 'c'], reinstall=True))
     installer = PackageManagerInstaller(detect_fn_single)
     assert set(['baba', 'cada']) == set(installer.get_packages_to_install(['a', 'baba', 'b', 'cada', 'c']))
+    # duplicates are dropped, order is kept
+    assert ['cada', 'baba'] == installer.get_packages_to_install(['cada', 'a', 'baba', 'cada', 'baba'])
     
 def test_RosdepInstaller_ctor():
     # tripwire/coverage
@@ -517,6 +530,42 @@ def test_RosdepInstaller_get_uninstalled_unconfigured():
         pass
 
 
+def test_RosdepInstaller_get_uninstalled_concurrent():
+    import threading
+    from mock import Mock
+    from rosdep2 import InstallerContext
+    from rosdep2.installers import RosdepInstaller, Installer
+    from rosdep2.lookup import RosdepLookup
+
+    # each detector waits until all detectors are running
+    started = []
+    all_started = threading.Event()
+    class SlowInstaller(Installer):
+        def __init__(self, installed):
+            self.installed = installed
+        def get_packages_to_install(self, resolved, reinstall=False):
+            started.append(resolved)
+            if len(started) == 3:
+                all_started.set()
+            all_started.wait(5.)
+            return [r for r in resolved if r not in self.installed]
+    context = InstallerContext()
+    context.set_installer('a', SlowInstaller(['a1']))
+    context.set_installer('b', SlowInstaller([]))
+    lookup = Mock(spec=RosdepLookup)
+    lookup.resolve_all.return_value = ([('a', ['a1', 'a2']), ('b', ['b1']), ('a', ['a1'])], [])
+    installer = RosdepInstaller(context, lookup)
+
+    uninstalled, errors = installer.get_uninstalled(['fake'])
+    assert all_started.is_set()
+    assert uninstalled == [('a', ['a2']), ('b', ['b1'])], uninstalled
+
+    # serial detection
+    lookup.resolve_all.return_value = ([('b', ['b1']), ('a', ['a2'])], [])
+    uninstalled, errors = installer.get_uninstalled(['fake'], jobs=1)
+    assert uninstalled == [('b', ['b1']), ('a', ['a2'])], uninstalled
+
+
 from contextlib import contextmanager
 @contextmanager
 def fakeout():
@@ -563,6 +612,197 @@ def test_RosdepInstaller_install_resolved():
             return True
     stdout_lines = [x.strip() for x in stdout.getvalue().split('\n') if x.strip()]
     assert stdout_lines == ['#[apt] Installation commands:',
-                            'sudo apt-get install rosdep-fake1',
-                            'sudo apt-get install rosdep-fake2',
+                            'sudo apt-get install rosdep-fake1 rosdep-fake2',
                             ], ("%s: %s"%(stdout.getvalue(), stdout_lines))
+
+def test_RosdepInstaller_install_resolved_batch():
+    from mock import Mock, patch
+    from rosdep2 import InstallerContext, InstallFailed
+    from rosdep2.installers import RosdepInstaller, PackageManagerInstaller
+    from rosdep2.lookup import RosdepLookup
+
+    installed = []
+    class BatchInstaller(PackageManagerInstaller):
+        def __init__(self):
+            super(BatchInstaller, self).__init__(lambda pkgs: [p for p in pkgs if p in installed])
+        def get_install_command(self, resolved, interactive=True, reinstall=False):
+            packages = self.get_packages_to_install(resolved, reinstall=reinstall)
+            return [['fake-install'] + packages] if packages else []
+    commands = []
+    def call(command):
+        commands.append(command)
+        if [p for p in command[1:] if p.startswith('bad')]:
+            return 1
+        installed.extend(command[1:])
+        return 0
+    context = InstallerContext()
+    context.set_installer('batch', BatchInstaller())
+    installer = RosdepInstaller(context, Mock(spec=RosdepLookup))
+
+    with fakeout():
+        with patch('rosdep2.installers.subprocess.call', side_effect=call):
+            installer.install_resolved('batch', ['a', 'b', 'c'])
+            assert commands == [['fake-install', 'a', 'b', 'c']], commands
+
+            # failing batch is bisected to find failing items
+            del commands[:]
+            try:
+                installer.install_resolved('batch', ['d', 'bad1', 'e', 'f', 'bad2'], continue_on_error=True)
+                assert False, "should have raised"
+            except InstallFailed as e:
+                failed = [m for k, m in e.failures if m.startswith('command')]
+                assert failed == ['command [fake-install bad1] failed', 'command [fake-install bad2] failed'], e.failures
+            assert commands[0] == ['fake-install', 'd', 'bad1', 'e', 'f', 'bad2']
+            assert set(installed) == set(['a', 'b', 'c', 'd', 'e', 'f'])
+
+            # verification reports items missing after install, with one detection
+            del commands[:]
+            detect_calls = []
+            def detect_fn(pkgs):
+                detect_calls.append(pkgs)
+                return [p for p in pkgs if p in installed and p != 'h']
+            context.get_installer('batch').detect_fn = detect_fn
+            try:
+                installer.install_resolved('batch', ['g', 'h', 'i'])
+                assert False, "should have raised"
+            except InstallFailed as e:
+                assert e.failures == [('batch', 'Failed to detect successful installation of [h]')], e.failures
+            # once for the install command, once for verification
+            assert detect_calls == [['g', 'h', 'i'], ['g', 'h', 'i']], detect_calls
+
+            # without continue_on_error, the batch failure is reported
+            del commands[:]
+            try:
+                installer.install_resolved('batch', ['m', 'bad3'])
+                assert False, "should have raised"
+            except InstallFailed as e:
+                assert e.failures == [('batch', 'command [fake-install m bad3] failed')], e.failures
+            assert len(commands) == 1
+
+def test_RosdepInstaller_install_resolved_output():
+    from mock import Mock
+    from StringIO import StringIO
+    from rosdep2 import InstallerContext, InstallFailed
+    from rosdep2.installers import RosdepInstaller, PackageManagerInstaller
+    from rosdep2.lookup import RosdepLookup
+
+    class EchoInstaller(PackageManagerInstaller):
+        def __init__(self):
+            super(EchoInstaller, self).__init__(lambda pkgs: [])
+        def get_install_command(self, resolved, interactive=True, reinstall=False):
+            return [['echo', 'installing'] + resolved]
+    context = InstallerContext()
+    context.set_installer('echo', EchoInstaller())
+    installer = RosdepInstaller(context, Mock(spec=RosdepLookup))
+    output = StringIO()
+    with fakeout() as (stdout, stderr):
+        try:
+            installer.install_resolved('echo', ['a', 'b'], output=output)
+        except InstallFailed:
+            # echo does not install anything
+            pass
+    assert not stdout.getvalue(), stdout.getvalue()
+    assert 'executing command [echo installing a b]' in output.getvalue(), output.getvalue()
+    assert 'installing a b\n' in output.getvalue(), output.getvalue()
+
+def test_RosdepInstaller_get_uninstalled_with_dependencies():
+    from mock import Mock
+    from rosdep2 import InstallerContext
+    from rosdep2.installers import RosdepInstaller, PackageManagerInstaller
+    from rosdep2.lookup import RosdepLookup
+
+    context = InstallerContext()
+    context.set_installer('a', PackageManagerInstaller(lambda pkgs: []))
+    context.set_installer('b', PackageManagerInstaller(lambda pkgs: pkgs))
+    lookup = Mock(spec=RosdepLookup)
+    lookup.resolve_all_with_dependencies.return_value = \
+        ([('a', ['a1']), ('b', ['b1']), ('a', ['a2']), ('a', ['a3'])], [[], [0], [1], []], {})
+    installer = RosdepInstaller(context, lookup)
+    uninstalled, dependencies, errors = installer.get_uninstalled_with_dependencies(['fake'])
+    assert uninstalled == [('a', ['a1']), ('a', ['a2']), ('a', ['a3'])], uninstalled
+    # installed b1 passes its dependencies on
+    assert dependencies == [[], [0], []], dependencies
+
+def test_RosdepInstaller_install_concurrent():
+    import threading
+    from mock import Mock
+    from rosdep2 import InstallerContext, InstallFailed
+    from rosdep2.installers import RosdepInstaller, CONCURRENT_INSTALLER_KEYS
+    from rosdep2.lookup import RosdepLookup
+
+    lock = threading.Lock()
+    both_started = threading.Event()
+    running = []
+    started = []
+    max_running = []
+    def install_resolved(installer_key, resolved, output=None, **kwargs):
+        with lock:
+            started.append(resolved[0])
+            # never two installs of the same installer at once
+            assert installer_key not in [k for k, _ in running]
+            # system package managers only install alone
+            running_keys = [k for k, _ in running] + [installer_key]
+            assert len(running_keys) == 1 or not [k for k in running_keys if k not in CONCURRENT_INSTALLER_KEYS], running_keys
+            running.append((installer_key, resolved[0]))
+            max_running.append(len(running))
+            if set(['p1', 'g1']) <= set(started):
+                both_started.set()
+        try:
+            if output is not None:
+                output.write('output of %s\n'%(resolved[0]))
+            if resolved[0] in ['p1', 'g1']:
+                # independent entries run at the same time
+                both_started.wait(5.)
+            if resolved[0].startswith('bad'):
+                raise InstallFailed((installer_key, 'failed %s'%(resolved[0])))
+        finally:
+            with lock:
+                running.remove((installer_key, resolved[0]))
+
+    installer = RosdepInstaller(InstallerContext(), Mock(spec=RosdepLookup))
+    installer.install_resolved = Mock(side_effect=install_resolved)
+    uninstalled = [('pip', ['p1']), ('gem', ['g1']), ('pip', ['p2']), ('apt', ['a1']), ('source', ['s1'])]
+    dependencies = [[], [], [0], [1], []]
+    with fakeout() as (stdout, stderr):
+        installer.install(uninstalled, interactive=False, dependencies=dependencies, jobs=4)
+    assert both_started.is_set()
+    assert started.index('p2') > started.index('p1')
+    assert started.index('a1') > started.index('g1')
+    assert max(max_running) > 1
+    assert installer.install_resolved.call_count == 5
+    # output of each install is printed in one piece
+    assert sorted(stdout.getvalue().splitlines()) == sorted(['output of %s'%(r[0]) for _, r in uninstalled])
+
+    # installs run one at a time by default
+    del started[:]
+    del max_running[:]
+    both_started.set()
+    installer.install(uninstalled, interactive=False, dependencies=dependencies)
+    assert started == ['p1', 'g1', 'p2', 'a1', 's1'], started
+    assert max(max_running) == 1
+
+    # simulated installs run in order
+    del started[:]
+    both_started.set()
+    installer.install(uninstalled, interactive=False, simulate=True, dependencies=dependencies, jobs=4)
+    assert started == ['p1', 'g1', 'p2', 'a1', 's1'], started
+
+    # dependents of a failure are not installed
+    del started[:]
+    uninstalled = [('apt', ['a1']), ('pip', ['bad1']), ('source', ['s1'])]
+    try:
+        installer.install(uninstalled, interactive=False, dependencies=[[], [], [1]], jobs=4)
+        assert False, "should have raised"
+    except InstallFailed as e:
+        assert e.failures == [('pip', 'failed bad1')], e.failures
+    assert 's1' not in started
+
+    # unless continue_on_error is set
+    del started[:]
+    uninstalled = [('apt', ['bad1']), ('pip', ['bad2']), ('source', ['s1'])]
+    try:
+        installer.install(uninstalled, interactive=False, continue_on_error=True, dependencies=[[], [], [1]], jobs=4)
+        assert False, "should have raised"
+    except InstallFailed as e:
+        assert sorted(e.failures) == [('apt', 'failed bad1'), ('pip', 'failed bad2')], e.failures
+    assert 's1' in started
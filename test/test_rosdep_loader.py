@@ -51,3 +51,20 @@ def test_RosdepLoader():
         loader.get_rosdeps('foo', implicit=False)
         assert False, "should have raised NotImplementedError"
     except NotImplementedError: pass
+
+def test_RosdepLoader_load_rosdep_yaml():
+    from rosdep2 import InvalidData
+    from rosdep2.loader import RosdepLoader
+    loader = RosdepLoader()
+    # floats are loaded as strings
+    data = loader.load_rosdep_yaml("""foo:
+  ubuntu:
+    10.10: [foo-dev]
+    12.04: foo
+""", 'fake.yaml')
+    assert data == {'foo': {'ubuntu': {'10.10': ['foo-dev'], '12.04': 'foo'}}}, data
+    try:
+        loader.load_rosdep_yaml("foo: [", 'fake.yaml')
+        assert False, "should have raised"
+    except InvalidData as e:
+        assert 'fake.yaml' in str(e)
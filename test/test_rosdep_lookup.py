@@ -29,6 +29,7 @@ from __future__ import print_function
 
 import os
 import yaml
+from mock import patch
 
 from rospkg import RosPack, RosStack, ResourceNotFound
 
@@ -256,6 +257,11 @@ def test_RosdepLookup_get_resources_that_need():
     assert set(lookup.get_resources_that_need('stack1_dep1')) ==  set(['stack1_p1', 'stack1_p2'])
     assert lookup.get_resources_that_need('stack1_dep2') ==  ['stack1_p2']
     assert lookup.get_resources_that_need('stack1_p1_dep1') ==  ['stack1_p1']
+
+    # manifests are only crawled once
+    with patch.object(lookup.loader, 'get_rosdeps', side_effect=AssertionError("should not crawl")):
+        assert lookup.get_resources_that_need('stack1_dep2') ==  ['stack1_p2']
+        assert lookup.get_resources_that_need('fake') ==  []
     
 def test_RosdepLookup_create_from_rospkg():
     from rosdep2.lookup import RosdepLookup
@@ -440,6 +446,40 @@ def test_RosdepLookup_resolve():
         assert [] == dependencies
 
 
+def test_RosdepLookup_resolve_cache():
+    import pickle
+    import tempfile
+    from rosdep2 import create_default_installer_context
+    from rosdep2.lookup import RosdepLookup
+    rospack, rosstack = get_test_rospkgs()
+    installer_context = create_default_installer_context()
+    installer_context.set_os_override('ubuntu', 'lucid')
+    filepath = os.path.join(tempfile.mkdtemp(), 'resolve-cache')
+
+    lookup = RosdepLookup.create_from_rospkg(rospack=rospack, rosstack=rosstack,
+                                             sources_loader=create_test_SourcesListLoader())
+    # nothing to load yet
+    lookup.load_resolve_cache(filepath)
+    expected = lookup.resolve('testtinyxml', 'rospack_fake', installer_context)
+    lookup.save_resolve_cache(filepath)
+
+    lookup = RosdepLookup.create_from_rospkg(rospack=rospack, rosstack=rosstack,
+                                             sources_loader=create_test_SourcesListLoader())
+    lookup.load_resolve_cache(filepath)
+    assert lookup.resolve('testtinyxml', 'rospack_fake', installer_context) == expected
+    # resolved without creating a view
+    assert not lookup._view_cache
+
+    # ignored once the sources change
+    with open(filepath, 'rb') as f:
+        data = pickle.load(f)
+    with open(filepath, 'wb') as f:
+        pickle.dump((data[0], 'other-signature') + data[2:], f)
+    lookup = RosdepLookup.create_from_rospkg(rospack=rospack, rosstack=rosstack,
+                                             sources_loader=create_test_SourcesListLoader())
+    lookup.load_resolve_cache(filepath)
+    assert not lookup._resolve_cache
+
 def test_RosdepLookup_resolve_all():
     from rosdep2 import create_default_installer_context
     from rosdep2.lookup import RosdepLookup
@@ -464,3 +504,62 @@ def test_RosdepLookup_resolve_all():
                 apt_resolutions.extend(v)
         assert set(apt_resolutions) == set(['libtinyxml-dev', 'libboost1.40-all-dev', 'libtool', 'libltdl-dev']), set(apt_resolutions)
         
+
+def test_RosdepLookup_resolve_all_prefetch():
+    from rosdep2 import create_default_installer_context
+    from rosdep2.lookup import RosdepLookup
+    rospack, rosstack = get_test_rospkgs()
+
+    def create_lookup():
+        sources_loader = create_test_SourcesListLoader()
+        return RosdepLookup.create_from_rospkg(rospack=rospack, rosstack=rosstack,
+                                               sources_loader=sources_loader)
+    installer_context = create_default_installer_context()
+    installer_context.set_os_override('ubuntu', 'lucid')
+    apt = installer_context.get_installer('apt')
+    resources = ['rospack_fake', 'roscpp_fake']
+
+    # without installers implementing prefetch_resolve, rules are looked up once
+    for name in installer_context.get_installer_keys():
+        if name != 'apt':
+            installer_context.set_installer(name, None)
+    lookup = create_lookup()
+    with patch.object(lookup, '_get_rule', wraps=lookup._get_rule) as get_rule:
+        resolutions, errors = lookup.resolve_all(resources, installer_context)
+        assert not errors, errors
+        looked_up = [c[0][0] for c in get_rule.call_args_list]
+        assert sorted(looked_up) == sorted(set(looked_up)), looked_up
+
+    lookup = create_lookup()
+    with patch.object(type(apt), 'prefetch_resolve') as prefetch_resolve:
+        with patch.object(lookup, '_get_rule', wraps=lookup._get_rule) as get_rule:
+            resolutions, errors = lookup.resolve_all(resources, installer_context)
+            assert not errors, errors
+            # the actual resolution reuses the rules of the prefetch
+            assert sorted(looked_up) == sorted([c[0][0] for c in get_rule.call_args_list])
+        # all apt rules of both resources are prefetched in one batch
+        assert prefetch_resolve.call_count == 1
+        prefetched = set()
+        for rosdep_args in prefetch_resolve.call_args[0][0]:
+            prefetched.update(apt.resolve(rosdep_args))
+        assert set(['libtinyxml-dev', 'libboost1.40-all-dev', 'libtool', 'libltdl-dev']) <= prefetched, prefetched
+
+        # resolutions are cached now, so there is nothing left to prefetch
+        lookup.resolve_all(resources, installer_context)
+        assert prefetch_resolve.call_count == 1
+
+    # errors are left for the actual resolution to report
+    from rosdep2 import InvalidData
+    lookup = create_lookup()
+    get_rosdeps = lookup.loader.get_rosdeps
+    calls = []
+    def fail_once(*args, **kwargs):
+        calls.append(args)
+        if len(calls) == 1:
+            raise InvalidData('bad manifest')
+        return get_rosdeps(*args, **kwargs)
+    with patch.object(type(apt), 'prefetch_resolve') as prefetch_resolve:
+        with patch.object(lookup.loader, 'get_rosdeps', side_effect=fail_once):
+            resolutions, errors = lookup.resolve_all(['roscpp_fake'], installer_context)
+    assert not errors, errors
+    assert len(calls) == 2
@@ -26,7 +26,9 @@
 # POSSIBILITY OF SUCH DAMAGE.
 
 import os
+import shutil
 import sys
+import tempfile
 import cStringIO
 
 import rospkg
@@ -48,6 +50,15 @@ def get_cache_dir():
     assert os.path.isdir(p)
     return p
 
+def copy_cache_dir():
+    """
+    :returns: path of a temporary copy of the sources cache, as
+      commands write to it
+    """
+    p = os.path.join(tempfile.mkdtemp(), 'sources_cache')
+    shutil.copytree(get_cache_dir(), p, ignore=shutil.ignore_patterns('resolve-cache-*'))
+    return p
+
 from rosdep2.main import rosdep_main
 
 from contextlib import contextmanager
@@ -74,15 +85,17 @@ class TestRosdepMain(unittest.TestCase):
         if 'ROS_ROOT' in os.environ:
             del os.environ['ROS_ROOT']
         os.environ['ROS_PACKAGE_PATH'] = os.path.join(get_test_tree_dir())
+        self.sources_cache = copy_cache_dir()
 
     def tearDown(self):
+        shutil.rmtree(os.path.dirname(self.sources_cache))
         if self.old_rr is not None:
             os.environ['ROS_ROOT'] = self.old_rr
         if self.old_rpp is not None:
             os.environ['ROS_PACKAGE_PATH'] = self.old_rpp
 
     def test_bad_commands(self):
-        sources_cache = get_cache_dir()
+        sources_cache = self.sources_cache
         cmd_extras = ['-c', sources_cache]
         for commands in [[], ['fake', 'something'], ['check'], ['install', '-a', 'rospack_fake'],
                          ['check', 'rospack_fake', '--os', 'ubuntulucid'],
@@ -94,7 +107,7 @@ class TestRosdepMain(unittest.TestCase):
                 pass
         
     def test_check(self):
-        sources_cache = get_cache_dir()
+        sources_cache = self.sources_cache
         cmd_extras = ['-c', sources_cache]
 
         with fakeout() as b:
@@ -134,7 +147,7 @@ class TestRosdepMain(unittest.TestCase):
             pass
 
     def test_install(self):
-        sources_cache = get_cache_dir()
+        sources_cache = self.sources_cache
         cmd_extras = ['-c', sources_cache]
 
         try:
@@ -159,7 +172,7 @@ class TestRosdepMain(unittest.TestCase):
 
     def test_where_defined(self):
         try:
-            sources_cache = get_cache_dir()
+            sources_cache = self.sources_cache
             expected = GITHUB_PYTHON_URL 
             for command in (['where_defined', 'testpython'], ['where_defined', 'testpython']):
                 with fakeout() as b:
@@ -173,7 +186,7 @@ class TestRosdepMain(unittest.TestCase):
         
     def test_what_needs(self):
         try:
-            sources_cache = get_cache_dir()
+            sources_cache = self.sources_cache
             cmd_extras = ['-c', sources_cache]
             expected = ['python_dep']
             with fakeout() as b:
@@ -187,11 +200,13 @@ class TestRosdepMain(unittest.TestCase):
                 stdout, stderr = b
                 output = stdout.getvalue().strip()
                 assert output.split('\n') == expected
+            # read-only query, no resolution cache is written
+            assert not [f for f in os.listdir(sources_cache) if f.startswith('resolve-cache-')]
         except SystemExit:
             assert False, "system exit occurred"
 
     def test_keys(self):
-        sources_cache = get_cache_dir()
+        sources_cache = self.sources_cache
         cmd_extras = ['-c', sources_cache]
 
         try:
@@ -69,6 +69,29 @@ def test_RosdepDatabase():
     assert set(entry.view_dependencies) == set(['baz', 'blah'])
     
 
+def test_RosdepDatabase_set_view_data_loader():
+    from rosdep2.model import RosdepDatabase
+
+    calls = []
+    def loader():
+        calls.append(1)
+        return {'a': 1}
+    db = RosdepDatabase()
+    db.set_view_data_loader('foo', loader, ['bar'], 'origin1')
+    assert db.is_loaded('foo')
+    entry = db.get_view_data('foo')
+    assert entry.origin == 'origin1'
+    assert entry.view_dependencies == ['bar']
+    # data is not loaded until accessed, and only once
+    assert calls == []
+    assert entry.rosdep_data == {'a': 1}
+    assert entry.rosdep_data == {'a': 1}
+    assert calls == [1]
+
+    # views without data are empty
+    db.set_view_data_loader('baz', lambda: None, [], 'origin2')
+    assert db.get_view_data('baz').rosdep_data == {}
+
 def test_RosdepDatabase_get_view_dependencies():
     from rosdep2.model import RosdepDatabase
 
@@ -88,12 +88,10 @@ def test_PipInstaller():
 
         # no interactive option with PIP
         mock_method.return_value = ['a', 'b']
-        expected = [['sudo', 'pip', 'install', '-U', 'a'],
-                    ['sudo', 'pip', 'install', '-U', 'b']]
+        expected = [['sudo', 'pip', 'install', '-U', 'a', 'b']]
         val = installer.get_install_command(['whatever'], interactive=False)
         assert val == expected, val
-        expected = [['sudo', 'pip', 'install', '-U', 'a'],
-                    ['sudo', 'pip', 'install', '-U', 'b']]
+        expected = [['sudo', 'pip', 'install', '-U', 'a', 'b']]
         val = installer.get_install_command(['whatever'], interactive=True)
         assert val == expected, val
     try:
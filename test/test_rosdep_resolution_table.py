@@ -0,0 +1,110 @@
+# Copyright (c) 2011, Willow Garage, Inc.
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the Willow Garage, Inc. nor the names of its
+#       contributors may be used to endorse or promote products derived from
+#       this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+import os
+import tempfile
+import yaml
+
+from rospkg import RosPack, RosStack
+
+def get_tree_dir():
+    return os.path.abspath(os.path.join(os.path.dirname(__file__), 'tree'))
+
+def create_lookup(tempdir):
+    from rosdep2.lookup import RosdepLookup
+    from rosdep2.sources_list import update_sources_list, SourcesListLoader, DataSourceMatcher
+    path = os.path.join(tempdir, 'base.yaml')
+    with open(path, 'w') as f:
+        f.write(yaml.safe_dump({
+            'testtinyxml': {'ubuntu': ['libtinyxml-dev']},
+            'testlibtool': {'ubuntu': {'lucid': {'apt': {'packages': ['libtool', 'libltdl-dev']}}}},
+            'testsource': {'ubuntu': {'source': {'uri': 'file:///fake.rdmanifest'}}},
+            'testfedora': {'fedora': ['foo']},
+            }))
+    sources_list_dir = os.path.join(tempdir, 'sources.list.d')
+    os.makedirs(sources_list_dir)
+    with open(os.path.join(sources_list_dir, '10-local.list'), 'w') as f:
+        f.write('yaml file://%s\n'%(path))
+    sources_cache_dir = os.path.join(tempdir, 'cache')
+    matcher = DataSourceMatcher(['ubuntu'])
+    update_sources_list(sources_list_dir=sources_list_dir, sources_cache_dir=sources_cache_dir, matcher=matcher)
+
+    sources_loader = SourcesListLoader.create_default(matcher=matcher, sources_cache_dir=sources_cache_dir)
+    test_dir = get_tree_dir()
+    ros_root = os.path.join(test_dir, 'ros')
+    ros_paths = [ros_root, os.path.join(test_dir, 'stacks')]
+    rospack, rosstack = RosPack(ros_paths=ros_paths), RosStack(ros_paths=ros_paths)
+    return RosdepLookup.create_from_rospkg(rospack=rospack, rosstack=rosstack, sources_loader=sources_loader)
+
+def test_resolution_table():
+    from rosdep2 import create_default_installer_context
+    from rosdep2.resolution_table import create_resolution_table, write_resolution_table, \
+         load_resolution_table
+    from rosdep2.rospkg_loader import DEFAULT_VIEW_KEY
+    from rosdep2.sources_list import write_cache_file
+    tempdir = tempfile.mkdtemp()
+    lookup = create_lookup(tempdir)
+    installer_context = create_default_installer_context()
+    installer_context.set_os_override('ubuntu', 'lucid')
+
+    # nothing compiled yet
+    assert load_resolution_table(lookup.sources_loader, installer_context) is None
+
+    table = create_resolution_table(lookup, installer_context)
+    assert table.os_name == 'ubuntu'
+    assert table.os_version == 'lucid'
+    assert table.view_name == DEFAULT_VIEW_KEY
+    assert table.resolutions['testtinyxml'] == ('apt', ['libtinyxml-dev'], [])
+    assert table.resolutions['testlibtool'] == ('apt', ['libtool', 'libltdl-dev'], [])
+    # source rules are resolved live, unresolvable keys are skipped
+    assert 'testsource' not in table.resolutions
+    assert 'testfedora' not in table.resolutions
+    assert table.get('testtinyxml', DEFAULT_VIEW_KEY, 'ubuntu', 'lucid') == ('apt', ['libtinyxml-dev'], [])
+    assert table.get('testtinyxml', DEFAULT_VIEW_KEY, 'ubuntu', 'precise') is None
+    assert table.get('testtinyxml', 'other', 'ubuntu', 'lucid') is None
+
+    path = write_resolution_table(lookup.sources_loader, table)
+    assert os.path.isfile(path)
+    loaded = load_resolution_table(lookup.sources_loader, installer_context)
+    assert loaded.resolutions == table.resolutions
+
+    # other OS versions are not covered
+    other_context = create_default_installer_context()
+    other_context.set_os_override('ubuntu', 'precise')
+    assert load_resolution_table(lookup.sources_loader, other_context) is None
+
+    # lookup answers from table instead of definitions
+    loaded.resolutions['testtinyxml'] = ('apt', ['from-table'], [])
+    lookup.resolution_table = loaded
+    assert lookup.resolve('testtinyxml', 'rospack_fake', installer_context) == ('apt', ['from-table'], [])
+    assert lookup.resolve('testtinyxml', 'rospack_fake', other_context)[1] == ['libtinyxml-dev']
+    assert lookup.resolve('testlibtool', 'rospack_fake', installer_context)[1] == ['libtool', 'libltdl-dev']
+
+    # stale once sources change
+    write_cache_file(lookup.sources_loader.sources_cache_dir, lookup.sources_loader.sources[0].url, {'new': {}})
+    assert load_resolution_table(lookup.sources_loader, installer_context) is None
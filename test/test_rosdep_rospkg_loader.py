@@ -174,3 +174,73 @@ def test_RosPkgLoader_get_loadable():
         assert s in keys
 
 
+
+def test_RosPkgLoader_get_rosdeps_catkin():
+    import tempfile
+    from rosdep2.rospkg_loader import RosPkgLoader
+    template = """<package>
+  <name>catkin_fake</name>
+  <version>0.1.0</version>
+  <description>fake</description>
+  <maintainer email="fake@example.com">fake</maintainer>
+  <license>BSD</license>
+  <buildtool_depend>catkin</buildtool_depend>
+  %s
+</package>
+"""
+    ros_path = tempfile.mkdtemp()
+    package_dir = os.path.join(ros_path, 'catkin_fake')
+    os.makedirs(package_dir)
+    def write_package_xml(depends):
+        with open(os.path.join(package_dir, 'package.xml'), 'w') as f:
+            f.write(template%(''.join(['<build_depend>%s</build_depend>'%(d) for d in depends])))
+    write_package_xml(['boost'])
+    loader = RosPkgLoader(RosPack(ros_paths=[ros_path]), RosStack(ros_paths=[ros_path]))
+    assert loader.get_rosdeps('catkin_fake') == ['boost', 'catkin']
+    assert list(loader.rosdeps_cache.values()) == [['boost', 'catkin']]
+
+    # answered from cache while package.xml is unchanged
+    key = list(loader.rosdeps_cache.keys())[0]
+    loader.rosdeps_cache[key] = ['cached']
+    assert loader.get_rosdeps('catkin_fake') == ['cached']
+
+    write_package_xml(['eigen'])
+    assert loader.get_rosdeps('catkin_fake') == ['eigen', 'catkin']
+    assert len(loader.rosdeps_cache) == 2
+
+def test_RosPkgLoader_prefetch_rosdeps():
+    import tempfile
+    from mock import patch
+    from rosdep2.rospkg_loader import RosPkgLoader, PREFETCH_PROCESS_THRESHOLD
+    ros_path = tempfile.mkdtemp()
+    names = []
+    for i in range(PREFETCH_PROCESS_THRESHOLD + 2):
+        name = 'catkin_fake%d'%(i)
+        os.makedirs(os.path.join(ros_path, name))
+        with open(os.path.join(ros_path, name, 'package.xml'), 'w') as f:
+            f.write("""<package>
+  <name>%s</name>
+  <version>0.1.0</version>
+  <description>fake</description>
+  <maintainer email="fake@example.com">fake</maintainer>
+  <license>BSD</license>
+  <run_depend>dep%d</run_depend>
+</package>
+"""%(name, i))
+        names.append(name)
+    loader = RosPkgLoader(RosPack(ros_paths=[ros_path]), RosStack(ros_paths=[ros_path]))
+    # unknown resources are left to get_rosdeps()
+    loader.prefetch_rosdeps(names + ['fake'])
+    assert len(loader.rosdeps_cache) == len(names)
+    # package.xml files are hashed once
+    with patch('rosdep2.rospkg_loader._parse_catkin_rosdeps', side_effect=AssertionError("should not parse")):
+        with patch('rosdep2.rospkg_loader.hashlib.sha1', side_effect=AssertionError("should not hash")):
+            for i, name in enumerate(names):
+                assert loader.get_rosdeps(name) == ['dep%d'%(i)]
+    # changed files are read again
+    filename = os.path.join(ros_path, names[0], 'package.xml')
+    with open(filename) as f:
+        contents = f.read()
+    with open(filename, 'w') as f:
+        f.write(contents.replace('<run_depend>dep0</run_depend>', '<run_depend>changed</run_depend>'))
+    assert loader.get_rosdeps(names[0]) == ['changed']
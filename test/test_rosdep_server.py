@@ -0,0 +1,124 @@
+# Copyright (c) 2011, Willow Garage, Inc.
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the Willow Garage, Inc. nor the names of its
+#       contributors may be used to endorse or promote products derived from
+#       this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+import os
+import tempfile
+import yaml
+
+def create_sources_cache(tempdir):
+    from rosdep2.sources_list import update_sources_list, DataSourceMatcher
+    path = os.path.join(tempdir, 'base.yaml')
+    with open(path, 'w') as f:
+        f.write(yaml.safe_dump({'testtinyxml': {'ubuntu': ['libtinyxml-dev']}}))
+    sources_list_dir = os.path.join(tempdir, 'sources.list.d')
+    os.makedirs(sources_list_dir)
+    with open(os.path.join(sources_list_dir, '10-local.list'), 'w') as f:
+        f.write('yaml file://%s\n'%(path))
+    sources_cache_dir = os.path.join(tempdir, 'cache')
+    update_sources_list(sources_list_dir=sources_list_dir, sources_cache_dir=sources_cache_dir,
+                        matcher=DataSourceMatcher(['ubuntu']))
+    return sources_cache_dir
+
+def test_handle_request():
+    from rosdep2 import main
+    from rosdep2.server import handle_request
+    tempdir = tempfile.mkdtemp()
+    sources_cache_dir = create_sources_cache(tempdir)
+    tree_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), 'tree'))
+    env = {'ROS_PACKAGE_PATH': os.path.join(tree_dir, 'stacks'), 'ROS_HOME': tempdir}
+    args = ['-c', sources_cache_dir, '--os', 'ubuntu:lucid', 'resolve', 'testtinyxml']
+
+    # not served
+    for fallback_args in [['install', 'roscpp'], ['update'], ['--version'], [], ['--bad-option']]:
+        assert handle_request({'args': fallback_args, 'env': env, 'cwd': tempdir}) == {'fallback': True}
+
+    environ, cwd = dict(os.environ), os.getcwd()
+    main.set_caching(True)
+    try:
+        for count in range(2):
+            response = handle_request({'args': args, 'env': env, 'cwd': tempdir})
+            assert response['exit_code'] == 0, response
+            assert response['stdout'] == '#apt\nlibtinyxml-dev\n', response
+            assert len(main._lookup_cache) == 1
+        lookup = list(main._lookup_cache.values())[0][0]
+
+        # sources are kept loaded, workspace packages are crawled for every command
+        workspace = os.path.join(tempdir, 'workspace')
+        ws_env = dict(env, ROS_PACKAGE_PATH=workspace)
+        ws_args = args[:-2] + ['what-needs', 'testtinyxml']
+        def add_package(name):
+            os.makedirs(os.path.join(workspace, name))
+            with open(os.path.join(workspace, name, 'manifest.xml'), 'w') as f:
+                f.write('<package><rosdep name="testtinyxml"/></package>\n')
+        add_package('foo_fake')
+        response = handle_request({'args': ws_args, 'env': ws_env, 'cwd': tempdir})
+        assert response['stdout'] == 'foo_fake\n', response
+        add_package('bar_fake')
+        response = handle_request({'args': ws_args, 'env': ws_env, 'cwd': tempdir})
+        assert sorted(response['stdout'].split()) == ['bar_fake', 'foo_fake'], response
+        assert len(main._lookup_cache) == 2
+
+        response = handle_request({'args': args[:-1] + ['fake'], 'env': env, 'cwd': tempdir})
+        assert response['exit_code'] == 1, response
+        assert 'no rosdep rule for' in response['stderr'], response
+
+        # missing working directory
+        response = handle_request({'args': args, 'env': env, 'cwd': os.path.join(tempdir, 'missing')})
+        assert response == {'fallback': True}, response
+
+        # reloaded after update
+        index = os.path.join(sources_cache_dir, 'index')
+        os.utime(index, (1000, 1000))
+        response = handle_request({'args': args, 'env': env, 'cwd': tempdir})
+        assert response['exit_code'] == 0, response
+        assert lookup not in [v[0] for v in main._lookup_cache.values()]
+    finally:
+        main.set_caching(False)
+    assert dict(os.environ) == environ
+    assert os.getcwd() == cwd
+
+def test_serve_connection():
+    import json
+    import socket
+    from rosdep2.server import _serve_connection
+    environ, cwd = dict(os.environ), os.getcwd()
+    for line in [b'not json\n', b'{"args": ["keys", "roscpp"]}\n',
+                 # unexpected errors are not fatal either
+                 json.dumps({'args': ['keys', 'roscpp'], 'env': {'FOO': 1}, 'cwd': '/'}).encode('utf-8') + b'\n']:
+        server, client = socket.socketpair()
+        try:
+            client.sendall(line)
+            _serve_connection(server)
+            f = client.makefile('rb')
+            assert json.loads(f.readline().decode('utf-8')) == {'fallback': True}
+            f.close()
+        finally:
+            server.close()
+            client.close()
+    assert dict(os.environ) == environ
+    assert os.getcwd() == cwd
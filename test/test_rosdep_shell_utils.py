@@ -25,6 +25,8 @@
 # ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
 # POSSIBILITY OF SUCH DAMAGE.
 
+import os
+
 def test_create_tempfile_from_string_and_execute():
     # not sure how to test this just yet, for now just a tripwire
     from rosdep2.shell_utils import create_tempfile_from_string_and_execute
@@ -32,6 +34,47 @@ def test_create_tempfile_from_string_and_execute():
     assert create_tempfile_from_string_and_execute('#!/bin/sh\necho "hello"'), "ls command failed"
     assert not create_tempfile_from_string_and_execute('bad'), "bad command did not fail"
 
+def test_get_shell_command():
+    from rosdep2.shell_utils import get_shell_command
+    assert ['/bin/bash', '-c'] == get_shell_command('#!/bin/bash\nexit 0\n')
+    assert ['/bin/sh', '-e', '-c'] == get_shell_command('\n#!/bin/sh -e\nexit 0\n')
+    assert ['/usr/bin/env', 'bash', '-c'] == get_shell_command('#!/usr/bin/env bash\nexit 0\n')
+    assert None == get_shell_command('#!/usr/bin/env python\nimport sys\n')
+    assert None == get_shell_command('exit 0\n')
+    assert None == get_shell_command('')
+
+def test_execute_string_script():
+    import sys
+    import tempfile
+    try:
+        from cStringIO import StringIO
+    except ImportError:
+        from io import StringIO
+    from rosdep2.shell_utils import execute_string_script
+    assert execute_string_script('#!/bin/sh\necho "hello"')
+    assert not execute_string_script('#!/bin/sh\nexit 3')
+    assert not execute_string_script('bad'), "bad command did not fail"
+    path = os.path.realpath(tempfile.gettempdir())
+    assert execute_string_script('#!/bin/bash\ntest "$(pwd -P)" = "%s"\n'%(path), path=path)
+    assert execute_string_script('#!/usr/bin/env python\nimport sys\nsys.exit(0)\n')
+    # commands reading stdin must not consume the rest of the script
+    assert not execute_string_script('#!/bin/sh\ncat\nexit 3\n')
+    assert not execute_string_script('#!/usr/bin/env python\nimport sys\nsys.exit(len(sys.stdin.read()) + 3)\n')
+
+    # output is collected on both paths, and only printed when verbose
+    old_stdout = sys.stdout
+    try:
+        for script in ['#!/bin/sh\necho "hello-sh"\n',
+                       '#!/usr/bin/env python\nprint("hello-py")\n']:
+            sys.stdout = b = StringIO()
+            assert execute_string_script(script)
+            assert '' == b.getvalue()
+            sys.stdout = b = StringIO()
+            assert execute_string_script(script, verbose=True)
+            assert 'hello-' in b.getvalue().split('}}}')[-1], b.getvalue()
+    finally:
+        sys.stdout = old_stdout
+
 def test_read_stdout():
     from rosdep2.shell_utils import read_stdout
     assert 'foo' in read_stdout(['echo', 'foo'])
@@ -138,6 +138,13 @@ exit 0
     assert installer.is_installed(resolved)
     
 def test_source_detect():
+    import sys
+    import tempfile
+    import shutil
+    try:
+        from cStringIO import StringIO
+    except ImportError:
+        from io import StringIO
     from rosdep2.platforms.source import source_detect, SourceInstall
     resolved = SourceInstall()
     resolved.check_presence_command = """#!/bin/bash
@@ -156,6 +163,45 @@ exit 0
     retval = source_detect(resolved, exec_fn=yes)
     assert resolved == retval, retval
     assert [] == source_detect(resolved, exec_fn=no)
+
+    # scripts run concurrently, results keep the order of the input:
+    # each script waits until all of them have created their marker
+    # file, and reports itself as missing if they never do
+    tmpdir = tempfile.mkdtemp()
+    try:
+        for i, r in enumerate(resolved):
+            r.check_presence_command = """#!/bin/sh
+touch '%(dir)s/%(i)d'
+for n in $(seq 100); do
+  if [ $(ls '%(dir)s' | wc -l) -ge %(count)d ]; then exit %(retval)d; fi
+  sleep 0.1
+done
+exit 1
+"""%dict(dir=tmpdir, i=i, count=len(resolved), retval=i % 2)
+        assert [resolved[0], resolved[2]] == source_detect(resolved, jobs=len(resolved))
+    finally:
+        shutil.rmtree(tmpdir)
+
+    for i, r in enumerate(resolved):
+        r.check_presence_command = """#!/bin/sh
+exit %d
+"""%(i % 2)
+    assert [resolved[0], resolved[2]] == source_detect(resolved, jobs=1)
+
+    # the installer passes its verbosity to the scripts
+    from rosdep2.platforms.source import SourceInstaller
+    installer = SourceInstaller()
+    old_stdout = sys.stdout
+    try:
+        sys.stdout = b = StringIO()
+        assert [resolved[0], resolved[2]] == installer.detect_fn(resolved)
+        assert '' == b.getvalue()
+        installer.verbose = True
+        sys.stdout = b = StringIO()
+        assert [resolved[0], resolved[2]] == installer.detect_fn(resolved)
+        assert 'Executing script below' in b.getvalue()
+    finally:
+        sys.stdout = old_stdout
     
 def test_SourceInstaller_get_install_command():
     from rosdep2.platforms.source import SourceInstaller, SourceInstall
@@ -170,6 +216,11 @@ exit 1
     assert len(commands) == 1
     assert commands[0] == ['rosdep-source', 'install', 'http://fake/foo']
 
+    # tarballs are cached in the sources cache of rosdep
+    installer.sources_cache_dir = '/fake/sources.cache'
+    commands = installer.get_install_command([resolved])
+    assert commands[0] == ['rosdep-source', 'install', '-c', '/fake/sources.cache', 'http://fake/foo'], commands
+
     resolved = SourceInstall()
     resolved.manifest_url = 'http://fake/foo'
     resolved.check_presence_command = """#!/bin/bash
@@ -208,10 +259,115 @@ def test_SourceInstaller_resolve():
 
     # test again to activate caching
     resolved = installer.resolve(dict(uri=url, md5sum=md5sum_good))
+    assert type(resolved) == list
+    resolved = resolved[0]
     assert resolved.install_command == rep122_install_command
     assert resolved.check_presence_command == rep122_check_presence_command
 
-        
+
+def test_SourceInstaller_prefetch_resolve():
+    from mock import patch
+    from rosdep2.platforms.source import SourceInstaller, DownloadFailed, load_rdmanifest
+    with open(os.path.join(get_test_dir(), 'rep112-example.rdmanifest')) as f:
+        manifest = load_rdmanifest(f.read())
+
+    def fake_download(url, md5sum, alt_url=None):
+        if url == 'http://bad/x.rdmanifest':
+            if alt_url:
+                return manifest, alt_url
+            raise DownloadFailed('bad url')
+        return manifest, url
+    installer = SourceInstaller()
+    rosdep_args_list = [dict(uri='http://a/x.rdmanifest'),
+                        dict(uri='http://a/x.rdmanifest'),
+                        dict(uri='http://bad/x.rdmanifest', **{'alternate-uri': 'http://mirror/x.rdmanifest'}),
+                        dict(uri='http://bad/x.rdmanifest')]
+    with patch('rosdep2.platforms.source.download_rdmanifest', side_effect=fake_download) as m:
+        installer.prefetch_resolve(rosdep_args_list)
+    # duplicates are only downloaded once, failures are not cached
+    assert m.call_count == 2, m.call_args_list
+    assert set(installer._rdmanifest_cache.keys()) == set(['http://a/x.rdmanifest', 'http://mirror/x.rdmanifest'])
+
+    with patch('rosdep2.platforms.source.download_rdmanifest', side_effect=DownloadFailed('offline')) as m:
+        resolved = installer.resolve(dict(uri='http://a/x.rdmanifest'))
+        assert type(resolved) == list and len(resolved) == 1
+        assert resolved[0].install_command == rep122_install_command
+        resolved = installer.resolve(rosdep_args_list[2])
+        assert resolved[0].manifest_url == 'http://mirror/x.rdmanifest'
+        # nothing left to prefetch
+        installer.prefetch_resolve(rosdep_args_list[:3])
+    assert not m.called
+
+def test_rdmanifest_cache():
+    import tempfile
+    import shutil
+    import time
+    from rosdep2.platforms.source import load_cached_rdmanifest, write_cached_rdmanifest, get_cached_rdmanifest_path
+    with open(os.path.join(get_test_dir(), 'rep112-example.rdmanifest')) as f:
+        contents = f.read()
+    url = 'http://a/x.rdmanifest'
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        cache_dir = os.path.join(tmp_dir, 'rdmanifests')
+        assert load_cached_rdmanifest(cache_dir, url) is None
+        write_cached_rdmanifest(cache_dir, url, contents)
+        assert load_cached_rdmanifest(cache_dir, url) == contents
+        assert load_cached_rdmanifest(cache_dir, 'http://b/x.rdmanifest') is None
+        assert load_cached_rdmanifest(cache_dir, url, REP112_MD5SUM) == contents
+        assert load_cached_rdmanifest(cache_dir, url, 'fake') is None
+
+        # entries without md5sum expire, pinned ones do not
+        old = time.time() - 3600
+        os.utime(get_cached_rdmanifest_path(cache_dir, url), (old, old))
+        assert load_cached_rdmanifest(cache_dir, url, ttl=60) is None
+        assert load_cached_rdmanifest(cache_dir, url, ttl=None) == contents
+        assert load_cached_rdmanifest(cache_dir, url, REP112_MD5SUM, ttl=60) == contents
+    finally:
+        shutil.rmtree(tmp_dir)
+
+def test_SourceInstaller_resolve_rdmanifest_cache():
+    import tempfile
+    import shutil
+    from mock import patch
+    from rosdep2.platforms.source import SourceInstaller, DownloadFailed, InvalidData, get_cached_rdmanifest_path
+    with open(os.path.join(get_test_dir(), 'rep112-example.rdmanifest')) as f:
+        contents = f.read()
+    url = 'http://a/x.rdmanifest'
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        installer = SourceInstaller(rdmanifest_cache_dir=tmp_dir)
+        with patch('rosdep2.platforms.source._fetch_rdmanifest', return_value=(contents, url)) as m:
+            resolved = installer.resolve(dict(uri=url, md5sum=REP112_MD5SUM))
+        assert m.call_count == 1
+        assert resolved[0].install_command == rep122_install_command
+        assert os.path.isfile(get_cached_rdmanifest_path(tmp_dir, url))
+
+        # a new process resolves pinned and fresh rdmanifests offline
+        with patch('rosdep2.platforms.source._fetch_rdmanifest', side_effect=DownloadFailed('offline')) as m:
+            installer = SourceInstaller(rdmanifest_cache_dir=tmp_dir)
+            resolved = installer.resolve(dict(uri=url, md5sum=REP112_MD5SUM))
+            assert resolved[0].install_command == rep122_install_command
+            assert resolved[0].manifest_url == url
+            installer = SourceInstaller(rdmanifest_cache_dir=tmp_dir)
+            installer.prefetch_resolve([dict(uri=url)])
+            assert url in installer._rdmanifest_cache
+            # outdated entries are used only if the download fails
+            installer = SourceInstaller(rdmanifest_cache_dir=tmp_dir, rdmanifest_cache_ttl=-1)
+            assert installer.resolve(dict(uri=url))[0].manifest_url == url
+            assert m.call_count == 1
+            installer = SourceInstaller(rdmanifest_cache_dir=tmp_dir)
+            try:
+                installer.resolve(dict(uri=url, md5sum='fake'))
+                assert False, "should have raised"
+            except InvalidData:
+                pass
+        with patch('rosdep2.platforms.source._fetch_rdmanifest', return_value=(contents, url)) as m:
+            installer = SourceInstaller(rdmanifest_cache_dir=tmp_dir, rdmanifest_cache_ttl=-1)
+            installer.resolve(dict(uri=url))
+        assert m.call_count == 1
+    finally:
+        shutil.rmtree(tmp_dir)
+
 def test_load_rdmanifest():
     from rosdep2.platforms.source import load_rdmanifest, InvalidRdmanifest
     # load_rdmanifest is just a YAML unmarshaller with an exception change
@@ -295,3 +451,73 @@ exit 0
 """
     resolved.exec_path = ''
     install_source(resolved)
+
+def test_fetch_tarball():
+    import tarfile
+    import tempfile
+    import shutil
+    from rosdep2.platforms.source import fetch_tarball, install_source, get_file_hash, SourceInstall, InstallFailed
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        tarball = os.path.join(tmp_dir, 'foo.tar.gz')
+        tarf = tarfile.open(tarball, 'w:gz')
+        tarf.add(os.path.join(get_test_dir(), 'rep112-example.rdmanifest'), 'foo/rep112-example.rdmanifest')
+        tarf.close()
+        md5sum = get_file_hash(tarball)
+        cache_dir = os.path.join(tmp_dir, 'tarballs')
+        filename = os.path.join(tmp_dir, 'download.tar.gz')
+
+        resolved = SourceInstall()
+        resolved.tarball = 'file://' + os.path.join(tmp_dir, 'missing.tar.gz')
+        resolved.alternate_tarball = 'file://' + tarball
+        resolved.tarball_md5sum = 'fake'
+        try:
+            fetch_tarball(resolved, filename, cache_dir)
+            assert False, "should have raised"
+        except InstallFailed:
+            pass
+        assert not os.path.exists(cache_dir)
+
+        # the alternate tarball is used if the download fails, verified tarballs are cached
+        resolved.tarball_md5sum = md5sum
+        fetch_tarball(resolved, filename, cache_dir)
+        assert get_file_hash(filename) == md5sum
+        assert os.listdir(cache_dir) == [md5sum]
+
+        # corrupt cache entries are replaced
+        with open(os.path.join(cache_dir, md5sum), 'w') as f:
+            f.write('truncated')
+        fetch_tarball(resolved, filename, cache_dir)
+        assert get_file_hash(filename) == md5sum
+        assert get_file_hash(os.path.join(cache_dir, md5sum)) == md5sum
+
+        # cached tarballs are used without downloading
+        good = os.path.join(tmp_dir, 'good.tar.gz')
+        os.rename(tarball, good)
+        os.unlink(filename)
+        fetch_tarball(resolved, filename, cache_dir)
+        assert get_file_hash(filename) == md5sum
+        try:
+            fetch_tarball(resolved, filename)
+            assert False, "should have raised"
+        except InstallFailed:
+            pass
+        # corrupt cache entries are not installed
+        with open(os.path.join(cache_dir, md5sum), 'w') as f:
+            f.write('truncated')
+        try:
+            fetch_tarball(resolved, filename, cache_dir)
+            assert False, "should have raised"
+        except InstallFailed:
+            pass
+        assert not os.path.exists(os.path.join(cache_dir, md5sum))
+        # restore for install_source()
+        shutil.copyfile(good, os.path.join(cache_dir, md5sum))
+
+        resolved.install_command = """#!/bin/sh
+test -f rep112-example.rdmanifest
+"""
+        resolved.exec_path = 'foo'
+        install_source(resolved, cache_dir)
+    finally:
+        shutil.rmtree(tmp_dir)
@@ -26,9 +26,11 @@
 # POSSIBILITY OF SUCH DAMAGE.
 
 import os
+import hashlib
 import tempfile
 import yaml
 import urllib2
+from mock import patch
 
 import rospkg.distro
 import rosdep2.sources_list
@@ -178,6 +180,25 @@ def test_write_cache_file():
     with open(filepath, 'r') as f:
         assert {'data': 1} == yaml.load(f.read())
     
+def test_load_cache_file():
+    from rosdep2.sources_list import write_cache_file, load_cache_file, PICKLE_SUFFIX
+    tempdir = tempfile.mkdtemp()
+
+    filepath = write_cache_file(tempdir, 'foo', {'data': 1, 'list': ['a', 'b']})
+    assert os.path.exists(filepath + PICKLE_SUFFIX)
+    assert {'data': 1, 'list': ['a', 'b']} == load_cache_file(filepath)
+
+    # pre-parsed form is ignored once YAML changes
+    with open(filepath, 'w') as f:
+        f.write(yaml.safe_dump({'data': 2}))
+    assert {'data': 2} == load_cache_file(filepath)
+
+    # and if it is corrupt
+    filepath = write_cache_file(tempdir, 'bar', {'data': 3})
+    with open(filepath + PICKLE_SUFFIX, 'w') as f:
+        f.write('garbage')
+    assert {'data': 3} == load_cache_file(filepath)
+
 def test_update_sources_list():
     from rosdep2.sources_list import update_sources_list, InvalidData, compute_filename_hash
     sources_list_dir=get_test_dir()
@@ -217,6 +238,156 @@ yaml %s python
 yaml %s ubuntu"""%(GITHUB_URL, GITHUB_PYTHON_URL, BADHOSTNAME_URL)
     assert expected == index, "\n[%s]\nvs\n[%s]"%(expected, index)
 
+def create_local_sources_list(tempdir, count=5):
+    """
+    Create sources list directory with *count* file:// sources plus a
+    trailing source that does not exist.
+
+    :returns: sources_list_dir, [urls]
+    """
+    sources_list_dir = os.path.join(tempdir, 'sources.list.d')
+    os.makedirs(sources_list_dir)
+    urls = []
+    for i in range(count):
+        path = os.path.join(tempdir, 'source%s.yaml'%(i))
+        with open(path, 'w') as f:
+            f.write(yaml.safe_dump({'key%s'%(i): {'ubuntu': ['pkg%s'%(i)]}, 'shared': {'ubuntu': ['from%s'%(i)]}}))
+        urls.append('file://' + path)
+    urls.append('file://' + os.path.join(tempdir, 'missing.yaml'))
+    with open(os.path.join(sources_list_dir, '10-local.list'), 'w') as f:
+        f.write('\n'.join(['yaml %s'%(url) for url in urls]))
+    return sources_list_dir, urls
+
+def test_update_sources_list_jobs():
+    from rosdep2.sources_list import update_sources_list, compute_filename_hash
+    for jobs in [1, 3, 16]:
+        tempdir = tempfile.mkdtemp()
+        sources_list_dir, urls = create_local_sources_list(tempdir)
+        sources_cache_dir = os.path.join(tempdir, 'cache')
+        handled = []
+        def success_handler(source):
+            handled.append(source.url)
+        def error_handler(source, e):
+            handled.append(('error', source.url))
+        retval = update_sources_list(sources_list_dir=sources_list_dir,
+                                     sources_cache_dir=sources_cache_dir,
+                                     success_handler=success_handler,
+                                     error_handler=error_handler, jobs=jobs)
+        # handlers are called in sources list order
+        assert handled == urls[:-1] + [('error', urls[-1])], handled
+        assert [s.url for s, _ in retval] == urls[:-1]
+        for source, path in retval:
+            assert path == os.path.join(sources_cache_dir, compute_filename_hash(source.url))
+            with open(path) as f:
+                assert 'shared' in yaml.load(f)
+        with open(os.path.join(sources_cache_dir, 'index')) as f:
+            index = f.read().split('\n')
+        assert index[1:-1] == ['yaml %s '%(url) for url in urls], index
+
+class _RevalidatingServer(object):
+    """
+    Local HTTP stand-in serving a single rosdep YAML file with an
+    ETag, answering conditional requests with 304.
+    """
+
+    def __init__(self, text):
+        import BaseHTTPServer
+        import threading
+        self.text = text
+        self.requests = []
+        server = self
+        class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+            def do_GET(self):
+                etag = '"%s"'%(hashlib.sha1(server.text).hexdigest())
+                server.requests.append(self.headers.get('If-None-Match'))
+                if self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header('ETag', etag)
+                self.send_header('Content-Length', str(len(server.text)))
+                self.end_headers()
+                self.wfile.write(server.text)
+            def log_message(self, *args):
+                pass
+        self.httpd = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:%s/rosdep.yaml'%(self.httpd.server_port)
+        self.thread = threading.Thread(target=self.httpd.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def shutdown(self):
+        self.httpd.shutdown()
+
+def test_update_sources_list_revalidate():
+    from rosdep2.sources_list import update_sources_list, get_validators
+    server = _RevalidatingServer(yaml.safe_dump({'foo': {'ubuntu': ['libfoo']}}))
+    try:
+        tempdir = tempfile.mkdtemp()
+        sources_list_dir = os.path.join(tempdir, 'sources.list.d')
+        sources_cache_dir = os.path.join(tempdir, 'cache')
+        os.makedirs(sources_list_dir)
+        with open(os.path.join(sources_list_dir, '10-local.list'), 'w') as f:
+            f.write('yaml %s\n'%(server.url))
+
+        retval = update_sources_list(sources_list_dir=sources_list_dir, sources_cache_dir=sources_cache_dir)
+        assert len(retval) == 1
+        path = retval[0][1]
+        validators = get_validators(sources_cache_dir, server.url)
+        assert validators['etag'], validators
+        assert validators['sha1'] == hashlib.sha1(server.text).hexdigest()
+        os.utime(path, (1000, 1000))
+
+        # unchanged upstream: conditional request, cache file not rewritten
+        retval = update_sources_list(sources_list_dir=sources_list_dir, sources_cache_dir=sources_cache_dir)
+        assert retval == [(retval[0][0], path)]
+        assert server.requests == [None, validators['etag']], server.requests
+        assert os.stat(path).st_mtime == 1000
+
+        # changed upstream: full download
+        server.text = yaml.safe_dump({'bar': {'ubuntu': ['libbar']}})
+        update_sources_list(sources_list_dir=sources_list_dir, sources_cache_dir=sources_cache_dir)
+        with open(path) as f:
+            assert 'bar' in yaml.load(f)
+        assert get_validators(sources_cache_dir, server.url)['etag'] != validators['etag']
+    finally:
+        server.shutdown()
+
+def test_update_sources_list_unchanged():
+    from rosdep2.sources_list import update_sources_list, load_cache_file, VALIDATORS_SUFFIX
+    tempdir = tempfile.mkdtemp()
+    sources_list_dir, urls = create_local_sources_list(tempdir, count=2)
+    sources_cache_dir = os.path.join(tempdir, 'cache')
+    # not the formatting safe_dump() would produce
+    with open(urls[0][len('file://'):], 'w') as f:
+        f.write("# comment\nkey0: {ubuntu: [pkg0], fedora: 1.10}\n")
+
+    retval = update_sources_list(sources_list_dir=sources_list_dir, sources_cache_dir=sources_cache_dir)
+    path = retval[0][1]
+    # downloaded text is stored verbatim
+    with open(path) as f:
+        assert f.read() == "# comment\nkey0: {ubuntu: [pkg0], fedora: 1.10}\n"
+    assert load_cache_file(path) == {'key0': {'ubuntu': ['pkg0'], 'fedora': '1.10'}}
+    for _, p in retval:
+        os.utime(p, (1000, 1000))
+        os.utime(p + VALIDATORS_SUFFIX, (1000, 1000))
+
+    # file:// does not support conditional requests, same content is not rewritten
+    retval2 = update_sources_list(sources_list_dir=sources_list_dir, sources_cache_dir=sources_cache_dir)
+    assert [p for _, p in retval2] == [p for _, p in retval]
+    for _, p in retval:
+        assert os.stat(p).st_mtime == 1000
+        assert os.stat(p + VALIDATORS_SUFFIX).st_mtime == 1000
+    # no leftover downloads
+    assert not [f for f in os.listdir(sources_cache_dir) if '.tmp.' in f]
+
+    with open(urls[1][len('file://'):], 'w') as f:
+        f.write("key1: {ubuntu: [changed]}\n")
+    update_sources_list(sources_list_dir=sources_list_dir, sources_cache_dir=sources_cache_dir)
+    assert os.stat(retval[0][1]).st_mtime == 1000
+    assert load_cache_file(retval[1][1]) == {'key1': {'ubuntu': ['changed']}}
+
 def test_load_cached_sources_list():
     from rosdep2.sources_list import load_cached_sources_list, update_sources_list
     tempdir = tempfile.mkdtemp()
@@ -245,6 +416,136 @@ def test_load_cached_sources_list():
     assert source2.rosdep_data is None
     assert source2.tags == ['ubuntu']
 
+def test_load_cached_sources_list_lazy():
+    from rosdep2.sources_list import load_cached_sources_list, update_sources_list, SourcesListLoader, DataSourceMatcher
+    from rosdep2.model import RosdepDatabase
+    tempdir = tempfile.mkdtemp()
+    sources_list_dir, urls = create_local_sources_list(tempdir, count=2)
+    sources_cache_dir = os.path.join(tempdir, 'cache')
+    update_sources_list(sources_list_dir=sources_list_dir, sources_cache_dir=sources_cache_dir)
+
+    retval = load_cached_sources_list(sources_cache_dir=sources_cache_dir)
+    assert len(retval) == 3
+    # nothing loaded yet
+    assert not [s for s in retval if s._rosdep_data is not None]
+    assert 'key1' in retval[1].rosdep_data
+    assert retval[0]._rosdep_data is None
+    assert retval[2].rosdep_data is None
+
+    # loading views does not read data either
+    loader = SourcesListLoader.create_default(matcher=DataSourceMatcher([]), sources_cache_dir=sources_cache_dir)
+    db = RosdepDatabase()
+    for view_name in loader.get_loadable_views():
+        loader.load_view(view_name, db)
+    assert not [s for s in loader.sources if s._rosdep_data is not None]
+    assert 'key0' in db.get_view_data(urls[0]).rosdep_data
+    assert {} == db.get_view_data(urls[2]).rosdep_data
+    assert loader.sources[0]._rosdep_data is not None
+    assert loader.sources[1]._rosdep_data is None
+
+def test_compiled_view():
+    from rosdep2.sources_list import update_sources_list, SourcesListLoader, DataSourceMatcher, \
+         load_compiled_view, write_cache_file
+    from rosdep2.lookup import RosdepLookup, RosdepView
+    from rosdep2.model import RosdepDatabaseEntry
+    tempdir = tempfile.mkdtemp()
+    sources_list_dir, urls = create_local_sources_list(tempdir, count=3)
+    sources_cache_dir = os.path.join(tempdir, 'cache')
+    matcher = DataSourceMatcher(['ubuntu'])
+    update_sources_list(sources_list_dir=sources_list_dir, sources_cache_dir=sources_cache_dir, matcher=matcher)
+
+    loader = SourcesListLoader.create_default(matcher=matcher, sources_cache_dir=sources_cache_dir)
+    view_keys, rosdep_defs = loader.get_compiled_view()
+    assert view_keys == urls
+    # compiled without reading any source
+    assert not [s for s in loader.sources if s._rosdep_data is not None]
+    # first one wins
+    assert rosdep_defs['shared'].data == {'ubuntu': ['from0']}
+    assert rosdep_defs['shared'].origin == urls[0]
+    assert rosdep_defs['key2'].origin == urls[2]
+
+    expected = RosdepView('expected')
+    for source in loader.sources:
+        expected.merge(RosdepDatabaseEntry(source.rosdep_data or {}, [], source.url))
+    assert sorted(expected.keys()) == sorted(rosdep_defs.keys())
+
+    # other tags are not compiled
+    loader2 = SourcesListLoader.create_default(matcher=DataSourceMatcher(['debian']), sources_cache_dir=sources_cache_dir)
+    assert loader2.get_compiled_view() is None
+
+    # lookup uses compiled view
+    loader = SourcesListLoader.create_default(matcher=matcher, sources_cache_dir=sources_cache_dir)
+    rospack, rosstack = rospkg.RosPack(ros_paths=[]), rospkg.RosStack(ros_paths=[])
+    lookup = RosdepLookup.create_from_rospkg(rospack=rospack, rosstack=rosstack, sources_loader=loader)
+    view = lookup.get_rosdep_view('*default*')
+    assert view.lookup('shared').origin == urls[0]
+    assert not [s for s in loader.sources if s._rosdep_data is not None]
+
+    # stale once a cache file changes
+    write_cache_file(sources_cache_dir, urls[1], {'new': {}})
+    assert load_compiled_view(sources_cache_dir, matcher.tags, loader.sources) is None
+
+def test_key_index():
+    from rosdep2.sources_list import update_sources_list, SourcesListLoader, DataSourceMatcher, \
+         write_cache_file
+    from rosdep2.lookup import RosdepLookup
+    tempdir = tempfile.mkdtemp()
+    sources_list_dir, urls = create_local_sources_list(tempdir, count=3)
+    sources_cache_dir = os.path.join(tempdir, 'cache')
+    matcher = DataSourceMatcher(['ubuntu'])
+    update_sources_list(sources_list_dir=sources_list_dir, sources_cache_dir=sources_cache_dir, matcher=matcher)
+
+    loader = SourcesListLoader.create_default(matcher=matcher, sources_cache_dir=sources_cache_dir)
+    key_index = loader.get_key_index()
+    assert len(key_index) == 4
+    assert 'shared' in key_index
+    assert 'fake' not in key_index
+    d = key_index.lookup('shared')
+    assert d.rosdep_key == 'shared'
+    assert d.data == {'ubuntu': ['from0']}
+    assert d.origin == urls[0]
+    assert key_index.lookup('key2').origin == urls[2]
+    try:
+        key_index.lookup('fake')
+        assert False, "should have raised"
+    except KeyError:
+        pass
+    assert key_index.get_views_that_define('shared') == [(url, url) for url in urls[:3]]
+    assert key_index.get_views_that_define('key1') == [(urls[1], urls[1])]
+    assert key_index.get_views_that_define('fake') == []
+    key_index.close()
+
+    # where-defined answers from the index without reading sources
+    rospack, rosstack = rospkg.RosPack(ros_paths=[]), rospkg.RosStack(ros_paths=[])
+    lookup = RosdepLookup.create_from_rospkg(rospack=rospack, rosstack=rosstack, sources_loader=loader)
+    assert sorted(lookup.get_views_that_define('shared')) == sorted([(url, url) for url in urls[:3]])
+    assert lookup.get_views_that_define('key2') == [(urls[2], urls[2])]
+    assert lookup.get_views_that_define('fake') == []
+    assert not [s for s in loader.sources if s._rosdep_data is not None]
+
+    # other tags have no index
+    loader2 = SourcesListLoader.create_default(matcher=DataSourceMatcher(['debian']), sources_cache_dir=sources_cache_dir)
+    assert loader2.get_key_index() is None
+
+    # key count is read from the header
+    from rosdep2.key_index import serialize_key_index, KeyIndex
+    empty_path = os.path.join(tempdir, 'empty-index')
+    with open(empty_path, 'wb') as f:
+        f.write(serialize_key_index({}, 'sig'))
+    empty_index = KeyIndex(empty_path)
+    assert len(empty_index) == 0
+    assert 'shared' not in empty_index
+    empty_index.close()
+
+    # stale once a cache file changes
+    write_cache_file(sources_cache_dir, urls[1], {'new': {}})
+    assert loader.get_key_index() is None
+    # and where-defined falls back to reading the sources
+    loader = SourcesListLoader.create_default(matcher=matcher, sources_cache_dir=sources_cache_dir)
+    lookup = RosdepLookup.create_from_rospkg(rospack=rospack, rosstack=rosstack, sources_loader=loader)
+    assert lookup.get_views_that_define('new') == [(urls[1], urls[1])]
+    assert sorted(lookup.get_views_that_define('shared')) == sorted([(urls[0], urls[0]), (urls[2], urls[2])])
+
 def test_DataSourceMatcher():
     empty_data_source = rosdep2.sources_list.DataSource('yaml', 'http://fake/url', [])
     assert empty_data_source == rosdep2.sources_list.DataSource('yaml', 'http://fake/url', [])
@@ -266,6 +567,44 @@ def test_DataSourceMatcher():
     matcher = rosdep2.sources_list.DataSourceMatcher(['tag1'])
     assert not matcher.matches(data_source)
 
+def test_fetch_rosdep_data_stream():
+    from rosdep2 import DownloadFailure
+    from rosdep2.sources_list import fetch_rosdep_data
+    tempdir = tempfile.mkdtemp()
+    path = os.path.join(tempdir, 'big.yaml')
+    with open(path, 'w') as f:
+        f.write(yaml.safe_dump(dict([('key%d'%(i), {'ubuntu': ['pkg%d'%(i)]}) for i in range(200)])))
+    with open(path, 'rb') as f:
+        text = f.read()
+    url = 'file://' + path
+
+    progress = []
+    with patch('rosdep2.sources_list.DOWNLOAD_CHUNK_SIZE', 1024):
+        with patch('rosdep2.sources_list.DOWNLOAD_PROGRESS_INTERVAL', 0):
+            data, validators = fetch_rosdep_data(url, progress_handler=lambda bytes_read, rate: progress.append(bytes_read))
+    assert len(data) == 200
+    assert data['key42'] == {'ubuntu': ['pkg42']}
+    assert validators['sha1'] == hashlib.sha1(text).hexdigest()
+    # reported in chunks as the data was parsed
+    assert len(progress) > 1
+    assert progress == sorted(progress)
+    assert progress[-1] == len(text)
+    assert len(set(progress)) == len(progress)
+
+    # throttled, but the end of the download is always reported
+    progress = []
+    with patch('rosdep2.sources_list.DOWNLOAD_CHUNK_SIZE', 1024):
+        with patch('rosdep2.sources_list.DOWNLOAD_PROGRESS_INTERVAL', 3600):
+            fetch_rosdep_data(url, progress_handler=lambda bytes_read, rate: progress.append(bytes_read))
+    assert progress == [len(text)]
+
+    try:
+        fetch_rosdep_data(url, max_size=len(text) - 1)
+        assert False, "should have raised"
+    except DownloadFailure as e:
+        assert 'maximum size' in str(e)
+    assert fetch_rosdep_data(url, max_size=len(text))[0] == data
+
 def test_download_rosdep_data():
     from rosdep2.sources_list import download_rosdep_data
     from rosdep2 import DownloadFailure